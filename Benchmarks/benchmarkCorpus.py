@@ -0,0 +1,163 @@
+import argparse  # command line options
+import hashlib  # corpus fingerprint
+import os
+import random
+import sys
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+repoDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+scrapingDirectory = os.path.join(repoDirectory, 'Web Scraping', 'Data')
+if scrapingDirectory not in sys.path:
+    sys.path.insert(0, scrapingDirectory)
+
+from pageStore import PageStore  # the corpus is just a page store, same file a real scrape leaves behind
+from recordParser import extractParams, newColumnNames
+
+# reactions with raw NIST names and parameters, what synthetic pages get filled with
+defaultSourceTable = os.path.join(repoDirectory, 'Backup Data', 'Outdated', 'IUPAC Conversion Test.csv')
+standInNistPrefix = 'http://kinetics.nist.gov/kinetics/Detail?id=' # stand-in pages are addressed by RecordID
+activationEnergyUnits = ['J/mole', 'kJ/mole', 'cal/mole', 'kcal/mole', 'K']
+
+# what a record page has around the parts the parser cares about (navigation, the reference table, footer), so the
+# regexes have about as much page to get through as on the real site; repeated to ~30 kB
+pageFiller = '''<tr><td class="nav"><a href="/kinetics/ReactionSearch">Reaction Search</a> | <a href="/kinetics/SearchForm">Search Form</a>
+| <a href="/kinetics/help.jsp">Help</a></td><td align="right"><font size="-1">Squib: {squib}, Reference type: Journal article,
+Category: Experiment, Data type: Absolute value measured directly, Pressure dependence: None reported</font></td></tr>
+<tr><td colspan="2"><table border="0" cellpadding="2"><tr><th>Field</th><th>Value</th><th>Units</th></tr>
+<tr><td>Bath gas</td><td>He</td><td>&nbsp;</td></tr><tr><td>Pressure</td><td>1.33 - 13.3</td><td>kPa</td></tr>
+<tr><td>Excitation technique</td><td>Flash photolysis (laser or conventional)</td><td>&nbsp;</td></tr>
+<tr><td>Analytical technique</td><td>Resonance fluorescence</td><td>&nbsp;</td></tr></table></td></tr>
+'''
+
+
+def syntheticRecordPage(recordID: int, reactants: List[str], products: List[str], coeff: float, power: int,
+                        activEnergy: float, units: str, tempRatioExp: Optional[float], temperature: float,
+                        temperatureMax: Optional[float], reactionOrder: int, fillerRepeats: int = 20) -> str:
+    """
+    A record page laid out like kinetics.nist.gov's, enough for recordParser to pull every field back out
+
+    Returns:
+        str: the page HTML
+    """
+    # the source names are page text already ('(&middot)' and all), so they go in as they are
+    reactionHTML = ' &plus; '.join(reactant for reactant in reactants if reactant) + ' → ' + \
+        ' &plus; '.join(product for product in products if product)
+    rateExpression = f"{coeff:.2f} x 10<sup>{power}</sup> [cm<sup>3</sup>/molecule s]"
+    if tempRatioExp is not None:
+        rateExpression += f" (T/298 K)<sup>{tempRatioExp:g}</sup>"
+    rateExpression += f" e<sup>{int(round(activEnergy))} [{units}]/RT</sup>"
+    temperatureText = f"{temperature:g} - {temperatureMax:g} K" if temperatureMax else f"{temperature:g} K"
+    filler = pageFiller.format(squib=f"{recordID}BEN/CH{recordID % 997}") * fillerRepeats
+    return (f"<html><head><title>NIST Chemical Kinetics Database record {recordID}</title></head><body><table>{filler}"
+            f"<tr><td><B>Reaction:</B>&nbsp;&nbsp;{reactionHTML}<BR>\n"
+            f"<B>Reaction Order:</B>&nbsp;{reactionOrder}<BR>\n"
+            f"<B>Temperature:</B>&nbsp;{temperatureText}<BR>\n"
+            f"<B>Rate expression:</B>&nbsp;k(T) = {rateExpression}<BR></td></tr>{filler}</table></body></html>")
+
+
+def synthesizeCorpus(corpusPath: str, size: int, sourceTablePath: str = defaultSourceTable, seed: int = 0) -> int:
+    """
+    Builds a corpus of size synthetic record pages from a table of real NIST reactions (cycled if size is bigger)
+
+    The kinetic parameters come from the table where it has them, everything else (units, n, temperatures, order)
+    is drawn from a seeded generator, so the same arguments always give the same corpus.
+
+    Returns:
+        int: pages written
+    """
+    sourceTable = pd.read_csv(sourceTablePath, dtype=str).fillna('')
+    generator = random.Random(seed)
+    with PageStore(corpusPath) as corpus:
+        for recordID in range(1, size + 1):
+            row = sourceTable.iloc[(recordID - 1) % len(sourceTable)]
+            coeff = pd.to_numeric(row.get('Pre-Exp Factor Coeff', ''), errors='coerce')
+            power = pd.to_numeric(row.get('Pre-Exp Factor Power', ''), errors='coerce')
+            activEnergy = pd.to_numeric(row.get('Activation Energy', ''), errors='coerce')
+            temperature = generator.choice([200, 250, 298, 300, 400, 500])
+            pageHTML = syntheticRecordPage(
+                recordID,
+                [row.get(f'Reactant {slot}', '') for slot in (1, 2, 3)],
+                [row.get(f'Product {slot}', '') for slot in (1, 2, 3)],
+                coeff if pd.notna(coeff) else generator.uniform(1, 9.99),
+                int(power) if pd.notna(power) else generator.randint(-14, 16),
+                activEnergy if pd.notna(activEnergy) else -generator.uniform(0, 200000),
+                generator.choice(activationEnergyUnits),
+                generator.choice([None, round(generator.uniform(-3, 3), 2)]),
+                temperature,
+                generator.choice([None, temperature + generator.choice([200, 500, 1000])]),
+                generator.choice([1, 2, 2, 2, 3]))
+            corpus.put(recordID, f"{standInNistPrefix}{recordID}", pageHTML)
+    return size
+
+
+def recordCorpus(pageStorePath: str, corpusPath: str, sampleSize: Optional[int] = None, seed: int = 0) -> int:
+    """
+    Copies (a seeded sample of) the pages a real scrape stored into a benchmark corpus, urls and all
+
+    Returns:
+        int: pages copied
+    """
+    with PageStore(pageStorePath) as pageStore:
+        recordIDs = [row[0] for row in pageStore.connection.execute('SELECT recordID FROM pages')]
+        if sampleSize is not None and sampleSize < len(recordIDs):
+            recordIDs = random.Random(seed).sample(sorted(recordIDs), sampleSize)
+        sampledIDs = set(recordIDs)
+        with PageStore(corpusPath) as corpus:
+            for recordID, url, pageHTML in pageStore.iterPages():
+                if recordID in sampledIDs:
+                    corpus.put(recordID, url, pageHTML)
+    return len(recordIDs)
+
+
+def loadCorpus(corpusPath: str) -> Dict[str, tuple]:
+    """
+    Every page of a corpus in memory, RecordID -> (url, page HTML)
+    """
+    if not os.path.exists(corpusPath):
+        raise FileNotFoundError(f"Corpus {corpusPath} does not exist, make one with benchmarkCorpus.py first.")
+    with PageStore(corpusPath) as corpus:
+        return {recordID: (url, pageHTML) for recordID, url, pageHTML in corpus.iterPages()}
+
+
+def corpusFingerprint(corpusPath: str) -> str:
+    # short hash over every (RecordID, page hash) pair, results are only comparable between runs on the same corpus
+    with PageStore(corpusPath) as corpus:
+        pageHashes = corpus.connection.execute('SELECT recordID, contentHash FROM pages ORDER BY recordID').fetchall()
+    return hashlib.sha256(repr(pageHashes).encode('utf-8')).hexdigest()[:16]
+
+
+def corpusReagents(pages: Dict[str, tuple]) -> List[str]:
+    """
+    Distinct reagent names on the corpus pages, in first-seen order, what the resolver benchmarks look up
+    """
+    reagentFields = [newColumnNames.index(columnName) for columnName in newColumnNames if columnName.startswith(('Reactant', 'Product'))]
+    reagents = {}
+    for url, pageHTML in pages.values():
+        extractedParams = extractParams(pageHTML, verbose=False)
+        for fieldIndex in reagentFields:
+            if extractedParams[fieldIndex] and extractedParams[fieldIndex] != 'Parse Error':
+                reagents.setdefault(extractedParams[fieldIndex], None)
+    return list(reagents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Make the record page corpus the benchmarks and the stand-in server use')
+    parser.add_argument('--output', default='benchmark corpus.sqlite')
+    parser.add_argument('--from-pages', default=None, help='page store of a real scrape to record from')
+    parser.add_argument('--size', type=int, default=2000, help='pages to synthesize, or to sample with --from-pages')
+    parser.add_argument('--source', default=defaultSourceTable, help='reactions the synthetic pages are made of')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        raise FileExistsError(f"{args.output} already exists, pick a new name so results against the old corpus stay comparable")
+    if args.from_pages:
+        pageCount = recordCorpus(args.from_pages, args.output, args.size, args.seed)
+    else:
+        pageCount = synthesizeCorpus(args.output, args.size, args.source, args.seed)
+    print(f"{pageCount} pages written to {args.output}")
+
+if __name__ == '__main__':
+    main()
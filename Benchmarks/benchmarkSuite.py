@@ -0,0 +1,295 @@
+import argparse  # command line options
+import json  # results file, one run per line
+import os
+import platform
+import shutil
+import subprocess  # commit the results belong to
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from typing import Callable, Dict, List
+from urllib.parse import quote
+
+import pandas as pd
+
+benchmarkDirectory = os.path.dirname(os.path.abspath(__file__))
+repoDirectory = os.path.dirname(benchmarkDirectory)
+if repoDirectory not in sys.path:
+    sys.path.insert(0, repoDirectory)
+
+import pipeline  # puts the scraping and cleaning folders on sys.path too
+from benchmarkCorpus import corpusFingerprint, corpusReagents, loadCorpus, synthesizeCorpus
+from standInServer import StandInServer, defaultErrorRate, defaultLatency, parseServiceValues
+from recordParser import extractParams, extractParamsBatch
+
+benchmarkNames = ['parse', 'scrape', 'resolvers', 'pipeline']
+
+
+def bestSeconds(function: Callable[[], object], repeats: int = 3) -> float:
+    # fastest of a few runs, the least noisy number on a shared machine
+    timings = []
+    for _ in range(max(1, repeats)):
+        startTime = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - startTime)
+    return min(timings)
+
+
+@contextmanager
+def quiet():
+    # the scraper and resolvers print per row, which would time the terminal instead of the code
+    with open(os.devnull, 'w') as devNull, redirect_stdout(devNull):
+        yield
+
+
+@contextmanager
+def cirpyPointedAt(apiBase: str):
+    # cirpy reads its endpoint from a module constant, aim it at the stand-in for the duration
+    import cirpy
+    originalBase = cirpy.API_BASE
+    cirpy.API_BASE = apiBase
+    try:
+        yield
+    finally:
+        cirpy.API_BASE = originalBase
+
+
+def runInfo() -> Dict[str, object]:
+    """
+    What the numbers belong to: commit (and whether the tree had uncommitted changes), machine, python
+    """
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=repoDirectory, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ''
+    return {'commit': git('rev-parse', '--short', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'machine': f"{platform.system()} {platform.machine()}", 'cpus': os.cpu_count()}
+
+
+def benchmarkParse(pages: Dict[str, tuple], workerCounts: List[int], repeats: int = 3) -> Dict[str, float]:
+    """
+    extractParams throughput over the corpus, serial and through extractParamsBatch's process pool
+    """
+    pageList = [pageHTML for url, pageHTML in pages.values()]
+    megabytes = sum(len(pageHTML) for pageHTML in pageList) / 1e6
+    serialSeconds = bestSeconds(lambda: [extractParams(pageHTML, verbose=False) for pageHTML in pageList], repeats)
+    parseStats = {'pages': len(pageList), 'MB': round(megabytes, 2),
+                  'serial pages per second': round(len(pageList) / serialSeconds, 1),
+                  'serial MB per second': round(megabytes / serialSeconds, 2)}
+    for workers in workerCounts:
+        batchSeconds = bestSeconds(lambda: list(extractParamsBatch(pageList, workers=workers)), repeats)
+        parseStats[f'{workers} workers pages per second'] = round(len(pageList) / batchSeconds, 1)
+    return parseStats
+
+
+def benchmarkScrape(standIn: StandInServer, recordIDs: List[str], concurrencies: List[int]) -> Dict[str, Dict[str, float]]:
+    """
+    fetchAndExtract through a PoliteFetcher against the stand-in NIST, at each concurrency (per-host limit = concurrency)
+    """
+    from concurrentFetcher import PoliteFetcher
+    from pandasScrape import fetchAndExtract
+    urls = [standIn.nistURL(recordID) for recordID in recordIDs]
+    scrapeStats = {}
+    for concurrency in concurrencies:
+        startTime = time.perf_counter()
+        with quiet(), PoliteFetcher(concurrency=concurrency, perHostLimit=concurrency) as fetcher:
+            extractedRows = list(fetcher.map(lambda indexAndUrl: fetchAndExtract(indexAndUrl[1], indexAndUrl[0], fetcher),
+                                             enumerate(urls)))
+        elapsedSeconds = time.perf_counter() - startTime
+        scrapeStats[f'concurrency {concurrency}'] = {
+            'pages per second': round(len(urls) / elapsedSeconds, 1),
+            'fetch errors': sum(extractedRow[0] == 'Url Fetch Error' for extractedRow in extractedRows),
+            'seconds': round(elapsedSeconds, 3)}
+    return scrapeStats
+
+
+def benchmarkResolvers(standIn: StandInServer, names: List[str], concurrencies: List[int], iupacNames: int = 100) -> Dict[str, object]:
+    """
+    Cactus resolver throughput per concurrency, struct2SMILES link building, and IUPAC2SMILES (OPSIN, then cirpy
+    against the stand-in); a resolver that can't run here (no JVM for OPSIN, say) is recorded as skipped with why
+    """
+    from cactusResolver import resolveCactusLinks
+    resolverStats = {}
+    cactusUrls = [f"{standIn.cactusBase}/{quote(name)}/smiles" for name in names]
+    for concurrency in concurrencies:
+        with quiet():
+            smilesByUrl, cactusStats = resolveCactusLinks(cactusUrls, concurrency=concurrency, perHostLimit=concurrency,
+                                                          progressInterval=len(cactusUrls) + 1)
+        resolverStats[f'cactus concurrency {concurrency}'] = {statName: cactusStats[statName] for statName in
+            ('urls per second', 'found', 'not found (404)', 'errors', 'p50 latency ms', 'p95 latency ms') if statName in cactusStats}
+
+    try:
+        with quiet():
+            smilesProcessing = pipeline.loadScript(os.path.join(pipeline.cleaningDirectory, 'Data', 'SMILES Processing.py'))
+    except Exception as e:
+        resolverStats['struct2SMILES'] = resolverStats['IUPAC2SMILES'] = {'skipped': f"{e.__class__.__name__}: {e}"}
+        return resolverStats
+
+    reagentColumn = pd.Series(names * max(1, 100000 // max(1, len(names))))
+    linkSeconds = bestSeconds(lambda: smilesProcessing.struct2SMILES(reagentColumn))
+    resolverStats['struct2SMILES'] = {'cells per second': round(len(reagentColumn) / linkSeconds, 1)}
+
+    try:
+        startTime = time.perf_counter()
+        with quiet(), cirpyPointedAt(standIn.cactusBase):
+            resolvers = [smilesProcessing.IUPAC2SMILES(name)[0] for name in names[:iupacNames]]
+        elapsedSeconds = time.perf_counter() - startTime
+        resolverStats['IUPAC2SMILES'] = {'names per second': round(len(resolvers) / elapsedSeconds, 1),
+                                         **{f'{resolver} answers': resolvers.count(resolver) for resolver in ('opsin', 'cirpy', 'none')}}
+    except Exception as e:
+        resolverStats['IUPAC2SMILES'] = {'skipped': f"{e.__class__.__name__}: {e}"}
+
+    try:
+        # opsin alone, one name at a time vs opsinBatchResolve, on the same names after a warmup so the JVM start isn't timed
+        from backends import getOpsin
+        from opsinBatch import cleanOpsinResult, opsinBatchResolve
+        opsinObj = getOpsin()
+        with quiet():
+            opsinChunkNames = list(dict.fromkeys(names))
+            [opsinObj.to_smiles_single(name) for name in opsinChunkNames]
+            singleSeconds = bestSeconds(lambda: [cleanOpsinResult(opsinObj.to_smiles_single(name)) for name in opsinChunkNames])
+            batchStats = opsinBatchResolve(opsinChunkNames)[1]
+        resolverStats['opsin'] = {'one at a time names per second': round(len(opsinChunkNames) / singleSeconds, 1),
+                                  'batch names per second': batchStats['names per second']}
+    except Exception as e:
+        resolverStats['opsin'] = {'skipped': f"{e.__class__.__name__}: {e}"}
+    return resolverStats
+
+
+def benchmarkPipeline(standIn: StandInServer, recordIDs: List[str], sizes: List[int], concurrency: int,
+                      includePubchem: bool = False) -> Dict[str, Dict[str, object]]:
+    """
+    Wall time of a fresh pipeline run (scrape -> ... -> review) against the stand-ins, once per dataset size
+
+    Each size gets its own scratch work directory with a 'NIST Records.csv' pointing at the stand-in NIST; 'resolve
+    pubchem' is left out unless includePubchem, it needs Chrome.
+    """
+    pipelineStats = {}
+    for size in sizes:
+        sizeRecordIDs = recordIDs[:size]
+        workDirectory = tempfile.mkdtemp(prefix='pipeline benchmark ')
+        try:
+            # index column first, so the urls are the 4th column like in the original NIST Records.csv
+            pd.DataFrame({'RecordID': sizeRecordIDs, 'RID': sizeRecordIDs,
+                          'Squib': [standIn.nistURL(recordID) for recordID in sizeRecordIDs],
+                          'ReactionOrder': 2}).to_csv(os.path.join(workDirectory, 'NIST Records.csv'))
+            stages = [stage for stage in pipeline.buildNistStages() if includePubchem or stage.name != 'resolve pubchem']
+            options = {'scrape': {'concurrency': concurrency, 'perHostLimit': concurrency},
+                       'resolve cactus': {'concurrency': concurrency, 'perHostLimit': concurrency,
+                                          'baseURL': standIn.cactusBase + '/', 'progressInterval': 10 ** 9},
+                       'resolve pubchem': {'baseURL': standIn.pubchemBase}}
+            startTime = time.perf_counter()
+            with quiet(), cirpyPointedAt(standIn.cactusBase):
+                report = pipeline.runPipeline(stages, workDirectory, options=options, force=True)
+            elapsedSeconds = time.perf_counter() - startTime
+            pipelineStats[f'{len(sizeRecordIDs)} records'] = {
+                'seconds': round(elapsedSeconds, 3),
+                'records per second': round(len(sizeRecordIDs) / elapsedSeconds, 2),
+                'stages': {stageName: {key: stageReport[key] for key in ('status', 'seconds', 'reason') if key in stageReport}
+                           for stageName, stageReport in report.items()}}
+        finally:
+            shutil.rmtree(workDirectory, ignore_errors=True)
+    return pipelineStats
+
+
+def flattenMetrics(results: Dict, prefix: str = '') -> Dict[str, float]:
+    # {'parse': {'serial pages per second': 1.0}} -> {'parse / serial pages per second': 1.0}, numbers only
+    flatMetrics = {}
+    for key, value in results.items():
+        metricName = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flatMetrics.update(flattenMetrics(value, metricName + ' / '))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flatMetrics[metricName] = value
+    return flatMetrics
+
+
+def loadRuns(resultsPath: str) -> List[Dict]:
+    with open(resultsPath, 'r', encoding='utf-8') as resultsFile:
+        return [json.loads(line) for line in resultsFile if line.strip()]
+
+
+def compareRuns(resultsPath: str, baselineCommit: str, candidateCommit: str) -> pd.DataFrame:
+    """
+    Side by side numbers of the latest run of two commits (prefixes are fine), with the candidate/baseline ratio
+
+    Returns:
+        pd.DataFrame: metric, baseline, candidate, ratio; runs on different corpora or settings get a warning
+    """
+    runs = loadRuns(resultsPath)
+    def latestRun(commit):
+        matchingRuns = [run for run in runs if run['info']['commit'].startswith(commit) or commit.startswith(run['info']['commit'])]
+        if not matchingRuns:
+            raise ValueError(f"no benchmark run for commit {commit} in {resultsPath}")
+        return matchingRuns[-1]
+
+    baselineRun, candidateRun = latestRun(baselineCommit), latestRun(candidateCommit)
+    if baselineRun['config'] != candidateRun['config']:
+        print("Warning: the two runs used different corpora or settings, ratios may not mean much")
+    baselineMetrics, candidateMetrics = flattenMetrics(baselineRun['results']), flattenMetrics(candidateRun['results'])
+    comparison = pd.DataFrame({'baseline': pd.Series(baselineMetrics), 'candidate': pd.Series(candidateMetrics)})
+    comparison['ratio'] = (comparison['candidate'] / comparison['baseline']).round(3)
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parsing, scraping, resolvers and the pipeline against local stand-ins')
+    parser.add_argument('--corpus', default='benchmark corpus.sqlite', help='made with benchmarkCorpus.py (synthesized if missing)')
+    parser.add_argument('--only', nargs='+', choices=benchmarkNames, default=benchmarkNames)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='scrape/resolver concurrency levels')
+    parser.add_argument('--workers', type=int, nargs='+', default=None, help='parse worker counts (default: all cpus)')
+    parser.add_argument('--scrape-pages', type=int, default=300, help='pages fetched per concurrency level')
+    parser.add_argument('--resolver-names', type=int, default=300, help='names looked up per concurrency level')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000], help='pipeline dataset sizes (records)')
+    parser.add_argument('--pubchem', action='store_true', help="include 'resolve pubchem' in the pipeline run (needs Chrome)")
+    parser.add_argument('--latency', nargs='*', default=[], help='stand-in latency per service, eg. nist=0.05 cactus=0.1')
+    parser.add_argument('--error-rate', nargs='*', default=[], help='stand-in 503 rate per service, eg. nist=0.02')
+    parser.add_argument('--miss-rate', type=float, default=0.2, help='fraction of names the resolvers 404 on')
+    parser.add_argument('--results', default='benchmark results.jsonl', help='every run gets appended here')
+    parser.add_argument('--label', default='', help='free text stored with the run')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'), help='compare two commits already in --results')
+    args = parser.parse_args()
+
+    if args.compare:
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(compareRuns(args.results, *args.compare))
+        return
+
+    if not os.path.exists(args.corpus):
+        print(f"No corpus at {args.corpus}, synthesizing 2000 pages (seed 0)")
+        synthesizeCorpus(args.corpus, 2000)
+    latency = parseServiceValues(args.latency, defaultLatency)
+    errorRate = parseServiceValues(args.error_rate, defaultErrorRate)
+    config = {'corpus': corpusFingerprint(args.corpus), 'latency': latency, 'error rate': errorRate, 'miss rate': args.miss_rate,
+              'concurrency': args.concurrency, 'scrape pages': args.scrape_pages, 'resolver names': args.resolver_names,
+              'sizes': args.sizes}
+
+    pages = loadCorpus(args.corpus)
+    recordIDs = list(pages)
+    results = {}
+    if 'parse' in args.only:
+        results['parse'] = benchmarkParse(pages, args.workers or [os.cpu_count() or 1])
+        print(f"parse: {results['parse']}")
+
+    with StandInServer(args.corpus, latency, errorRate, missRate=args.miss_rate) as standIn:
+        if 'scrape' in args.only:
+            results['scrape'] = benchmarkScrape(standIn, recordIDs[:args.scrape_pages], args.concurrency)
+            print(f"scrape: {results['scrape']}")
+        if 'resolvers' in args.only:
+            results['resolvers'] = benchmarkResolvers(standIn, corpusReagents(pages)[:args.resolver_names], args.concurrency)
+            print(f"resolvers: {results['resolvers']}")
+        if 'pipeline' in args.only:
+            results['pipeline'] = benchmarkPipeline(standIn, recordIDs, args.sizes, max(args.concurrency), args.pubchem)
+            print(f"pipeline: {json.dumps(results['pipeline'])}")
+        results['stand-in'] = standIn.counters()
+
+    run = {'info': {**runInfo(), 'label': args.label}, 'config': config, 'results': results}
+    with open(args.results, 'a', encoding='utf-8') as resultsFile:
+        resultsFile.write(json.dumps(run) + '\n')
+    print(f"Run for commit {run['info']['commit']}{' (dirty)' if run['info']['dirty'] else ''} appended to {args.results}")
+
+if __name__ == '__main__':
+    main()
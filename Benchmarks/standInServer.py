@@ -0,0 +1,224 @@
+import argparse  # command line options
+import hashlib  # stable hit/miss per name
+import http.server
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape, quoteattr
+
+from benchmarkCorpus import loadCorpus
+
+services = ('nist', 'cactus', 'pubchem')
+defaultLatency = {'nist': 0.05, 'cactus': 0.08, 'pubchem': 0.3} # seconds, roughly what the real sites take per request
+defaultErrorRate = {'nist': 0.0, 'cactus': 0.0, 'pubchem': 0.0}
+
+
+def standInSMILES(name: str, missRate: float) -> Optional[str]:
+    """
+    Made-up but stable answer for a name: the same name always hits or misses, in every run and process
+
+    Returns:
+        Optional[str]: a small carbon chain SMILES, None for roughly missRate of names
+    """
+    nameDigest = hashlib.blake2b(name.encode('utf-8'), digest_size=4).digest()
+    nameNumber = int.from_bytes(nameDigest, 'little')
+    if (nameNumber % 10000) / 10000 < missRate:
+        return None
+    return 'C' * (1 + nameNumber % 6) + ('O' if nameNumber & 1 else '')
+
+
+class ServiceHandler(http.server.BaseHTTPRequestHandler):
+    """
+    One request to a stand-in service; which one is set on the server (server.service)
+    """
+
+    protocol_version = 'HTTP/1.1' # keep-alive, like the real hosts, so pooled sessions reuse connections
+    disable_nagle_algorithm = True # headers and body go out in separate writes, Nagle would hold the body ~40 ms
+
+    def do_GET(self):
+        standIn = self.server.standIn
+        service = self.server.service
+        standIn.delay(service)
+        if standIn.injectError(service):
+            self.reply(503, b'stand-in error\n', 'text/plain')
+            return
+
+        path = urlsplit(self.path)
+        if service == 'nist':
+            recordID = standIn.recordOfPageID.get(parse_qs(path.query).get('id', [''])[0])
+            if recordID is None:
+                self.reply(404, b'<html><body>No such record</body></html>', 'text/html')
+                return
+            pageBytes = standIn.pages[recordID][1].encode('utf-8')
+            validatorHeaders = {}
+            if standIn.nistValidators:
+                validatorHeaders['ETag'] = '"' + hashlib.blake2b(pageBytes, digest_size=8).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == validatorHeaders['ETag']:
+                    self.reply(304, b'', None, validatorHeaders)
+                    return
+            self.reply(200, pageBytes, 'text/html; charset=utf-8', validatorHeaders)
+        elif service == 'cactus':
+            # /chemical/structure/<name>/smiles for the resolver, /<name>/smiles/xml for cirpy
+            pathParts = path.path.split('/chemical/structure/', 1)[-1].split('/')
+            name, wantsXML = unquote(pathParts[0]), pathParts[-1] == 'xml'
+            smiles = standInSMILES(name, standIn.missRate)
+            if smiles is None:
+                self.reply(404, b'<h1>Page not found (404)</h1>', 'text/html')
+            elif wantsXML:
+                self.reply(200, (f'<request string={quoteattr(name)} representation="smiles"><data id="1" resolver="name_by_opsin" '
+                                 f'notation={quoteattr(name)} string_class="chemical name"><item id="1">{escape(smiles)}</item>'
+                                 f'</data></request>').encode('utf-8'), 'text/xml')
+            else:
+                self.reply(200, f"{smiles}\n".encode('utf-8'), 'text/plain')
+        else:
+            name = unquote(path.path.split('/compound/', 1)[-1])
+            smiles = standInSMILES(name, standIn.missRate)
+            if smiles is None:
+                self.reply(404, b'<html><head><title>404 Not Found</title></head><body></body></html>', 'text/html')
+            else:
+                self.reply(200, (f"<html><head><title>{escape(name)} | PubChem</title></head><body><section>SMILES"
+                                 f"<div class='break-words space-y-1'>{escape(smiles)}</div></section></body></html>").encode('utf-8'),
+                           'text/html')
+
+    def reply(self, status: int, body: bytes, contentType: Optional[str], extraHeaders: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        if contentType:
+            self.send_header('Content-Type', contentType)
+        for headerName, headerValue in (extraHeaders or {}).items():
+            self.send_header(headerName, headerValue)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass # thousands of requests per run, the counters say enough
+
+
+class StandInServer:
+    """
+    Local NIST, Cactus and PubChem stand-ins, one port each so per-host limits behave like against the real hosts
+
+    NIST serves the corpus pages by their url's id= parameter, Cactus answers '/<name>/smiles' (plain text) and
+    '/<name>/smiles/xml' (cirpy), PubChem serves a compound page with the SMILES section pubchemFarm waits for.
+    Every request sleeps for the service's latency (+- jitter) and fails with a 503 at the service's error rate,
+    all drawn from one seeded generator. NIST pages carry an ETag and answer a matching If-None-Match with a 304,
+    unless nistValidators is off (then a sync has to fall back on content hashes).
+
+    Args:
+        corpusPath (Optional[str]): page corpus from benchmarkCorpus.py, NIST isn't served without one
+        latency (Dict[str, float]): seconds per request for 'nist', 'cactus', 'pubchem'
+        errorRate (Dict[str, float]): fraction of requests answered with 503
+        jitter (float): latency is drawn uniformly from latency * (1 +- jitter)
+        missRate (float): fraction of names Cactus/PubChem don't know (404)
+        seed (int): generator seed
+        nistValidators (bool): send ETags and honour If-None-Match on NIST pages
+    """
+
+    def __init__(self, corpusPath: Optional[str] = None, latency: Optional[Dict[str, float]] = None,
+                 errorRate: Optional[Dict[str, float]] = None, jitter: float = 0.5, missRate: float = 0.2, seed: int = 0,
+                 nistValidators: bool = True):
+        self.pages = loadCorpus(corpusPath) if corpusPath else {}
+        self.recordOfPageID = {parse_qs(urlsplit(url).query).get('id', [recordID])[0]: recordID
+                               for recordID, (url, pageHTML) in self.pages.items()}
+        self.latency = {**defaultLatency, **(latency or {})}
+        self.errorRate = {**defaultErrorRate, **(errorRate or {})}
+        self.jitter = jitter
+        self.missRate = missRate
+        self.nistValidators = nistValidators
+        self.generator = random.Random(seed)
+        self.generatorLock = threading.Lock()
+        self.requestCounts = {service: 0 for service in services}
+        self.errorCounts = {service: 0 for service in services}
+        self.servers = {}
+
+    def delay(self, service: str) -> None:
+        with self.generatorLock:
+            self.requestCounts[service] += 1
+            sleepSeconds = self.latency[service] * (1 + self.jitter * self.generator.uniform(-1, 1))
+        if sleepSeconds > 0:
+            time.sleep(sleepSeconds)
+
+    def injectError(self, service: str) -> bool:
+        with self.generatorLock:
+            failed = self.generator.random() < self.errorRate[service]
+            self.errorCounts[service] += failed
+        return failed
+
+    def start(self, host: str = '127.0.0.1', ports: Optional[Dict[str, int]] = None) -> 'StandInServer':
+        for service in services:
+            server = http.server.ThreadingHTTPServer((host, (ports or {}).get(service, 0)), ServiceHandler)
+            server.daemon_threads = True
+            server.standIn, server.service = self, service
+            threading.Thread(target=server.serve_forever, name=f"stand-in {service}", daemon=True).start()
+            self.servers[service] = server
+        return self
+
+    def stop(self) -> None:
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+        self.servers = {}
+
+    def __enter__(self):
+        return self.start() if not self.servers else self
+
+    def __exit__(self, *excInfo):
+        self.stop()
+
+    def baseURL(self, service: str) -> str:
+        host, port = self.servers[service].server_address[:2]
+        return f"http://{host}:{port}"
+
+    def nistURL(self, recordID: str) -> str:
+        pageURL = self.pages[recordID][0]
+        return f"{self.baseURL('nist')}/kinetics/Detail?{urlsplit(pageURL).query}"
+
+    @property
+    def cactusBase(self) -> str:
+        # what cactusResolver/cirpy put names after (cirpy.API_BASE has no trailing slash)
+        return f"{self.baseURL('cactus')}/chemical/structure"
+
+    @property
+    def pubchemBase(self) -> str:
+        return f"{self.baseURL('pubchem')}/compound/"
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        with self.generatorLock:
+            return {'requests': dict(self.requestCounts), 'injected errors': dict(self.errorCounts)}
+
+
+def parseServiceValues(pairs, defaults: Dict[str, float]) -> Dict[str, float]:
+    # ['nist=0.05', 'cactus=0.1'] -> {'nist': 0.05, 'cactus': 0.1, 'pubchem': default}
+    values = dict(defaults)
+    for pair in pairs or []:
+        service, _, value = pair.partition('=')
+        if service not in services:
+            raise ValueError(f"unknown service {service!r}, expected one of {services}")
+        values[service] = float(value)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve local NIST/Cactus/PubChem stand-ins until interrupted')
+    parser.add_argument('--corpus', default='benchmark corpus.sqlite')
+    parser.add_argument('--latency', nargs='*', default=[], help="eg. nist=0.05 cactus=0.1 (seconds)")
+    parser.add_argument('--error-rate', nargs='*', default=[], help='eg. nist=0.02 (fraction of 503s)')
+    parser.add_argument('--miss-rate', type=float, default=0.2)
+    parser.add_argument('--port', type=int, default=8800, help='nist gets this port, cactus +1, pubchem +2')
+    args = parser.parse_args()
+
+    standIn = StandInServer(args.corpus, parseServiceValues(args.latency, defaultLatency),
+                            parseServiceValues(args.error_rate, defaultErrorRate), missRate=args.miss_rate)
+    standIn.start(ports={service: args.port + offset for offset, service in enumerate(services)})
+    print(f"NIST {standIn.baseURL('nist')}/kinetics/Detail?id=..., Cactus {standIn.cactusBase}/, PubChem {standIn.pubchemBase}")
+    try:
+        while True:
+            time.sleep(60)
+            print(standIn.counters())
+    except KeyboardInterrupt:
+        standIn.stop()
+
+if __name__ == '__main__':
+    main()
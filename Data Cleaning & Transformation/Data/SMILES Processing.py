@@ -1,163 +1,262 @@
 import pandas
-import requests
-import regex
 import os
+import sys
 from typing import List, Dict, Optional, Tuple, Any, Union # allows specification of datatype 
 from urllib.parse import quote
 
-import cirpy
-from pyopsin import PyOpsin as opsin
-
-# allows access to live/dynamic HTML after pubchem page filled by Java (requests gets 'stale' HTML)
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import WebDriverException, TimeoutException, NoSuchElementException
-
 import time
+import argparse  # command line options
+from concurrent.futures import Executor  # the opsin pool shared across chunks
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # shared modules live one folder up
+# OPSIN (a JVM), cirpy and the Chrome WebDriver start on first use, not on import, see backends.py
+from backends import getCirpy, getOpsin
+from resolutionCache import ResolutionCache, resolveUniqueNames
+from opsinBatch import cleanOpsinResult, opsinBatchResolve, opsinPool
+from reagentClassifier import EMPTY, IUPAC, STRUCTURAL, classifyReagents, reagentColumns
+from instrumentation import metrics
+from tableStore import TableAppender, iterTable
 
-# # sets up Selenium, this is all Chat idk, it just works lol
-# myOptions = Options()
-# # myOptions.add_argument("--headless") # I want to see it go to the page right now
-# myOptions.add_argument("--no-sandbox")
-# myOptions.add_argument("--disable-dev-shm-usage")
-# myOptions.add_argument("--disable-gpu")
-# myOptions.add_argument("--disable-extensions")
+conversionStats = {'attempted': 0, 'successful': 0, 'failed': 0} # dictionary I increment
+opsinStats = {'names': 0, 'seconds': 0.0, 'names per second': 0.0}
+resolutionStats = {'unique names': 0, 'cache hits': 0, 'resolver lookups': 0}
 
-# # Network and automation options
-# myOptions.add_argument("--remote-debugging-port=9222")
-# myOptions.add_argument("--disable-background-networking")
-# myOptions.add_argument("--disable-background-timer-throttling")
-# myOptions.add_argument("--disable-renderer-backgrounding")
-# myOptions.add_argument("--disable-backgrounding-occluded-windows")
-# myOptions.add_argument("--remote-allow-origins=*")
+def IUPAC2SMILES(reagentParam: str) -> Tuple[str, Optional[str]]:
+    """
+    converts one reagent in IUPAC form to SMILES, opsin first and cirpy as a fallback
+    (the one-at-a-time path, resolveMissingNames does the same thing in bulk)
 
-# driver = webdriver.Chrome(options=myOptions)
+    Returns:
+        Tuple with:
+        - resolver (str): 'opsin' or 'cirpy' for whichever answered, 'none' if neither could
+        - smiles (Optional[str]): None if it couldn't be converted
+    """
+    try:
+        with metrics.timer('resolver/opsin'):
+            smiles = cleanOpsinResult(getOpsin().to_smiles_single(reagentParam))
+    except Exception as e:
+        metrics.count('resolver/opsin/errors')
+        smiles = None
+    metrics.resolverResult('opsin', smiles != None)
+    if smiles != None:
+        return 'opsin', smiles
+    # try cirpy as a fallback
+    try:
+        with metrics.timer('resolver/cirpy'):
+            smiles = getCirpy().resolve(reagentParam, 'smiles')
+    except Exception as e:
+        metrics.count('resolver/cirpy/errors')
+        return 'none', None
+    metrics.resolverResult('cirpy', smiles != None)
+    if smiles!= None:
+        return 'cirpy', smiles
+    return 'none', None
 
-conversionStats = {'attempted': 0, 'successful': 0, 'failed': 0} # dictionary I increment
+def resolveMissingNames(reagentNames: List[str], opsinExecutor: Optional[Executor] = None) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    same answers as IUPAC2SMILES over every name the cache didn't know, but opsin gets all of them in big chunks
+    across a process pool (opsinExecutor if one is open already); only what opsin can't parse goes to cirpy, one
+    network call each. names where cirpy throws (network trouble) are left out so they aren't cached
+    """
+    global opsinStats
+    opsinResults, opsinStats = opsinBatchResolve(reagentNames, executor=opsinExecutor)
 
-rawDataframe = pandas.read_csv('Filtered NIST Extracted.csv')
-processedDataframe = rawDataframe.copy()
-cactusDataframe = rawDataframe.copy()
-pubchemDataframe = rawDataframe.copy()
-manualProcessingDataframe = rawDataframe.copy()
+    results = {}
+    for reagent in reagentNames:
+        if opsinResults.get(reagent) is not None:
+            results[reagent] = ('opsin', opsinResults[reagent])
+            continue
+        # try cirpy as a fallback
+        cirpyStart = time.perf_counter()
+        try:
+            smiles = getCirpy().resolve(reagent, 'smiles')
+        except Exception as e:
+            metrics.count('resolver/cirpy/errors')
+            continue
+        finally:
+            metrics.observeLatency('resolver/cirpy', time.perf_counter() - cirpyStart)
+        metrics.resolverResult('cirpy', smiles != None)
+        results[reagent] = ('cirpy', smiles) if smiles != None else ('none', None)
+    return results
 
-opsinObj = opsin()
+def struct2SMILES(reagents: pandas.Series) -> Tuple[pandas.Series, pandas.Series]:
+    """
+    turns a column of structural formulas into cactus.gov/reagent/smiles and pubchem/compound/reagent links
 
-def IUPAC2SMILES(reagentParam: str, rowIndexParam: int, columnNameParam: str) -> Optional[bool]:
+    Returns:
+        Tuple with:
+        - cactusLinks (pandas.Series): cactus url per cell, same index as reagents
+        - pubchemLinks (pandas.Series): pubchem url per cell, same index as reagents
     """
-    converts reagents in IUPAC form to SMILES, then replaces corresponding entry in csv
+    quotedReagents = reagents.astype(str).map(quote) # an all-empty column reads in as float64, no str to add to
+    cactusLinks = "https://cactus.nci.nih.gov/chemical/structure/" + quotedReagents + "/smiles"
+    pubchemLinks = "https://pubchem.ncbi.nlm.nih.gov/compound/" + quotedReagents
+    return cactusLinks, pubchemLinks
 
-    useful rows save to 
+columns2process = reagentColumns
+
+def processReagents(rawDataframe: pandas.DataFrame, cachePath: str = 'resolution cache.sqlite',
+                     resolutionCache: Optional[ResolutionCache] = None,
+                     opsinExecutor: Optional[Executor] = None) -> Dict[str, pandas.DataFrame]:
     """
-    global processedDataframe, manualProcessingDataframe, conversionStats
-    try:
-        smiles = opsinObj.to_smiles(reagentParam)
-        if smiles != None:
-            conversionStats['successful'] += 1
-            processedDataframe.at[rowIndexParam, columnNameParam] = smiles
-            return True
-        # try cirpy as a fallback
-        smiles = cirpy.resolve(reagentParam, 'smiles')
-        if smiles!= None:
-            conversionStats['successful'] += 1
-            processedDataframe.at[rowIndexParam, columnNameParam] = smiles
-            return True
-        conversionStats['failed'] += 1
-        return False
-    except Exception as e:
-        conversionStats['failed'] += 1
-        return False
+    routes every row of the filtered NIST extract: IUPAC names get resolved to SMILES, structural formulas become
+    cactus/pubchem links, and each row lands in processed, unprocessed, cactus and/or pubchem
 
-def struct2SMILES(reagentParam: str, rowIndexParam: int, columnNameParam: str):
-    global cactusDataframe, pubchemDataframe
-    # replaces entry with cactus.gov/reagentParam/smiles and pubchem/compound/reagent in two different pandas dataframes
-    cactusLink = "https://cactus.nci.nih.gov/chemical/structure/" + quote(reagentParam) + "/smiles"
-    cactusDataframe.at[rowIndexParam, columnNameParam] = cactusLink
+    every output row keeps its index label from rawDataframe, so the pipeline can match outputs back to inputs.
+    each output is only its own rows taken out of rawDataframe, there's no full copy per output
 
-    pubchemLink = "https://pubchem.ncbi.nlm.nih.gov/compound/" + quote(reagentParam)
-    pubchemDataframe.at[rowIndexParam, columnNameParam] = pubchemLink
+    Args:
+        rawDataframe (pandas.DataFrame): filtered NIST extract
+        cachePath (str): persistent name -> SMILES resolution cache
+        resolutionCache (Optional[ResolutionCache]): an already open cache, cachePath is ignored if given
+        opsinExecutor (Optional[Executor]): an already open opsin pool, a fresh one per call if None
 
-    return
+    Returns:
+        Dict[str, pandas.DataFrame]: 'processed', 'unprocessed', 'cactus' and 'pubchem' tables
+    """
+    global resolutionStats
 
-relevantRows: list = []
-for rowIndex, rowContents in rawDataframe.iterrows():
-    columns2process = ['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3']
-    relevantRowBool = False
+    # every cell classified once: empty / no-letters / IUPAC / structural, both routes below read from this
+    metrics.rows('smiles', len(rawDataframe))
+    with metrics.timer('smiles/classify'):
+        reagentCategories = classifyReagents(rawDataframe, columns2process)
+    isStructural = reagentCategories == STRUCTURAL
+    isIUPAC = reagentCategories == IUPAC
+    conversionStats['attempted'] += int((reagentCategories != EMPTY).to_numpy().sum())
 
+    # structural formulas -> cactus/pubchem link tables, only rows that have at least one
+    relevantRowMask = isStructural.any(axis=1)
+    cactusDataframe = rawDataframe.loc[relevantRowMask].copy()
+    pubchemDataframe = rawDataframe.loc[relevantRowMask].copy()
     for columnName in columns2process:
-        reagent = str(rowContents[columnName])
-
-        if not isinstance(reagent, str) or reagent.strip() == '': # skip if nothing there
-            continue # onto next cell to the right
-        
-        letters = regex.findall(r'[A-Za-z]', reagent)
-        lowercaseLetters = regex.findall(r'[a-z]', reagent)
-        # simple, IUPAC names (eg. 2-methylpentante) have mostly lowercase letters, 
-        # structural formulas have at most 1/2 lowercase letters (eg. AlBr)
-        # so that's how I sort them
-        conversionStats['attempted'] += 1
-
-        if len(letters) == 0:
-            continue
-        ratio = len(lowercaseLetters) / len(letters)
-        
-        if ratio < 0.5:
-            struct2SMILES(reagent, rowIndex, columnName)
-            relevantRowBool = True
-            continue
+        # object columns take the links whatever read_csv made of them (an all-empty column is float64)
+        cactusDataframe[columnName] = cactusDataframe[columnName].astype(object)
+        pubchemDataframe[columnName] = pubchemDataframe[columnName].astype(object)
+        structuralCells = isStructural.loc[relevantRowMask, columnName]
+        cactusLinks, pubchemLinks = struct2SMILES(cactusDataframe.loc[structuralCells, columnName])
+        cactusDataframe.loc[structuralCells, columnName] = cactusLinks
+        pubchemDataframe.loc[structuralCells, columnName] = pubchemLinks
+
+    # the same few hundred names (OH, H, O2, CH4...) show up thousands of times, so every IUPAC-looking name
+    # gets resolved once (cache first, then opsin/cirpy) and the answers get mapped back onto the cells afterwards
+    iupacCells = rawDataframe[columns2process].to_numpy(dtype=object)[isIUPAC.to_numpy()]
+    iupacCellCount = len(iupacCells)
+    uniqueIUPACNames = list(pandas.unique(iupacCells))
+
+    resolveMissing = lambda reagentNames: resolveMissingNames(reagentNames, opsinExecutor)
+    with metrics.timer('smiles/resolve names'):
+        if resolutionCache is not None:
+            resolvedNames, resolutionStats = resolveUniqueNames(uniqueIUPACNames, resolveMissing, resolutionCache)
         else:
-            break
-    if relevantRowBool:
-        relevantRows.append(rowIndex)
+            with ResolutionCache(cachePath) as resolutionCache:
+                resolvedNames, resolutionStats = resolveUniqueNames(uniqueIUPACNames, resolveMissing, resolutionCache)
+    resolutionStats['cache hit rate'] = round(resolutionStats['cache hits'] / max(1, resolutionStats['unique names']), 3)
+    resolutionStats['saved lookups'] = iupacCellCount - resolutionStats['resolver lookups']
 
-pubchemDataframe = pubchemDataframe.loc[relevantRows]
-cactusDataframe = cactusDataframe.loc[relevantRows]
+    # SMILES for every IUPAC cell that resolved, NaN everywhere else
+    resolvedSmiles = rawDataframe[columns2process].where(isIUPAC).apply(lambda column: column.map(resolvedNames))
+    failedIUPAC = isIUPAC & resolvedSmiles.isna()
+    conversionStats['successful'] += int((isIUPAC & resolvedSmiles.notna()).to_numpy().sum())
+    conversionStats['failed'] += int(failedIUPAC.to_numpy().sum())
 
-pubchemDataframe.to_csv('pubchem.csv', index=False)
-cactusDataframe.to_csv('cactus.csv', index=False)
+    # a row is done when it has no structural formulas left and every IUPAC name in it converted
+    processedRowMask = ~isStructural.any(axis=1) & ~failedIUPAC.any(axis=1)
+    processedDataframe = rawDataframe.loc[processedRowMask].copy()
+    processedSmiles = resolvedSmiles.loc[processedRowMask]
+    processedDataframe[columns2process] = processedSmiles.where(processedSmiles.notna(), processedDataframe[columns2process])
+    manualProcessingDataframe = rawDataframe.loc[~processedRowMask]
 
-processedRows: list = []
-rawRows: list = []
-for rowIndex, rowContents in rawDataframe.iterrows():
-    columns2process = ['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3']
-    processedRowBool = True
+    return {'processed': processedDataframe, 'unprocessed': manualProcessingDataframe,
+            'cactus': cactusDataframe, 'pubchem': pubchemDataframe}
 
-    for columnName in columns2process:
-        reagent = rowContents[columnName]
-
-        if not isinstance(reagent, str) or reagent.strip() == '': # skip if nothing there
-            continue # onto next cell to the right
-        
-        letters = regex.findall(r'[A-Za-z]', reagent)
-        lowercaseLetters = regex.findall(r'[a-z]', reagent)
-        # simple, IUPAC names (eg. 2-methylpentante) have mostly lowercase letters, 
-        # structural formulas have at most 1/2 lowercase letters (eg. AlBr)
-        # so that's how I sort them
-        conversionStats['attempted'] += 1
-
-        if len(letters) == 0:
-            continue
-        ratio = len(lowercaseLetters) / len(letters)
 
-        if ratio >= 0.5:
-            processedRowBool = IUPAC2SMILES(reagent, rowIndex, columnName)
-            if processedRowBool == False:
-                rawRows.append(rowIndex)
-                break
-            continue
-        else:
-            processedRowBool = False
-            rawRows.append(rowIndex)
-    if processedRowBool:
-        processedRows.append(rowIndex)
+outputPaths = {'processed': 'processed.csv', 'unprocessed': 'unprocessed.csv', 'cactus': 'cactus.csv', 'pubchem': 'pubchem.csv'}
+
+def processReagentsStreaming(inputPath: str, outputPaths: Dict[str, str] = outputPaths, chunkRows: int = 20000,
+                             cachePath: str = 'resolution cache.sqlite') -> Dict[str, int]:
+    """
+    processReagents over the input chunkRows rows at a time, each chunk's routed rows appended straight to the four
+    output tables, so memory stays around one chunk (plus its outputs) however big the input is
+
+    every chunk is classified and resolved once; names seen in an earlier chunk come back out of the resolution
+    cache instead of going to opsin/cirpy again, and one opsin pool serves every chunk so its JVMs start once
+
+    csv inputs are read as text, a chunk can't infer column types the way a whole-file read does, so numbers go
+    through exactly as the input had them
+
+    Args:
+        inputPath (str): filtered NIST extract, .csv, .parquet or .arrow
+        outputPaths (Dict[str, str]): 'processed', 'unprocessed', 'cactus', 'pubchem' -> table path (format by suffix)
+        chunkRows (int): input rows per chunk
+        cachePath (str): persistent name -> SMILES resolution cache
+
+    Returns:
+        Dict[str, int]: chunks, input rows and rows written per output
+    """
+    global resolutionStats
+    streamStats = {'chunks': 0, 'input rows': 0, **{f"{outputName} rows": 0 for outputName in outputPaths}}
+    runResolutionStats = {'unique names': 0, 'cache hits': 0, 'resolver lookups': 0, 'saved lookups': 0}
+    appenders = {outputName: TableAppender(outputPath) for outputName, outputPath in outputPaths.items()}
+
+    opsinExecutor = opsinPool()
+    try:
+        with ResolutionCache(cachePath) as resolutionCache:
+            inputColumns = None
+            for rawChunk in iterTable(inputPath, chunkRows, dtype=str):
+                inputColumns = list(rawChunk.columns)
+                routedTables = processReagents(rawChunk, resolutionCache=resolutionCache, opsinExecutor=opsinExecutor)
+                for outputName, appender in appenders.items():
+                    if len(routedTables[outputName]):
+                        appender.append(routedTables[outputName])
+                    streamStats[f"{outputName} rows"] += len(routedTables[outputName])
+                for statName in runResolutionStats:
+                    runResolutionStats[statName] += resolutionStats[statName]
+                streamStats['chunks'] += 1
+                streamStats['input rows'] += len(rawChunk)
+                print(f"--- Milestone: '{streamStats['input rows']}' rows routed ---")
+    finally:
+        if opsinExecutor is not None:
+            opsinExecutor.shutdown()
+
+    for appender in appenders.values():
+        appender.close(emptyColumns=inputColumns)
+    runResolutionStats['cache hit rate'] = round(runResolutionStats['cache hits'] / max(1, runResolutionStats['unique names']), 3)
+    resolutionStats = runResolutionStats
+    return streamStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Route the filtered NIST extract into processed/unprocessed/cactus/pubchem tables')
+    parser.add_argument('--input', default='Filtered NIST Extracted.csv')
+    parser.add_argument('--stream', action='store_true', help='read and write in chunks, memory bounded by --chunk-rows')
+    parser.add_argument('--chunk-rows', type=int, default=20000, help='input rows per chunk with --stream')
+    parser.add_argument('--cache', default='resolution cache.sqlite', help='persistent name -> SMILES cache')
+    parser.add_argument('--metrics', default=None, help='write a JSON summary of timers, latencies and rates here')
+    parser.add_argument('--progress', type=float, default=None, help='with --metrics, print a progress line every this many seconds')
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(progressInterval=args.progress)
+    if args.stream:
+        with metrics.timer('stage/smiles'):
+            print(f"Streaming statistics: {processReagentsStreaming(args.input, outputPaths, args.chunk_rows, args.cache)}")
+    else:
+        rawDataframe = pandas.read_csv(args.input)
+        with metrics.timer('stage/smiles'):
+            routedTables = processReagents(rawDataframe, args.cache)
 
-processedDataframe = processedDataframe.loc[processedRows]
-manualProcessingDataframe = manualProcessingDataframe.loc[rawRows]
+        with metrics.timer('smiles/write output'):
+            routedTables['pubchem'].to_csv(outputPaths['pubchem'], index=False)
+            routedTables['cactus'].to_csv(outputPaths['cactus'], index=False)
+            routedTables['processed'].to_csv(outputPaths['processed'], index=False)
+            routedTables['unprocessed'].to_csv(outputPaths['unprocessed'], index=False)
 
-processedDataframe.to_csv('processed.csv', index=False)
-manualProcessingDataframe.to_csv('unprocessed.csv', index=False)
+    print(f"Conversion statistics: {conversionStats}")
+    print(f"Resolution cache statistics: {resolutionStats}")
+    print(f"OPSIN batch statistics: {opsinStats}")
+    if args.metrics:
+        metrics.disable()
+        metrics.writeSummary(args.metrics)
 
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,30 @@
-from pyopsin import PyOpsin
 import pandas as pd  # dealing with weird lists and datatypes
-import requests  # for fetching HTML from URLs
-import regex  # HTML parser
 import os  # checks if file exists
-from typing import List, Dict, Optional, Tuple, Any, Union
-import cirpy # for chemical name (eg. (CH_3)2(CH_2O_2)CC(O)CH_3) to SMILES conversion
+from typing import Optional, Tuple
 from urllib.parse import quote
-
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import WebDriverException, TimeoutException, NoSuchElementException
 import time
+import argparse  # command line options
 
+# OPSIN, cirpy and the Chrome WebDriver start on first use, not on import, see backends.py
+from backends import getCirpy, getOpsin, getWebDriver
+from opsinBatch import cleanOpsinResult
+from reagentClassifier import IUPAC, NO_LETTERS, STRUCTURAL, classifyReagents, reagentColumns
 
 
-
-
-# Create an OPSIN object
-opsin = PyOpsin()
-
-conversionStats = []
 conversionStats = {'attempted': 0, 'successful': 0, 'failed': 0}
 
-convertedDataframe = pd.DataFrame()
+columns2process = reagentColumns
 
-convertedRowsList = []
 
-try:
-    # Load the IUPAC data from a CSV file
-    filteredDataframe = pd.read_csv('IUPAC Conversion Test.csv')
+def loadIUPACTest(testCSVPath: str = 'IUPAC Conversion Test.csv') -> pd.DataFrame:
+    """
+    Loads the IUPAC test data and strips the underscores out of it, rewriting the file cleaned
+    """
+    filteredDataframe = pd.read_csv(testCSVPath)
     print("IUPAC data loaded successfully.")
-except FileNotFoundError:
-    print("IUPAC data file not found. Please ensure 'checkpoint.csv' exists in the current directory.")
-
-filteredDataframe = filteredDataframe.replace('_', '', regex=True)  # removes underscores
-filteredDataframe.to_csv('IUPAC Conversion Test.csv', index=False)  # save the cleaned dataframe
+    filteredDataframe = filteredDataframe.replace('_', '', regex=True)  # removes underscores
+    filteredDataframe.to_csv(testCSVPath, index=False)  # save the cleaned dataframe
+    return filteredDataframe
 
 
 ### Select all kinetic columns at once, then apply axis=1
@@ -52,51 +39,33 @@ filteredDataframe.to_csv('IUPAC Conversion Test.csv', index=False)  # save the c
 
 # filteredDataframe.insert(0, 'ID', range(1, len(filteredDataframe) + 1)) # reset index after filtering
 # filteredDataframe.to_csv('IUPAC Conversion Test.csv', index=False)
-myOptions = Options()
-# myOptions.add_argument("--headless")  # Run without opening a browser window
-# Essential stability options
-myOptions.add_argument("--no-sandbox")
-myOptions.add_argument("--disable-dev-shm-usage")
-myOptions.add_argument("--disable-gpu")
-myOptions.add_argument("--disable-extensions")
-
-# Network and automation options
-myOptions.add_argument("--remote-debugging-port=9222")
-myOptions.add_argument("--disable-background-networking")
-myOptions.add_argument("--disable-background-timer-throttling")
-myOptions.add_argument("--disable-renderer-backgrounding")
-myOptions.add_argument("--disable-backgrounding-occluded-windows")
-
-# service = Service(ChromeDriverManager().install())
-# Add this crucial option for modern Chrome versions
-myOptions.add_argument("--remote-allow-origins=*")
-
-driver = webdriver.Chrome(options=myOptions)
-
-"""Test if Chrome can access external websites"""
-test_urls = [
-    "https://www.google.com",
-    "https://httpbin.org/get",  # Simple test endpoint
-    "https://pubchem.ncbi.nlm.nih.gov/CH3OH"  # Your target site
-]
-
-for url in test_urls:
-    try:
-        driver.get(url)
-        current_url = driver.current_url
-        
-        if not current_url.startswith("data:"):
-            print(f"Successfully accessed: {url}")
-        else:
-            print(f"Failed to access: {url}")
-            
-    except Exception as e:
-        print(f"Error accessing {url}: {e}")
+
+def checkBrowserAccess(testUrls: Tuple[str, ...] = ("https://www.google.com", "https://httpbin.org/get",
+                                                    "https://pubchem.ncbi.nlm.nih.gov/CH3OH")) -> None:
+    """Test if Chrome can access external websites"""
+    driver = getWebDriver()
+    for url in testUrls:
+        try:
+            driver.get(url)
+            current_url = driver.current_url
+
+            if not current_url.startswith("data:"):
+                print(f"Successfully accessed: {url}")
+            else:
+                print(f"Failed to access: {url}")
+
+        except Exception as e:
+            print(f"Error accessing {url}: {e}")
 
 def structural2SMILES(structuralFormula: str) -> Optional[str]:
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import WebDriverException, TimeoutException, NoSuchElementException
+    driver = getWebDriver()
     maxRetries = 3
     retryDelay = 1 # seconds, I think
-    
+
     for attempt in range(maxRetries):
         try:
             pubchemUrl = f"https://pubchem.ncbi.nlm.nih.gov/compound/" + structuralFormula
@@ -127,61 +96,73 @@ def structural2SMILES(structuralFormula: str) -> Optional[str]:
     except NoSuchElementException:
         return "None"
     return smiles
-        
 
-usefulRows = []
-cactusRows = []
-for rowIndex, rowContents in filteredDataframe.iterrows():
-    columns2process = ['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3']
-    usefulBool = True
-    cactusBool = False
+
+def convertName(reagent: str) -> Optional[str]:
+    smiles = cleanOpsinResult(getOpsin().to_smiles_single(reagent))
+    if smiles != None:
+        return smiles
+    return getCirpy().resolve(reagent, 'smiles')
+
+def convertReagents(filteredDataframe: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    every cell classified once, then structural formulas become cactus links and IUPAC names get converted
+
+    Returns:
+        Tuple with:
+        - convertedDataframe (pd.DataFrame): rows with no structural formulas and no letterless reagents
+        - cactusDataframe (pd.DataFrame): rows with a structural formula, now cactus links
+    """
+    filteredDataframe = filteredDataframe.copy()
+    reagentCategories = classifyReagents(filteredDataframe, columns2process)
+    isStructural = reagentCategories == STRUCTURAL
+    isIUPAC = reagentCategories == IUPAC
+    conversionStats['attempted'] = int((isStructural | isIUPAC).to_numpy().sum())
+
+    # each distinct name converted once instead of once per cell
+    convertedNames = {reagent: convertName(reagent)
+                      for reagent in pd.unique(filteredDataframe[columns2process].to_numpy(dtype=object)[isIUPAC.to_numpy()])}
 
     for columnName in columns2process:
-        reagent = rowContents[columnName]
-        if isinstance(reagent, str):
-            letters = regex.findall(r'[A-Za-z]', reagent)
-            lowercaseLetters = regex.findall(r'[a-z]', reagent)
-            
-
-            if len(letters) == 0 or len(lowercaseLetters) == 0:
-                usefulBool = False
-                continue
-            conversionStats['attempted'] += 1
-
-            ratio = len(lowercaseLetters) / len(letters)
-
-            if ratio < 0.5:
-                cactusLink = "https://cactus.nci.nih.gov/chemical/structure/" + quote(reagent) + "/smiles"
-                filteredDataframe.at[rowIndex, columnName] = cactusLink
-                cactusBool = True
-                continue
-            smiles = opsin.to_smiles(reagent)
-            if smiles != None:
-                conversionStats['successful'] += 1
-                filteredDataframe.at[rowIndex, columnName] = smiles
-            else:
-                smiles = cirpy.resolve(reagent, 'smiles')
-                if smiles != None:
-                    conversionStats['successful'] += 1
-                    filteredDataframe.at[rowIndex, columnName] = smiles
-                    
-                    
-    if usefulBool and not cactusBool:
-        usefulRows.append(rowIndex) 
-    if cactusBool is True:
-        cactusRows.append(rowIndex)
-
-cactusDataframe = filteredDataframe.loc[cactusRows].copy()
-filteredDataframe = filteredDataframe.loc[usefulRows]
-columns2process = ['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3']
-
-# # idrk how it does this, only chat, but it removes rows with [None] in any of the columns2process
-# filteredDataframe = filteredDataframe[
-#     ~filteredDataframe[columns2process].astype(str).apply(
-#         lambda x: x.str.contains(r'\[None\]', na=False)
-#     ).any(axis=1)
-# ]
-
-filteredDataframe.to_csv('converted.csv', index=False)
-cactusDataframe.to_csv('cactus.csv', index=False)
-print(f"Conversion statistics: {conversionStats}")
\ No newline at end of file
+        structuralCells = isStructural[columnName]
+        filteredDataframe.loc[structuralCells, columnName] = (
+            "https://cactus.nci.nih.gov/chemical/structure/" + filteredDataframe.loc[structuralCells, columnName].map(quote) + "/smiles")
+
+        convertedColumn = filteredDataframe[columnName].where(isIUPAC[columnName]).map(convertedNames)
+        conversionStats['successful'] += int(convertedColumn.notna().sum())
+        filteredDataframe[columnName] = convertedColumn.where(convertedColumn.notna(), filteredDataframe[columnName])
+
+    cactusRowMask = isStructural.any(axis=1)
+    usefulRowMask = ~(reagentCategories == NO_LETTERS).any(axis=1) & ~cactusRowMask
+    usefulRows = filteredDataframe.index[usefulRowMask]
+    cactusRows = filteredDataframe.index[cactusRowMask]
+
+    cactusDataframe = filteredDataframe.loc[cactusRows].copy()
+    filteredDataframe = filteredDataframe.loc[usefulRows]
+
+    # # idrk how it does this, only chat, but it removes rows with [None] in any of the columns2process
+    # filteredDataframe = filteredDataframe[
+    #     ~filteredDataframe[columns2process].astype(str).apply(
+    #         lambda x: x.str.contains(r'\[None\]', na=False)
+    #     ).any(axis=1)
+    # ]
+    return filteredDataframe, cactusDataframe
+
+def main():
+    parser = argparse.ArgumentParser(description='Old IUPAC -> SMILES conversion over the IUPAC test file')
+    parser.add_argument('--input', default='IUPAC Conversion Test.csv', help='cleaned (underscores stripped) in place')
+    parser.add_argument('--check-browser', action='store_true', help='launch Chrome and check it can reach the test sites first')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        print(f"IUPAC data file not found. Please ensure '{args.input}' exists in the current directory.")
+        return
+    if args.check_browser:
+        checkBrowserAccess()
+    convertedDataframe, cactusDataframe = convertReagents(loadIUPACTest(args.input))
+    convertedDataframe.to_csv('converted.csv', index=False)
+    cactusDataframe.to_csv('cactus.csv', index=False)
+    print(f"Conversion statistics: {conversionStats}")
+
+if __name__ == '__main__':
+    main()
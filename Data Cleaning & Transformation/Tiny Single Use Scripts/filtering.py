@@ -1,6 +1,10 @@
+import os
+import sys
+
 import pandas
 
-unfilteredDataframe = pandas.read_csv('NIST Extracted.csv')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # shared modules live one folder up
+from filterRules import Rule, RuleSet, allNull, printReport, textEquals
 
 columns2check = [
     'Pre-Exp Factor Coeff',
@@ -8,7 +12,21 @@ columns2check = [
     'Activation Energy'
 ]
 
-filteredDataframe = unfilteredDataframe[~unfilteredDataframe[columns2check].isnull().all(axis=1)]
-filteredDataframe = filteredDataframe[~filteredDataframe['Product 1'].str.strip().str.lower().eq('products')]
-filteredDataframe = filteredDataframe[~filteredDataframe['Product 1']]
-filteredDataframe.to_csv('Filtered NIST Extracted.csv', index=False)
\ No newline at end of file
+extractedRules = RuleSet('filter', [
+    Rule('no kinetics', allNull(columns2check)),
+    Rule("Product 1 is 'products'", textEquals('Product 1', 'products')),
+    Rule('no Product 1', allNull(['Product 1'])),
+])
+
+def filterExtracted(unfilteredDataframe: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    drops NIST rows with no kinetic parameters at all, rows whose only 'product' is the word products,
+    and rows without a Product 1; kept rows keep their index labels
+    """
+    return extractedRules.filter(unfilteredDataframe)
+
+if __name__ == '__main__':
+    unfilteredDataframe = pandas.read_csv('NIST Extracted.csv')
+    filteredDataframe, report = extractedRules.apply(unfilteredDataframe)
+    filteredDataframe.to_csv('Filtered NIST Extracted.csv', index=False)
+    printReport(extractedRules, report)
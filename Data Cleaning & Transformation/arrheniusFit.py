@@ -0,0 +1,190 @@
+import argparse  # command line options
+import time
+from typing import Optional
+
+import numpy as np
+import pandas
+
+from kineticsTable import KineticsTable, gasConstant, kineticSourceColumns, referenceTemperature
+from tableStore import readTable, tableColumns, writeTable
+
+fallbackTemperature = 298.0 # K, where records with no temperature at all get sampled
+degenerateTolerance = 1e-9 # relative spread in 1/T below which a group can't pin down a slope
+collinearTolerance = 1e-4 # 1 - r^2 between 1/T and ln(T/298) below which n and Ea can't be told apart
+
+
+def sampleTemperatures(Tmin: np.ndarray, Tmax: np.ndarray, samplesPerRecord: int) -> np.ndarray:
+    """
+    samplesPerRecord temperatures per record, evenly spaced in 1/T over [Tmin, Tmax] (the fit is linear in 1/T)
+
+    A record with one temperature gets that temperature samplesPerRecord times, one with none gets 298 K.
+
+    Returns:
+        np.ndarray: (records, samplesPerRecord) temperatures in K
+    """
+    Tmin = np.where(np.isfinite(Tmin) & (Tmin > 0), Tmin, np.where(np.isfinite(Tmax) & (Tmax > 0), Tmax, fallbackTemperature))
+    Tmax = np.where(np.isfinite(Tmax) & (Tmax >= Tmin), Tmax, Tmin)
+    fractions = np.linspace(0.0, 1.0, samplesPerRecord) if samplesPerRecord > 1 else np.zeros(1)
+    inverseTemperatures = 1.0 / Tmin[:, None] + (1.0 / Tmax - 1.0 / Tmin)[:, None] * fractions[None, :]
+    return 1.0 / inverseTemperatures
+
+
+def segmentSums(values: np.ndarray, segmentStarts: np.ndarray) -> np.ndarray:
+    # per-group sums over group-contiguous rows, one reduceat instead of a loop over groups
+    return np.add.reduceat(values, segmentStarts) if len(values) else np.zeros(len(segmentStarts))
+
+
+def fitGroups(kineticsTable: KineticsTable, groupKeys: np.ndarray, weights: Optional[np.ndarray] = None,
+              samplesPerRecord: int = 8, fitExponent: bool = False) -> pandas.DataFrame:
+    """
+    One consolidated k(T) = A (T/298 K)^n exp(-Ea/RT) per group of records, every group fitted at once
+
+    Each record's own k(T) is sampled over its valid range and all samples go into one weighted least-squares fit
+    of ln k against 1/T (and ln(T/298) with fitExponent) per group. Records get equal total weight times their
+    entry in weights, however many samples they have. Records are sorted so each group's samples are contiguous,
+    then every sum the normal equations need is a segmented np.add.reduceat, and the 1- and 2-slope systems are
+    solved in closed form for all groups together, no Python loop over groups.
+
+    Groups that can't pin down a slope fall back instead of blowing up (the Model column says which fit each got):
+    'n, Ea' fits all three, 'Ea' holds n at the records' weighted mean (always without fitExponent, and with it
+    where 1/T and ln(T/298) move together over too narrow a range), 'mean' also holds Ea at the weighted mean when
+    every record sits at one temperature, so only A is fitted.
+
+    Args:
+        kineticsTable (KineticsTable): records to fit, rows without a positive finite A are left out
+        groupKeys (np.ndarray): group per kineticsTable row (RID, canonical reaction hash, ...), same length
+        weights (Optional[np.ndarray]): relative weight per record, all 1 if None
+        samplesPerRecord (int): temperatures sampled across each record's range
+        fitExponent (bool): fit n too, otherwise n is the weighted mean of the records' n and only A, Ea are fitted
+
+    Returns:
+        pandas.DataFrame: one row per group: Group, Records, A, n, 'Ea [J/mol]', 'Tmin [K]', 'Tmax [K]', Model,
+            'RMS ln k Residual', 'Max ln k Residual', 'Mixed Orders', 'Records Without T' (sampled at 298 K, so a
+            column that failed to parse shows up here instead of quietly flattening the fit); A is in the records' own units
+    """
+    groupKeys = np.asarray(groupKeys)
+    recordWeights = np.ones(len(kineticsTable)) if weights is None else np.asarray(weights, dtype=np.float64)
+    usable = np.isfinite(kineticsTable.logA) & np.isfinite(kineticsTable.activationTemperature) & \
+        np.isfinite(kineticsTable.n) & np.isfinite(recordWeights) & (recordWeights > 0) & pandas.notna(groupKeys)
+    rowIndices = np.flatnonzero(usable)
+    groupValues, groupIDs = np.unique(groupKeys[rowIndices], return_inverse=True)
+    groupOrder = np.argsort(groupIDs, kind='stable')
+    rowIndices, groupIDs = rowIndices[groupOrder], groupIDs[groupOrder]
+    groupSizes = np.bincount(groupIDs, minlength=len(groupValues))
+    recordStarts = (np.cumsum(groupSizes) - groupSizes).astype(np.intp)
+
+    # samples, record-major, so group g's samples are the contiguous block starting at recordStarts[g] * samples
+    temperatures = sampleTemperatures(kineticsTable.Tmin[rowIndices], kineticsTable.Tmax[rowIndices], samplesPerRecord)
+    sampleCount = temperatures.shape[1]
+    u = (1000.0 / temperatures).ravel() # 1000/T, keeps the slope near 1 for conditioning
+    v = np.log(temperatures / referenceTemperature).ravel()
+    y = (kineticsTable.logA[rowIndices, None] + kineticsTable.n[rowIndices, None] * np.log(temperatures / referenceTemperature)
+         - kineticsTable.activationTemperature[rowIndices, None] / temperatures).ravel()
+    w = np.repeat(recordWeights[rowIndices] / sampleCount, sampleCount)
+    sampleStarts = recordStarts * sampleCount
+
+    # weighted means per group, then centered second moments, all segmented
+    W = segmentSums(w, sampleStarts)
+    meanU, meanV, meanY = (segmentSums(w * values, sampleStarts) / W for values in (u, v, y))
+    sampleGroups = np.repeat(np.arange(len(groupValues)), groupSizes * sampleCount)
+    du, dv, dy = u - meanU[sampleGroups], v - meanV[sampleGroups], y - meanY[sampleGroups]
+    Suu, Svv, Suv = segmentSums(w * du * du, sampleStarts), segmentSums(w * dv * dv, sampleStarts), segmentSums(w * du * dv, sampleStarts)
+    Suy, Svy = segmentSums(w * du * dy, sampleStarts), segmentSums(w * dv * dy, sampleStarts)
+
+    # fallbacks: weighted mean n and Ea (Ea/R in the 1000/T scale is -slope)
+    meanN = segmentSums(recordWeights[rowIndices] * kineticsTable.n[rowIndices], recordStarts) / W
+    meanSlope = -segmentSums(recordWeights[rowIndices] * kineticsTable.activationTemperature[rowIndices], recordStarts) / (1000.0 * W)
+
+    # n held at the weighted mean: its term comes off y, then one slope in 1/T; no spread in 1/T keeps the mean Ea too
+    hasSpread = Suu > degenerateTolerance * W * meanU ** 2
+    slopeU = np.where(hasSpread, (Suy - meanN * Suv) / np.where(hasSpread, Suu, 1.0), meanSlope)
+    slopeV = meanN
+    model = np.where(hasSpread, 'Ea', 'mean')
+    if fitExponent:
+        # both slopes by Cramer's rule, where 1/T and ln(T/298) aren't (nearly) collinear over the group's range
+        determinant = Suu * Svv - Suv * Suv
+        bothSlopes = hasSpread & (determinant > collinearTolerance * Suu * Svv)
+        safeDeterminant = np.where(bothSlopes, determinant, 1.0)
+        slopeU = np.where(bothSlopes, (Suy * Svv - Svy * Suv) / safeDeterminant, slopeU)
+        slopeV = np.where(bothSlopes, (Svy * Suu - Suy * Suv) / safeDeterminant, slopeV)
+        model = np.where(bothSlopes, 'n, Ea', model)
+    logA = meanY - slopeU * meanU - slopeV * meanV
+
+    residuals = y - (logA[sampleGroups] + slopeU[sampleGroups] * u + slopeV[sampleGroups] * v)
+    rmsResidual = np.sqrt(segmentSums(w * residuals * residuals, sampleStarts) / W)
+    maxResidual = np.maximum.reduceat(np.abs(residuals), sampleStarts) if len(residuals) else np.zeros(0)
+
+    orders = kineticsTable.order[rowIndices]
+    orderKnown = np.isfinite(orders)
+    lowestOrder = np.minimum.reduceat(np.where(orderKnown, orders, np.inf), recordStarts) if len(orders) else np.zeros(0)
+    highestOrder = np.maximum.reduceat(np.where(orderKnown, orders, -np.inf), recordStarts) if len(orders) else np.zeros(0)
+    sampleTmin = np.minimum.reduceat(temperatures.min(axis=1), recordStarts) if len(orders) else np.zeros(0)
+    sampleTmax = np.maximum.reduceat(temperatures.max(axis=1), recordStarts) if len(orders) else np.zeros(0)
+    noTemperature = ~np.isfinite(kineticsTable.Tmin[rowIndices]) & ~np.isfinite(kineticsTable.Tmax[rowIndices])
+
+    return pandas.DataFrame({
+        'Group': groupValues,
+        'Records': groupSizes,
+        'A': np.exp(logA),
+        'n': slopeV,
+        'Ea [J/mol]': -slopeU * 1000.0 * gasConstant,
+        'Tmin [K]': sampleTmin,
+        'Tmax [K]': sampleTmax,
+        'Model': model,
+        'RMS ln k Residual': rmsResidual,
+        'Max ln k Residual': maxResidual,
+        'Mixed Orders': np.isfinite(lowestOrder) & (highestOrder > lowestOrder), # A units differ inside the group
+        'Records Without T': np.bincount(groupIDs, weights=noTemperature, minlength=len(groupValues)).astype(np.int64),
+    })
+
+
+def fitTable(tablePath: str, groupColumn: str = 'RID', reactionsPath: Optional[str] = None, **fitOptions) -> pandas.DataFrame:
+    """
+    Loads the kinetic columns of an extract and fits every group, by groupColumn or by the canonical reaction
+    hashes in a reactions.npz from speciesRegistry.py (matched on RecordID)
+    """
+    presentColumns = set(tableColumns(tablePath))
+    wantedColumns = kineticSourceColumns + ([groupColumn] if reactionsPath is None and groupColumn not in kineticSourceColumns else [])
+    dataframe = readTable(tablePath, columns=[columnName for columnName in wantedColumns if columnName in presentColumns])
+    kineticsTable = KineticsTable.fromExtracted(dataframe, dropIncomplete=False) # rows stay aligned with dataframe
+
+    # integer keys have no NaN, so records without a group are left out by weight 0 instead
+    if reactionsPath is None:
+        if groupColumn not in dataframe.columns:
+            raise KeyError(f"{tablePath} has no {groupColumn!r} column to group by")
+        groupValues = pandas.to_numeric(dataframe[groupColumn], errors='coerce')
+        hasGroup = groupValues.notna().to_numpy()
+        groupKeys = groupValues.fillna(-1).to_numpy(dtype=np.int64)
+    else:
+        from speciesRegistry import ReactionTable
+        reactionTable = ReactionTable.load(reactionsPath)
+        hashOfRecord = pandas.Series(reactionTable.hashes, index=reactionTable.recordIDs)
+        hashOfRecord = hashOfRecord[~hashOfRecord.index.duplicated()]
+        recordPositions = hashOfRecord.index.get_indexer(kineticsTable.recordIDs)
+        hasGroup = recordPositions >= 0
+        groupKeys = hashOfRecord.to_numpy()[np.maximum(recordPositions, 0)]
+    weights = np.where(hasGroup, fitOptions.pop('weights', 1.0), 0.0)
+    return fitGroups(kineticsTable, groupKeys, weights=weights, **fitOptions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fit one consolidated Arrhenius expression per reaction from all its NIST records')
+    parser.add_argument('--input', default='Filtered NIST Extracted.csv')
+    parser.add_argument('--output', default='consolidated kinetics.csv')
+    parser.add_argument('--group-by', default='RID', help='column records are grouped on')
+    parser.add_argument('--reactions', default=None, help='group by canonical reaction hash from this reactions.npz instead')
+    parser.add_argument('--samples', type=int, default=8, help='temperatures sampled per record')
+    parser.add_argument('--fit-n', action='store_true', help='fit the (T/298 K)^n exponent too')
+    args = parser.parse_args()
+
+    startTime = time.perf_counter()
+    consolidated = fitTable(args.input, args.group_by, args.reactions, samplesPerRecord=args.samples, fitExponent=args.fit_n)
+    elapsedSeconds = time.perf_counter() - startTime
+    writeTable(consolidated, args.output)
+    print(f"{int(consolidated['Records'].sum())} records -> {len(consolidated)} reactions in {elapsedSeconds:.2f} s, "
+          f"models {consolidated['Model'].value_counts().to_dict()}, median RMS ln k residual "
+          f"{consolidated['RMS ln k Residual'].median():.3g}, {int(consolidated['Records Without T'].sum())} records "
+          f"without a temperature, written to {args.output}")
+
+if __name__ == '__main__':
+    main()
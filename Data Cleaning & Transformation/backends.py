@@ -0,0 +1,93 @@
+import atexit  # quits the browser when the process ends
+import threading  # the first use can come from several threads at once
+from typing import Any, Callable, Dict
+
+# every backend is made on first use and then shared by the whole process, so importing a module that might need one
+# costs nothing (no JVM start, no Chrome, no network imports) until something actually converts a name
+backendInstances = {}
+backendLock = threading.Lock()
+
+
+def sharedBackend(backendName: str, makeBackend: Callable[[], Any]) -> Any:
+    backend = backendInstances.get(backendName)
+    if backend is None:
+        with backendLock:
+            backend = backendInstances.get(backendName)
+            if backend is None:
+                backend = backendInstances[backendName] = makeBackend()
+    return backend
+
+
+def makeOpsin():
+    from pyopsin import PyOpsin # starts a JVM, a second or two
+    return PyOpsin()
+
+
+def getOpsin():
+    """
+    The process's PyOpsin, started on first use (each pool worker gets its own)
+    """
+    return sharedBackend('opsin', makeOpsin)
+
+
+def makeCirpy():
+    import cirpy # pulls in the network stack
+    return cirpy
+
+
+def getCirpy():
+    """
+    The cirpy module, imported on first use
+    """
+    return sharedBackend('cirpy', makeCirpy)
+
+
+def makeChromeOptions(headless: bool = False):
+    from selenium.webdriver.chrome.options import Options
+    myOptions = Options()
+    if headless:
+        myOptions.add_argument("--headless=new")
+    # Essential stability options
+    myOptions.add_argument("--no-sandbox")
+    myOptions.add_argument("--disable-dev-shm-usage")
+    myOptions.add_argument("--disable-gpu")
+    myOptions.add_argument("--disable-extensions")
+    # Network and automation options
+    myOptions.add_argument("--disable-background-networking")
+    myOptions.add_argument("--disable-background-timer-throttling")
+    myOptions.add_argument("--disable-renderer-backgrounding")
+    myOptions.add_argument("--disable-backgrounding-occluded-windows")
+    myOptions.add_argument("--remote-allow-origins=*")
+    return myOptions
+
+
+def getWebDriver(headless: bool = False):
+    """
+    The process's Chrome WebDriver, launched on first use and quit when the process exits
+
+    Args:
+        headless (bool): only matters for the call that launches it
+    """
+    def makeWebDriver():
+        from selenium import webdriver
+        driver = webdriver.Chrome(options=makeChromeOptions(headless))
+        atexit.register(closeBackend, 'webdriver')
+        return driver
+    return sharedBackend('webdriver', makeWebDriver)
+
+
+def closeBackend(backendName: str) -> None:
+    # drops a backend so the next use makes a fresh one, a browser gets quit first
+    with backendLock:
+        backend = backendInstances.pop(backendName, None)
+    if backend is not None and hasattr(backend, 'quit'):
+        try:
+            backend.quit()
+        except Exception: # already gone (crashed, closed by hand)
+            pass
+
+
+def loadedBackends() -> Dict[str, str]:
+    # which backends this process has paid for so far, eg. to check a code path stayed lightweight
+    with backendLock:
+        return {backendName: type(backend).__name__ for backendName, backend in backendInstances.items()}
@@ -0,0 +1,349 @@
+import argparse  # command line options
+import os
+import re as regex
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas
+
+from pathwaysDataset import defaultClassColumn, defaultMechanismColumn, defaultReactionColumn, readPathways
+
+bondSymbols = {1.0: '-', 1.5: ':', 2.0: '=', 3.0: '#'}
+changeKinds = ('break', 'form', 'change')
+bondPattern = regex.compile(r'^([A-Za-z][a-z]?(?:\^\d+)?)([-=#:~])([A-Za-z][a-z]?(?:\^\d+)?)$')
+
+
+def atomLabel(element: str, aromatic: bool = False, degree: Optional[int] = None) -> str:
+    # 'C', or with the local environment 'C^4' (total degree, hydrogens included), aromatic atoms lowercase
+    element = element.lower() if aromatic else element
+    return element if degree is None else f"{element}^{degree}"
+
+
+def bondToken(kind: str, labelA: str, labelB: str, symbol: str, newSymbol: Optional[str] = None) -> str:
+    """
+    Canonical text for one bond change, atoms sorted so 'H-C' and 'C-H' are the same key
+
+    'break C-H', 'form H-O', 'change C=C>C-C' (order change, old > new)
+    """
+    if labelB < labelA:
+        labelA, labelB = labelB, labelA
+    bondText = f"{labelA}{symbol}{labelB}"
+    return f"{kind} {bondText}>{labelA}{newSymbol}{labelB}" if kind == 'change' else f"{kind} {bondText}"
+
+
+def normalizeChange(change: str) -> str:
+    """
+    Query text -> the indexed token, eg. 'Break H-C' -> 'break C-H', 'change C=C > C-C' -> 'change C=C>C-C'
+    """
+    kind, _, bondText = change.strip().partition(' ')
+    kind = kind.lower()
+    bondText = bondText.replace(' ', '')
+    if kind not in changeKinds:
+        raise ValueError(f"bond change has to start with one of {changeKinds}, got {change!r}")
+    if kind == 'change':
+        oldBond, _, newBond = bondText.partition('>')
+        oldMatchObj, newMatchObj = bondPattern.match(oldBond), bondPattern.match(newBond)
+        if not oldMatchObj or not newMatchObj:
+            raise ValueError(f"can't read bond order change {change!r}, expected eg. 'change C=C>C-C'")
+        return bondToken(kind, oldMatchObj.group(1), oldMatchObj.group(3), oldMatchObj.group(2), newMatchObj.group(2))
+    bondMatchObj = bondPattern.match(bondText)
+    if not bondMatchObj:
+        raise ValueError(f"can't read bond {change!r}, expected eg. 'break C-H'")
+    return bondToken(kind, bondMatchObj.group(1), bondMatchObj.group(3), bondMatchObj.group(2))
+
+
+def mappedBonds(sideSMILES: str):
+    """
+    Bonds and hydrogens of one side of an atom-mapped step, keyed by map number
+
+    Returns:
+        Tuple with:
+        - bonds (Dict[Tuple[int, int], float]): (map number, map number) sorted -> bond order
+        - atoms (Dict[int, Tuple[str, bool, int, int]]): map number -> (element, aromatic, total degree, implicit H count)
+        or None if rdkit can't read the side
+    """
+    from rdkit import Chem
+    molecule = Chem.MolFromSmiles(sideSMILES, sanitize=False)
+    if molecule is None:
+        return None
+    molecule.UpdatePropertyCache(strict=False)
+    atoms = {atom.GetAtomMapNum(): (atom.GetSymbol(), atom.GetIsAromatic(), atom.GetTotalDegree(), atom.GetTotalNumHs())
+             for atom in molecule.GetAtoms() if atom.GetAtomMapNum()}
+    bonds = {}
+    for bond in molecule.GetBonds():
+        mapA, mapB = bond.GetBeginAtom().GetAtomMapNum(), bond.GetEndAtom().GetAtomMapNum()
+        if mapA and mapB: # bonds to unmapped atoms can't be followed across the arrow
+            bonds[(min(mapA, mapB), max(mapA, mapB))] = bond.GetBondTypeAsDouble()
+    return bonds, atoms
+
+
+def stepBondChanges(stepSMILES: str) -> Optional[List[str]]:
+    """
+    Every bond broken, formed or changed in order by one atom-mapped elementary step, at two levels of detail
+
+    Each change gives a coarse token (element pair and bond order, 'break C-H') and an environment token with each
+    atom's total degree on the side the bond exists ('break C^4-H^1'). Hydrogens written implicitly ([CH3:1] -> [CH2:1])
+    count as X-H bonds through the change in the atom's H count.
+
+    Returns:
+        Optional[List[str]]: sorted tokens, duplicates kept (two C-H breaks give two tokens), None if unparsable
+    """
+    reactionParts = stepSMILES.split('>')
+    if len(reactionParts) != 3:
+        return None
+    reactantSide, productSide = mappedBonds(reactionParts[0]), mappedBonds(reactionParts[2])
+    if reactantSide is None or productSide is None:
+        return None
+    (reactantBonds, reactantAtoms), (productBonds, productAtoms) = reactantSide, productSide
+
+    def labels(atoms, mapA, mapB, withDegree):
+        atomA, atomB = atoms.get(mapA), atoms.get(mapB)
+        if atomA is None or atomB is None:
+            return None
+        return (atomLabel(atomA[0], atomA[1], atomA[2] if withDegree else None),
+                atomLabel(atomB[0], atomB[1], atomB[2] if withDegree else None))
+
+    tokens = []
+    for withDegree in (False, True):
+        for bondKey in reactantBonds.keys() | productBonds.keys():
+            oldOrder, newOrder = reactantBonds.get(bondKey), productBonds.get(bondKey)
+            if oldOrder == newOrder:
+                continue
+            if newOrder is None:
+                kind, atomLabels = 'break', labels(reactantAtoms, *bondKey, withDegree)
+            elif oldOrder is None:
+                kind, atomLabels = 'form', labels(productAtoms, *bondKey, withDegree)
+            else:
+                kind, atomLabels = 'change', labels(reactantAtoms, *bondKey, withDegree)
+            if atomLabels is None:
+                continue
+            tokens.append(bondToken(kind, *atomLabels, bondSymbols.get(oldOrder or newOrder, '~'),
+                                    bondSymbols.get(newOrder, '~') if kind == 'change' else None))
+
+        # implicit hydrogens on mapped heavy atoms
+        for mapNumber in reactantAtoms.keys() & productAtoms.keys():
+            hydrogenChange = productAtoms[mapNumber][3] - reactantAtoms[mapNumber][3]
+            if not hydrogenChange:
+                continue
+            element, aromatic, degree, hydrogens = (reactantAtoms if hydrogenChange < 0 else productAtoms)[mapNumber]
+            heavyLabel = atomLabel(element, aromatic, degree if withDegree else None)
+            hydrogenLabel = atomLabel('H', False, 1 if withDegree else None)
+            tokens.extend([bondToken('break' if hydrogenChange < 0 else 'form', heavyLabel, hydrogenLabel, '-')] * abs(hydrogenChange))
+    return sorted(tokens)
+
+
+def bondChangeChunk(stepChunk: List[str]) -> List[Optional[List[str]]]:
+    # what each worker process gets handed
+    return [stepBondChanges(stepSMILES) for stepSMILES in stepChunk]
+
+
+def toCSR(rowLists: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    # list of int arrays -> (offsets, values), row i is values[offsets[i]:offsets[i + 1]]
+    offsets = np.zeros(len(rowLists) + 1, dtype=np.int64)
+    np.cumsum([len(rowList) for rowList in rowLists], out=offsets[1:])
+    values = np.concatenate(rowLists).astype(np.int32) if rowLists else np.zeros(0, dtype=np.int32)
+    return offsets, values
+
+
+class BondChangeIndex:
+    """
+    Inverted index from bond-change tokens ('break C-H', 'form H^1-O^2', 'change C=C>C-C') to mechanism steps
+
+    Steps and tokens are integer IDs in two CSR arrays, token -> steps (sorted, so an AND query is a few sorted
+    intersections) and step -> tokens (for statistics over the matches). Everything lives in one .npz, so loading is
+    a handful of array reads and the token vocabulary dict.
+
+    Attributes:
+        tokens (np.ndarray): vocabulary, token ID -> text
+        stepPathways (np.ndarray): int32 pathwayID per step (row number in the pathways file)
+        stepNumbers (np.ndarray): int16 position of the step in its mechanism
+        stepParsed (np.ndarray): bool, False for steps rdkit couldn't read (no tokens)
+        pathwayClasses (np.ndarray): mechanistic class per pathwayID
+    """
+
+    arrayNames = ['tokens', 'postingOffsets', 'postingSteps', 'stepOffsets', 'stepTokens', 'stepPathways',
+                  'stepNumbers', 'stepParsed', 'pathwayClasses']
+
+    def __init__(self, **arrays):
+        for arrayName in self.arrayNames:
+            setattr(self, arrayName, arrays[arrayName])
+        self.tokenIDs = {token: tokenID for tokenID, token in enumerate(self.tokens.tolist())}
+        self.isCoarse = np.array(['^' not in token for token in self.tokens.tolist()], dtype=bool)
+        self.changeTexts = {} # step token IDs (bytes) -> coarse change text, steps repeat the same few patterns
+
+    def __len__(self) -> int:
+        return len(self.stepPathways)
+
+    @classmethod
+    def build(cls, pathwaysPath: str, workers: Optional[int] = None, chunkSize: int = 500, **columns) -> 'BondChangeIndex':
+        """
+        Reads the pathways dataset once and tokenizes every step, chunks of steps spread over a process pool
+
+        Args:
+            pathwaysPath (str): pathways dataset, .csv or .jsonl
+            workers (Optional[int]): processes, all cpus if None, 1 runs in this process
+            chunkSize (int): steps per task
+            **columns: column name overrides for readPathways
+        """
+        stepSMILES, stepPathways, stepNumbers, pathwayClasses = [], [], [], []
+        for pathwayID, mechanismClass, reactionSMILES, steps in readPathways(pathwaysPath, **columns):
+            pathwayClasses.append(mechanismClass)
+            stepSMILES.extend(steps)
+            stepPathways.extend([pathwayID] * len(steps))
+            stepNumbers.extend(range(len(steps)))
+
+        chunks = [stepSMILES[chunkStart:chunkStart + chunkSize] for chunkStart in range(0, len(stepSMILES), chunkSize)]
+        workers = min(workers or os.cpu_count() or 1, max(1, len(chunks)))
+        if workers <= 1:
+            chunkResults = [bondChangeChunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunkResults = list(executor.map(bondChangeChunk, chunks))
+        stepChanges = [changes for chunkResult in chunkResults for changes in chunkResult]
+
+        # intern tokens, step -> token IDs
+        vocabulary = {}
+        stepTokenLists = [np.array([vocabulary.setdefault(token, len(vocabulary)) for token in changes or []], dtype=np.int32)
+                          for changes in stepChanges]
+        stepOffsets, stepTokens = toCSR(stepTokenLists)
+
+        # token -> steps, each step once per token even if the change happens twice
+        stepIDs = np.repeat(np.arange(len(stepTokenLists), dtype=np.int32), np.diff(stepOffsets))
+        tokenStepPairs = np.unique(np.stack([stepTokens.astype(np.int64), stepIDs.astype(np.int64)], axis=1), axis=0) \
+            if len(stepTokens) else np.zeros((0, 2), dtype=np.int64)
+        postingOffsets = np.searchsorted(tokenStepPairs[:, 0], np.arange(len(vocabulary) + 1))
+        return cls(tokens=np.array(list(vocabulary), dtype=str), postingOffsets=postingOffsets.astype(np.int64),
+                   postingSteps=tokenStepPairs[:, 1].astype(np.int32), stepOffsets=stepOffsets, stepTokens=stepTokens,
+                   stepPathways=np.array(stepPathways, dtype=np.int32), stepNumbers=np.array(stepNumbers, dtype=np.int16),
+                   stepParsed=np.array([changes is not None for changes in stepChanges], dtype=bool),
+                   pathwayClasses=np.array(pathwayClasses, dtype=str))
+
+    def save(self, indexPath: str) -> None:
+        temporaryPath = indexPath + '.tmp.npz'
+        np.savez(temporaryPath, **{arrayName: getattr(self, arrayName) for arrayName in self.arrayNames})
+        os.replace(temporaryPath, indexPath)
+
+    @classmethod
+    def load(cls, indexPath: str) -> 'BondChangeIndex':
+        with np.load(indexPath) as arrays:
+            return cls(**{arrayName: arrays[arrayName] for arrayName in cls.arrayNames})
+
+    def stepsWith(self, changes: Iterable[str]) -> np.ndarray:
+        """
+        Steps that make every one of the given changes (and possibly others)
+
+        Args:
+            changes (Iterable[str]): eg. ['break C-H', 'form O-H'], or environment tokens like 'break C^4-H^1'
+
+        Returns:
+            np.ndarray: sorted int32 step IDs
+        """
+        postings = []
+        for change in changes:
+            tokenID = self.tokenIDs.get(normalizeChange(change))
+            if tokenID is None:
+                return np.zeros(0, dtype=np.int32)
+            postings.append(self.postingSteps[self.postingOffsets[tokenID]:self.postingOffsets[tokenID + 1]])
+        if not postings:
+            return np.flatnonzero(self.stepParsed).astype(np.int32)
+        postings.sort(key=len) # shortest first keeps every intersection small
+        matchingSteps = postings[0]
+        for posting in postings[1:]:
+            matchingSteps = np.intersect1d(matchingSteps, posting, assume_unique=True)
+        return matchingSteps
+
+    def changeText(self, stepID: int) -> str:
+        # 'break C-H; form H-O', the coarse changes of one step
+        stepTokenIDs = self.stepTokens[self.stepOffsets[stepID]:self.stepOffsets[stepID + 1]]
+        cacheKey = stepTokenIDs.tobytes()
+        changeText = self.changeTexts.get(cacheKey)
+        if changeText is None:
+            changeText = '; '.join(self.tokens[stepTokenIDs[self.isCoarse[stepTokenIDs]]].tolist())
+            self.changeTexts[cacheKey] = changeText
+        return changeText
+
+    def query(self, changes: Iterable[str], exact: bool = False, coOccurring: int = 10) -> Tuple[pandas.DataFrame, Dict]:
+        """
+        Matching steps plus aggregate statistics
+
+        Args:
+            changes (Iterable[str]): bond changes every match has to make
+            exact (bool): only steps whose coarse changes are exactly these (nothing else broken or formed)
+            coOccurring (int): how many of the most common other changes to report
+
+        Returns:
+            Tuple with:
+            - matches (pandas.DataFrame): Step ID, Pathway ID, Step, Mechanistic Class, Changes (coarse tokens)
+            - queryStats (Dict): steps, pathways, steps per mechanistic class, changes that most often come along
+        """
+        changes = [normalizeChange(change) for change in changes]
+        matchingSteps = self.stepsWith(changes)
+        changeTexts = [self.changeText(stepID) for stepID in matchingSteps]
+        if exact:
+            wantedText = '; '.join(sorted(change for change in changes if '^' not in change))
+            isExact = np.array([changeText == wantedText for changeText in changeTexts], dtype=bool)
+            matchingSteps = matchingSteps[isExact]
+            changeTexts = [changeText for changeText, keep in zip(changeTexts, isExact) if keep]
+
+        matches = pandas.DataFrame({
+            'Step ID': matchingSteps,
+            'Pathway ID': self.stepPathways[matchingSteps],
+            'Step': self.stepNumbers[matchingSteps],
+            'Mechanistic Class': self.pathwayClasses[self.stepPathways[matchingSteps]] if len(self.pathwayClasses) else '',
+            'Changes': changeTexts,
+        })
+
+        # co-occurring changes: bincount over the token IDs of every matched step
+        tokenCountsPerStep = self.stepOffsets[matchingSteps + 1] - self.stepOffsets[matchingSteps]
+        gatherPositions = np.repeat(self.stepOffsets[matchingSteps] - np.cumsum(tokenCountsPerStep) + tokenCountsPerStep, tokenCountsPerStep) \
+            + np.arange(tokenCountsPerStep.sum())
+        matchedTokenIDs = self.stepTokens[gatherPositions]
+        tokenCounts = np.bincount(matchedTokenIDs, minlength=len(self.tokens))
+        for change in changes:
+            if change in self.tokenIDs:
+                tokenCounts[self.tokenIDs[change]] = 0
+        tokenCounts[~self.isCoarse] = 0
+        topTokens = np.argsort(-tokenCounts, kind='stable')[:coOccurring]
+        queryStats = {
+            'steps': len(matchingSteps),
+            'pathways': int(len(np.unique(matches['Pathway ID']))),
+            'classes': matches['Mechanistic Class'].value_counts().to_dict(),
+            'co-occurring': {str(self.tokens[tokenID]): int(tokenCounts[tokenID]) for tokenID in topTokens if tokenCounts[tokenID]},
+        }
+        return matches, queryStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bond-change signature index over the atom-mapped mechanism steps')
+    parser.add_argument('--pathways', default=None, help='pathways dataset to (re)build the index from')
+    parser.add_argument('--index', default='bond changes.npz')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--mechanism-column', default=defaultMechanismColumn)
+    parser.add_argument('--reaction-column', default=defaultReactionColumn)
+    parser.add_argument('--class-column', default=defaultClassColumn)
+    parser.add_argument('--query', nargs='*', default=[], help="eg. --query 'break C-H' 'form O-H'")
+    parser.add_argument('--exact', action='store_true', help='nothing but the queried changes')
+    args = parser.parse_args()
+
+    if args.pathways:
+        startTime = time.perf_counter()
+        bondIndex = BondChangeIndex.build(args.pathways, args.workers, mechanismColumn=args.mechanism_column,
+                                          reactionColumn=args.reaction_column, classColumn=args.class_column)
+        bondIndex.save(args.index)
+        print(f"Indexed {len(bondIndex)} steps ({int((~bondIndex.stepParsed).sum())} unreadable), "
+              f"{len(bondIndex.tokens)} distinct changes in {time.perf_counter() - startTime:.2f} s")
+
+    startTime = time.perf_counter()
+    bondIndex = BondChangeIndex.load(args.index)
+    print(f"Loaded {args.index} in {1000 * (time.perf_counter() - startTime):.1f} ms")
+
+    if args.query:
+        startTime = time.perf_counter()
+        matches, queryStats = bondIndex.query(args.query, exact=args.exact)
+        print(f"{1000 * (time.perf_counter() - startTime):.2f} ms, {queryStats}")
+        print(matches.head(20).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
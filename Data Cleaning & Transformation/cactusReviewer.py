@@ -1,28 +1,24 @@
 import pandas
-import numpy as np
-import typing
-import pubchempy
 
+from filterRules import Rule, RuleSet, allCellsAre, printReport
 
 
-cactusDataframe = pandas.read_csv('cactus.csv')
-
 columns2process = ['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3']
+cactusPrefix = 'https://cactus.nci.nih.gov/chemical/structure/'
+placeholderValues = ['[None]', '', 'nan', 'NaN']
+
+cactusRules = RuleSet('review', [
+    Rule('reagent not a cactus link or placeholder', ~allCellsAre(columns2process, prefixes=[cactusPrefix], values=placeholderValues)),
+])
+
+def reviewCactus(cactusDataframe: pandas.DataFrame) -> pandas.DataFrame:
+    # rows where every reagent is either a cactus link or a placeholder, index labels kept
+    return cactusRules.filter(cactusDataframe)
 
-def cactusURLchecker(cellContents: str) -> bool:
-    if pandas.isna(cellContents):
-        return True
-    elif isinstance(cellContents, str):
-        if cellContents.startswith('https://cactus.nci.nih.gov/chemical/structure/'):
-            return True
-        elif cellContents in ['[None]', '', 'nan', 'NaN']:
-            return True
-        else:
-            return False
-    else:
-        return False
-    
-filteredCactusDataframe = cactusDataframe[cactusDataframe[columns2process].apply(lambda row: all(cactusURLchecker(x) for x in row), axis=1)]
-filteredCactusDataframe.to_csv('Processed Cactus.csv', index=False)
+if __name__ == '__main__':
+    cactusDataframe = pandas.read_csv('cactus.csv')
+    filteredCactusDataframe, report = cactusRules.apply(cactusDataframe)
+    filteredCactusDataframe.to_csv('Processed Cactus.csv', index=False)
+    printReport(cactusRules, report)
 
-print("Successfully converted")
+    print("Successfully converted")
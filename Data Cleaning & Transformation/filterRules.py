@@ -0,0 +1,182 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas
+
+from instrumentation import metrics  # per-rule rejection counters in the --metrics summary
+
+
+textDtypes = {'string', 'empty', 'mixed', 'mixed-integer'} # what pandas' .str accessor takes, non-strings in it come out NaN
+
+
+def textValues(series: pandas.Series) -> pandas.Series:
+    # a column the .str methods work on, a column read in as all-NaN floats (or numbers) has no text at all
+    if pandas.api.types.infer_dtype(series, skipna=True) in textDtypes:
+        return series
+    return pandas.Series(np.nan, index=series.index, dtype=object)
+
+
+class Condition:
+    """
+    A vectorized row predicate: evaluate(dataframe) gives one bool per row, computed over whole columns at once
+
+    Conditions combine with ~, & and |, so a rule reads like the sentence it came from, and the combined condition is
+    still only a handful of column operations.
+
+    Args:
+        description (str): what the condition checks, shows up in rule reports
+        evaluate (Callable[[pandas.DataFrame], np.ndarray]): dataframe -> bool array, one entry per row
+    """
+
+    def __init__(self, description: str, evaluate: Callable[[pandas.DataFrame], np.ndarray]):
+        self.description = description
+        self.evaluate = evaluate
+
+    def __call__(self, dataframe: pandas.DataFrame) -> np.ndarray:
+        return np.asarray(self.evaluate(dataframe), dtype=bool)
+
+    def __invert__(self) -> 'Condition':
+        return Condition(f"not ({self.description})", lambda dataframe: ~self(dataframe))
+
+    def __and__(self, other: 'Condition') -> 'Condition':
+        return Condition(f"({self.description}) and ({other.description})", lambda dataframe: self(dataframe) & other(dataframe))
+
+    def __or__(self, other: 'Condition') -> 'Condition':
+        return Condition(f"({self.description}) or ({other.description})", lambda dataframe: self(dataframe) | other(dataframe))
+
+    def __repr__(self) -> str:
+        return f"Condition({self.description})"
+
+
+def distinctCellMask(column: pandas.Series, cellMask: Callable[[pandas.Series], pandas.Series]) -> np.ndarray:
+    # reagent names repeat thousands of times, so the check runs once per distinct value and gets spread back by code
+    codes, uniques = pandas.factorize(column)
+    distinctValues = pandas.Series(uniques).reindex(range(len(uniques) + 1)) # last entry is NaN, for code -1
+    return cellMask(distinctValues).to_numpy(dtype=bool)[codes]
+
+
+def cellTest(columns: List[str], cellMask: Callable[[pandas.Series], pandas.Series], combine: str, description: str) -> Condition:
+    # one column at a time into a (rows, columns) mask, then all/any across the row; missing columns count as all-NaN
+    def evaluate(dataframe: pandas.DataFrame) -> np.ndarray:
+        cellMasks = np.empty((len(dataframe), len(columns)), dtype=bool)
+        for columnNumber, columnName in enumerate(columns):
+            if columnName in dataframe.columns:
+                cellMasks[:, columnNumber] = distinctCellMask(dataframe[columnName], cellMask)
+            else:
+                cellMasks[:, columnNumber] = cellMask(pandas.Series([np.nan])).to_numpy(dtype=bool)[0]
+        return cellMasks.all(axis=1) if combine == 'all' else cellMasks.any(axis=1)
+    return Condition(description, evaluate)
+
+
+def allNull(columns: List[str]) -> Condition:
+    return cellTest(columns, pandas.Series.isna, 'all', f"all of {columns} null")
+
+
+def anyNull(columns: List[str]) -> Condition:
+    return cellTest(columns, pandas.Series.isna, 'any', f"any of {columns} null")
+
+
+def textEquals(column: str, value: str) -> Condition:
+    # compared stripped and case-insensitive, the way NIST's free text varies
+    value = value.strip().lower()
+    return cellTest([column], lambda series: textValues(series).str.strip().str.lower().eq(value).fillna(False),
+                    'all', f"{column} == {value!r}")
+
+
+def allCellsAre(columns: List[str], prefixes: Iterable[str] = (), values: Iterable[str] = (), nullCounts: bool = True) -> Condition:
+    """
+    Every cell in columns is null (if nullCounts), one of values, or a string starting with one of prefixes
+
+    Args:
+        columns (List[str]): cells checked per row
+        prefixes (Iterable[str]): eg. the Cactus link prefix
+        values (Iterable[str]): exact placeholder strings, eg. '[None]'
+        nullCounts (bool): whether a missing cell passes
+    """
+    prefixes, values = tuple(prefixes), list(values)
+
+    def cellMask(series: pandas.Series) -> pandas.Series:
+        text = textValues(series)
+        mask = text.isin(values)
+        if prefixes:
+            mask |= text.str.startswith(prefixes).fillna(False).astype(bool)
+        if nullCounts:
+            mask |= series.isna()
+        return mask
+
+    return cellTest(columns, cellMask, 'all', f"every cell of {columns} is {'null, ' if nullCounts else ''}"
+                                              f"one of {values} or starts with one of {list(prefixes)}")
+
+
+class Rule:
+    """
+    One named reason to drop a row: rows where condition is True get rejected
+
+    Args:
+        name (str): short label for reports and metrics
+        condition (Condition): what a rejected row looks like
+    """
+
+    def __init__(self, name: str, condition: Condition):
+        self.name = name
+        self.condition = condition
+
+    def __repr__(self) -> str:
+        return f"Rule({self.name!r}: {self.condition.description})"
+
+
+class RuleSet:
+    """
+    Rules applied together in one pass: every rule's mask over the whole frame, OR-ed, one .loc for the survivors
+
+    Per-rule counts are how many rows each rule matched on its own (a row several rules match counts for each), plus
+    'first match' counts that attribute each dropped row to the first rule in order that matches it, so those add
+    up to the rows dropped.
+
+    Args:
+        name (str): what the rule set is for, prefixes its metrics counters ('rules/<name>/<rule>')
+        rules (List[Rule]): in reporting order
+    """
+
+    def __init__(self, name: str, rules: List[Rule]):
+        self.name = name
+        self.rules = list(rules)
+
+    def masks(self, dataframe: pandas.DataFrame) -> np.ndarray:
+        # (rules, rows) bool, True where a rule rejects the row
+        if not self.rules:
+            return np.zeros((0, len(dataframe)), dtype=bool)
+        return np.stack([rule.condition(dataframe) for rule in self.rules])
+
+    def apply(self, dataframe: pandas.DataFrame) -> Tuple[pandas.DataFrame, Dict[str, Dict[str, int]]]:
+        """
+        Drops every row some rule rejects, kept rows keep their index labels
+
+        Returns:
+            Tuple with:
+            - keptDataframe (pandas.DataFrame): rows no rule rejected, in order
+            - report (Dict[str, Dict[str, int]]): rule name -> {'matched': ..., 'first match': ...}, plus 'total' ->
+              {'rows': ..., 'kept': ..., 'rejected': ...}
+        """
+        ruleMasks = self.masks(dataframe)
+        rejected = ruleMasks.any(axis=0)
+        firstMatch = np.where(rejected, ruleMasks.argmax(axis=0), -1)
+        firstMatchCounts = np.bincount(firstMatch[rejected], minlength=len(self.rules))
+
+        report = {}
+        for ruleNumber, rule in enumerate(self.rules):
+            report[rule.name] = {'matched': int(ruleMasks[ruleNumber].sum()), 'first match': int(firstMatchCounts[ruleNumber])}
+            metrics.count(f"rules/{self.name}/{rule.name}", report[rule.name]['first match'])
+        report['total'] = {'rows': len(dataframe), 'kept': int(len(dataframe) - rejected.sum()), 'rejected': int(rejected.sum())}
+        return dataframe.loc[~rejected], report
+
+    def filter(self, dataframe: pandas.DataFrame) -> pandas.DataFrame:
+        return self.apply(dataframe)[0]
+
+
+def printReport(ruleSet: RuleSet, report: Dict[str, Dict[str, int]]) -> None:
+    total = report['total']
+    print(f"{ruleSet.name}: kept {total['kept']} of {total['rows']} rows, rejected {total['rejected']}")
+    for rule in ruleSet.rules:
+        print(f"  {rule.name}: {report[rule.name]['matched']} matched, {report[rule.name]['first match']} rejected first "
+              f"({rule.condition.description})")
@@ -0,0 +1,199 @@
+import argparse  # command line options
+import json  # store metadata
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from speciesRegistry import ReactionTable, SpeciesRegistry, identitySmilesLookup, productColumns, reactantColumns, smilesCells
+
+maccsBitCount = 167 # rdkit's MACCS keys, bit 0 is unused but kept so bit numbers match the key numbers
+
+workerGenerators = {} # (radius, bits) -> Morgan generator, one per process, made on first use
+
+
+def getMorganGenerator(radius: int, bitCount: int):
+    generatorKey = (radius, bitCount)
+    if generatorKey not in workerGenerators:
+        from rdkit.Chem import rdFingerprintGenerator # imported here so only processes that fingerprint pay for rdkit
+        workerGenerators[generatorKey] = rdFingerprintGenerator.GetMorganGenerator(radius=radius, fpSize=bitCount)
+    return workerGenerators[generatorKey]
+
+
+def fingerprintChunk(task: Tuple[List[Optional[str]], int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Morgan + MACCS for one chunk of SMILES, what each worker process gets handed
+
+    Returns:
+        Tuple with:
+        - morganPacked (np.ndarray): (chunk, bitCount/8) uint8, np.packbits rows
+        - maccsPacked (np.ndarray): (chunk, 21) uint8, np.packbits rows
+        - isValid (np.ndarray): bool per SMILES, False (and all-zero rows) where rdkit couldn't parse it
+    """
+    smilesChunk, radius, bitCount = task
+    from rdkit import Chem, DataStructs
+    from rdkit.Chem import MACCSkeys
+    morganGenerator = getMorganGenerator(radius, bitCount)
+
+    morganBits = np.zeros((len(smilesChunk), bitCount), dtype=np.uint8)
+    maccsBits = np.zeros((len(smilesChunk), maccsBitCount), dtype=np.uint8)
+    isValid = np.zeros(len(smilesChunk), dtype=bool)
+    for row, smiles in enumerate(smilesChunk):
+        molecule = Chem.MolFromSmiles(smiles) if smiles else None
+        if molecule is None:
+            continue
+        morganBits[row] = morganGenerator.GetFingerprintAsNumPy(molecule)
+        DataStructs.ConvertToNumpyArray(MACCSkeys.GenMACCSKeys(molecule), maccsBits[row])
+        isValid[row] = True
+    return np.packbits(morganBits, axis=1), np.packbits(maccsBits, axis=1), isValid
+
+
+def fingerprintSpecies(speciesSmiles: List[Optional[str]], radius: int = 2, bitCount: int = 2048,
+                       chunkSize: int = 500, workers: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fingerprints every species once, in chunks spread over a process pool
+
+    Args:
+        speciesSmiles (List[Optional[str]]): SMILES per speciesID, None for species nothing resolved
+        radius (int): Morgan radius
+        bitCount (int): Morgan length, a multiple of 8
+        chunkSize (int): SMILES per task
+        workers (Optional[int]): processes, all cpus if None, 1 runs in this process
+
+    Returns:
+        Tuple with packed Morgan rows, packed MACCS rows and the valid mask, one row per species
+    """
+    if bitCount % 8:
+        raise ValueError(f"bitCount has to be a multiple of 8 to pack, got {bitCount}")
+    tasks = [(speciesSmiles[chunkStart:chunkStart + chunkSize], radius, bitCount)
+             for chunkStart in range(0, len(speciesSmiles), chunkSize)]
+    workers = min(workers or os.cpu_count() or 1, max(1, len(tasks)))
+    if workers <= 1:
+        chunkResults = [fingerprintChunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunkResults = list(executor.map(fingerprintChunk, tasks))
+
+    if not chunkResults:
+        return (np.zeros((0, bitCount // 8), dtype=np.uint8), np.zeros((0, (maccsBitCount + 7) // 8), dtype=np.uint8),
+                np.zeros(0, dtype=bool))
+    return tuple(np.concatenate(parts) for parts in zip(*chunkResults))
+
+
+def reactionDifference(speciesPacked: np.ndarray, reactantIDs: np.ndarray, productIDs: np.ndarray) -> np.ndarray:
+    """
+    Binary products - reactants fingerprint straight on the packed bytes: OR each side's species together, then XOR
+    the two sides, so a set bit is a substructure that's only on one side of the arrow (made or destroyed)
+
+    Returns:
+        np.ndarray: (reactions, bytes) uint8 packed rows
+    """
+    paddedPacked = np.concatenate([speciesPacked, np.zeros((1, speciesPacked.shape[1]), dtype=np.uint8)]) # NO_SPECIES (-1) -> zero row
+    reactantSide = np.bitwise_or.reduce(paddedPacked[reactantIDs], axis=1)
+    productSide = np.bitwise_or.reduce(paddedPacked[productIDs], axis=1)
+    return np.bitwise_xor(reactantSide, productSide)
+
+
+class FingerprintStore:
+    """
+    Directory of packed fingerprint matrices (.npy, opened memory-mapped) plus the row index
+
+    Layout:
+        species morgan.npy / species maccs.npy: packed rows per speciesID
+        reaction morgan.npy / reaction maccs.npy: packed difference rows per reaction, same order as index.npz
+        index.npz: recordIDs and canonical reaction hashes per reaction row, species valid mask
+        meta.json: radius, bit counts, row counts
+    """
+
+    matrixNames = ['species morgan', 'species maccs', 'reaction morgan', 'reaction maccs']
+
+    def __init__(self, storeDirectory: str):
+        self.storeDirectory = storeDirectory
+        with open(os.path.join(storeDirectory, 'meta.json'), 'r', encoding='utf-8') as metaFile:
+            self.meta = json.load(metaFile)
+        with np.load(os.path.join(storeDirectory, 'index.npz')) as index:
+            self.recordIDs = index['recordIDs']
+            self.reactionHashes = index['reactionHashes']
+            self.speciesValid = index['speciesValid']
+        self.rowOfRecord = {recordID: row for row, recordID in enumerate(self.recordIDs.tolist())}
+
+    def matrix(self, matrixName: str) -> np.ndarray:
+        # read-only memory map, pages come off the disk as rows are touched
+        return np.load(os.path.join(self.storeDirectory, f"{matrixName}.npy"), mmap_mode='r')
+
+    def bitCount(self, matrixName: str) -> int:
+        return self.meta['morgan bits'] if matrixName.endswith('morgan') else maccsBitCount
+
+    def unpacked(self, matrixName: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        0/1 uint8 matrix for scikit-learn, only the asked-for rows get read and unpacked
+
+        Args:
+            matrixName (str): one of matrixNames
+            rows (Optional[np.ndarray]): row numbers or a slice-able index, all rows if None
+        """
+        packedMatrix = self.matrix(matrixName)
+        packedRows = packedMatrix if rows is None else packedMatrix[rows]
+        return np.unpackbits(packedRows, axis=1, count=self.bitCount(matrixName))
+
+    def rowsOf(self, recordIDs) -> np.ndarray:
+        return np.array([self.rowOfRecord[int(recordID)] for recordID in recordIDs], dtype=np.int64)
+
+
+def buildFingerprintStore(reactionTable: ReactionTable, registry: SpeciesRegistry, storeDirectory: str,
+                          radius: int = 2, bitCount: int = 2048, workers: Optional[int] = None,
+                          rowBlock: int = 8192) -> Dict[str, float]:
+    """
+    Fingerprints every species in the registry once, then derives every reaction's difference fingerprint and writes
+    it all to storeDirectory, reaction matrices rowBlock rows at a time straight into memory-mapped .npy files
+
+    Returns:
+        Dict[str, float]: species, valid species, reactions, seconds
+    """
+    startTime = time.perf_counter()
+    os.makedirs(storeDirectory, exist_ok=True)
+    speciesSmiles = [speciesKey[len('smiles:'):] if speciesKey.startswith('smiles:') else None for speciesKey in registry.speciesKeys]
+    speciesMorgan, speciesMaccs, speciesValid = fingerprintSpecies(speciesSmiles, radius, bitCount, workers=workers)
+
+    np.save(os.path.join(storeDirectory, 'species morgan.npy'), speciesMorgan)
+    np.save(os.path.join(storeDirectory, 'species maccs.npy'), speciesMaccs)
+    for matrixName, speciesPacked in (('reaction morgan', speciesMorgan), ('reaction maccs', speciesMaccs)):
+        reactionMatrix = np.lib.format.open_memmap(os.path.join(storeDirectory, f"{matrixName}.npy"), mode='w+',
+                                                   dtype=np.uint8, shape=(len(reactionTable), speciesPacked.shape[1]))
+        for blockStart in range(0, len(reactionTable), rowBlock):
+            blockRows = slice(blockStart, blockStart + rowBlock)
+            reactionMatrix[blockRows] = reactionDifference(speciesPacked, reactionTable.reactantIDs[blockRows],
+                                                           reactionTable.productIDs[blockRows])
+        reactionMatrix.flush()
+        del reactionMatrix
+
+    np.savez(os.path.join(storeDirectory, 'index.npz'), recordIDs=reactionTable.recordIDs,
+             reactionHashes=reactionTable.hashes, speciesValid=speciesValid)
+    buildStats = {'species': len(speciesSmiles), 'valid species': int(speciesValid.sum()), 'reactions': len(reactionTable),
+                  'seconds': round(time.perf_counter() - startTime, 3)}
+    with open(os.path.join(storeDirectory, 'meta.json'), 'w', encoding='utf-8') as metaFile:
+        json.dump({'morgan radius': radius, 'morgan bits': bitCount, 'maccs bits': maccsBitCount, **buildStats}, metaFile, indent=2)
+    return buildStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Morgan/MACCS fingerprints for processed.csv, packed and memory-mappable')
+    parser.add_argument('--input', default='processed.csv', help='reagent cells hold resolved SMILES')
+    parser.add_argument('--output', default='fingerprints', help='store directory')
+    parser.add_argument('--radius', type=int, default=2)
+    parser.add_argument('--bits', type=int, default=2048)
+    parser.add_argument('--workers', type=int, default=None, help='fingerprint processes (default: all cpus)')
+    args = parser.parse_args()
+
+    from tableStore import readTable
+    dataframe = readTable(args.input, columns=['RecordID'] + reactantColumns + productColumns)
+    registry = SpeciesRegistry()
+    # '[None]' placeholders out and list-wrapped answers unwrapped first, so only real SMILES reach rdkit
+    reactionTable = ReactionTable.fromDataframe(smilesCells(dataframe), registry, identitySmilesLookup)
+    buildStats = buildFingerprintStore(reactionTable, registry, args.output, args.radius, args.bits, args.workers)
+    print(f"Fingerprint store statistics: {buildStats}")
+
+if __name__ == '__main__':
+    main()
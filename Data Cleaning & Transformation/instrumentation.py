@@ -0,0 +1,231 @@
+import json  # run summary
+import os
+import random
+import sys
+import threading  # counters are bumped from fetcher and pipeline threads
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+try:
+    import resource # peak memory, not on Windows
+except ImportError:
+    resource = None
+
+# latency histogram bucket upper bounds in ms, the last bucket catches everything slower
+latencyBucketsMs = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+maxLatencySamples = 100000 # per histogram, a reservoir sample after that so percentiles stay cheap on 70k-page scrapes
+
+
+class NoTimer:
+    # what timer() hands out while metrics are off, entering and leaving it costs about as much as a with on nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        return False
+
+
+noTimer = NoTimer()
+
+
+class Timer:
+    def __init__(self, metrics: 'Metrics', name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, *excInfo):
+        self.metrics.addTime(self.name, time.perf_counter() - self.startTime)
+        return False
+
+
+class Metrics:
+    """
+    Timers, counters and latency histograms for one run, summarized as JSON at the end
+
+    Off by default; while off every call returns straight away (timer() hands back a shared no-op), so the
+    instrumented code doesn't need an if around each call. Names are '<area>/<what>', eg. 'scrape/parse',
+    'resolver/opsin', which is how the summary groups them.
+
+    Attributes:
+        enabled (bool): whether anything gets recorded
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.startTime = time.perf_counter()
+        self.counters: Dict[str, float] = {}
+        self.timers: Dict[str, list] = {} # name -> [calls, total seconds, max seconds]
+        self.histograms: Dict[str, dict] = {} # name -> {'buckets': [...], 'samples': [...], 'count': n}
+        self.progressThread = None
+        self.progressStop = threading.Event()
+
+    def enable(self, progressInterval: Optional[float] = None) -> 'Metrics':
+        """
+        Starts recording (from zero), with a one-line progress snapshot every progressInterval seconds if given
+        """
+        self.stopProgress()
+        self.reset()
+        self.enabled = True
+        if progressInterval:
+            self.progressThread = threading.Thread(target=self.progressLoop, args=(progressInterval,), name='metrics progress', daemon=True)
+            self.progressThread.start()
+        return self
+
+    def disable(self) -> None:
+        self.stopProgress()
+        self.enabled = False
+
+    # ------------------------------------------------------------------ recording
+
+    def count(self, name: str, amount: float = 1) -> None:
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timer(self, name: str):
+        """
+        with metrics.timer('scrape/parse'): ... adds the block's wall time to that timer
+        """
+        return Timer(self, name) if self.enabled else noTimer
+
+    def addTime(self, name: str, seconds: float) -> None:
+        if self.enabled:
+            with self.lock:
+                timerValues = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timerValues[0] += 1
+                timerValues[1] += seconds
+                timerValues[2] = max(timerValues[2], seconds)
+
+    def observeLatency(self, name: str, seconds: float) -> None:
+        # one sample into a latency histogram, eg. 'host/kinetics.nist.gov'
+        if self.enabled:
+            latencyMs = seconds * 1000
+            with self.lock:
+                histogram = self.histograms.setdefault(name, {'buckets': [0] * (len(latencyBucketsMs) + 1), 'samples': [], 'count': 0})
+                bucketIndex = next((index for index, bound in enumerate(latencyBucketsMs) if latencyMs <= bound), len(latencyBucketsMs))
+                histogram['buckets'][bucketIndex] += 1
+                histogram['count'] += 1
+                if len(histogram['samples']) < maxLatencySamples:
+                    histogram['samples'].append(latencyMs)
+                else:
+                    sampleIndex = random.randrange(histogram['count'])
+                    if sampleIndex < maxLatencySamples:
+                        histogram['samples'][sampleIndex] = latencyMs
+
+    def request(self, url: str, seconds: float, status: Optional[int]) -> None:
+        # one HTTP request: host latency histogram plus a status counter ('error' when it never got a response)
+        if self.enabled:
+            host = urlsplit(url).netloc
+            self.observeLatency(f"host/{host}", seconds)
+            self.count(f"http/{host}/{status if status is not None else 'error'}")
+
+    def resolverResult(self, resolver: str, succeeded: bool, amount: int = 1) -> None:
+        self.count(f"resolver/{resolver}/{'succeeded' if succeeded else 'failed'}", amount)
+
+    def cacheResult(self, cache: str, hits: int, misses: int) -> None:
+        self.count(f"cache/{cache}/hits", hits)
+        self.count(f"cache/{cache}/misses", misses)
+
+    def rows(self, stage: str, rowCount: int) -> None:
+        self.count(f"rows/{stage}", rowCount)
+
+    # ------------------------------------------------------------------ reporting
+
+    def summary(self) -> Dict[str, object]:
+        """
+        Everything recorded so far, with the derived numbers: rows per second, success and hit rates, latency percentiles
+
+        Returns:
+            Dict[str, object]: JSON-ready summary
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            timers = {name: list(values) for name, values in self.timers.items()}
+            histograms = {name: {'buckets': list(histogram['buckets']), 'samples': sorted(histogram['samples']), 'count': histogram['count']}
+                          for name, histogram in self.histograms.items()}
+        elapsedSeconds = time.perf_counter() - self.startTime
+
+        summary = {'seconds': round(elapsedSeconds, 3), 'peak memory MB': peakMemoryMB(), 'counters': counters,
+                   'timers': {name: {'calls': calls, 'seconds': round(totalSeconds, 4), 'mean ms': round(1000 * totalSeconds / calls, 3),
+                                     'max ms': round(1000 * maxSeconds, 3)} for name, (calls, totalSeconds, maxSeconds) in timers.items()}}
+
+        # rows/<stage> over the stage's own timer if it has one, the whole run otherwise
+        summary['rows per second'] = {}
+        for name, rowCount in counters.items():
+            if name.startswith('rows/'):
+                stage = name[len('rows/'):]
+                stageSeconds = timers.get(f"stage/{stage}", [0, elapsedSeconds])[1] or elapsedSeconds
+                summary['rows per second'][stage] = round(rowCount / stageSeconds, 2) if stageSeconds > 0 else None
+
+        summary['resolver success rate'] = {}
+        summary['cache hit rate'] = {}
+        for name in counters:
+            parts = name.split('/')
+            if parts[0] == 'resolver' and len(parts) == 3 and parts[1] not in summary['resolver success rate']:
+                succeeded, failed = counters.get(f"resolver/{parts[1]}/succeeded", 0), counters.get(f"resolver/{parts[1]}/failed", 0)
+                summary['resolver success rate'][parts[1]] = {'attempts': succeeded + failed,
+                                                              'rate': round(succeeded / (succeeded + failed), 4) if succeeded + failed else None}
+            if parts[0] == 'cache' and len(parts) == 3 and parts[1] not in summary['cache hit rate']:
+                hits, misses = counters.get(f"cache/{parts[1]}/hits", 0), counters.get(f"cache/{parts[1]}/misses", 0)
+                summary['cache hit rate'][parts[1]] = {'lookups': hits + misses, 'rate': round(hits / (hits + misses), 4) if hits + misses else None}
+
+        summary['latency'] = {}
+        for name, histogram in histograms.items():
+            samples = histogram['samples']
+            percentile = lambda fraction: round(samples[min(len(samples) - 1, int(len(samples) * fraction))], 1)
+            summary['latency'][name] = {
+                'count': histogram['count'], 'p50 ms': percentile(0.5), 'p95 ms': percentile(0.95), 'p99 ms': percentile(0.99),
+                'max ms': round(samples[-1], 1),
+                'histogram': {f"<= {bound} ms" if index < len(latencyBucketsMs) else f"> {latencyBucketsMs[-1]} ms": bucketCount
+                              for index, (bound, bucketCount) in enumerate(zip(latencyBucketsMs + [None], histogram['buckets'])) if bucketCount}}
+        return summary
+
+    def writeSummary(self, summaryPath: str) -> Dict[str, object]:
+        summary = self.summary()
+        temporaryPath = summaryPath + '.tmp'
+        with open(temporaryPath, 'w', encoding='utf-8') as summaryFile:
+            json.dump(summary, summaryFile, indent=2)
+        os.replace(temporaryPath, summaryPath)
+        return summary
+
+    def progressLine(self) -> str:
+        # the few numbers worth watching while a run is going: rows, requests, timers with the most time
+        with self.lock:
+            rowCounts = {name[len('rows/'):]: int(count) for name, count in self.counters.items() if name.startswith('rows/')}
+            requestCount = sum(histogram['count'] for histogram in self.histograms.values())
+            busiestTimers = sorted(self.timers.items(), key=lambda item: -item[1][1])[:3]
+        elapsedSeconds = time.perf_counter() - self.startTime
+        timerText = ', '.join(f"{name} {values[1]:.1f}s" for name, values in busiestTimers)
+        return (f"[metrics {elapsedSeconds:.0f}s] rows {rowCounts}, {requestCount} requests "
+                f"({requestCount / elapsedSeconds:.1f}/s), {timerText}, peak {peakMemoryMB()} MB")
+
+    def progressLoop(self, progressInterval: float) -> None:
+        while not self.progressStop.wait(progressInterval):
+            print(self.progressLine(), file=sys.stderr, flush=True)
+
+    def stopProgress(self) -> None:
+        if self.progressThread is not None:
+            self.progressStop.set()
+            self.progressThread.join()
+            self.progressThread = None
+            self.progressStop = threading.Event()
+
+
+def peakMemoryMB() -> Optional[float]:
+    # peak resident set size of this process
+    if resource is None:
+        return None
+    peakResident = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peakResident / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1) # bytes on macOS, kB on Linux
+
+
+metrics = Metrics() # the one every module records into, enabled by the entry point (--metrics)
@@ -0,0 +1,199 @@
+import argparse  # command line options
+import time
+from typing import Optional
+
+import numpy as np
+import pandas
+
+from tableStore import readTable, tableColumns
+
+gasConstant = 8.314462618 # J/(mol K)
+referenceTemperature = 298.0 # K, the T in NIST's (T/298 K)^n
+
+# NIST activation energy units -> J/mol, keys are lowercased with spaces removed; K means the page gave Ea/R
+activationEnergyFactors = {
+    'j/mole': 1.0, 'j/mol': 1.0,
+    'kj/mole': 1000.0, 'kj/mol': 1000.0,
+    'cal/mole': 4.184, 'cal/mol': 4.184,
+    'kcal/mole': 4184.0, 'kcal/mol': 4184.0,
+    'k': gasConstant,
+}
+defaultActivationEnergyUnits = 'j/mole' # NIST's default, used for rows scraped before the units were kept
+
+# extracted columns the table is built from
+kineticSourceColumns = ['RecordID', 'Pre-Exp Factor Coeff', 'Pre-Exp Factor Power', 'Activation Energy',
+                        'Temperature', 'Temperature Max', 'Reaction Order', 'Temperature Ratio Exponent',
+                        'Activation Energy Units']
+
+
+def toNumbers(column: Optional[pandas.Series], length: int) -> np.ndarray:
+    # strings like '298 K' or ' -12' -> float64, anything unparsable (or a missing column) -> NaN
+    if column is None:
+        return np.full(length, np.nan)
+    if not pandas.api.types.is_numeric_dtype(column): # object or str dtype, pandas 3 reads text columns as str
+        column = column.astype(str).str.replace(r'[^0-9eE+\-.]', '', regex=True)
+    return pandas.to_numeric(column, errors='coerce').to_numpy(dtype=np.float64)
+
+
+class KineticsTable:
+    """
+    Modified Arrhenius parameters for every extracted NIST record, one float64 array per field
+
+    k(T) = A * (T/298 K)^n * exp(-Ea / RT), valid for Tmin <= T <= Tmax
+
+    Attributes:
+        recordIDs (np.ndarray): int64 RecordID per row
+        A (np.ndarray): pre-exponential factor, coeff * 10^power, in the record's own units
+        n (np.ndarray): temperature exponent, 0 where the record has no (T/298 K)^n term
+        Ea (np.ndarray): activation energy in J/mol, 0 where the record has no exponential term
+        Tmin, Tmax (np.ndarray): valid temperature range in K, NaN when unknown (no limit on that side)
+        order (np.ndarray): reaction order, NaN when unknown
+    """
+
+    fields = ['recordIDs', 'A', 'n', 'Ea', 'Tmin', 'Tmax', 'order']
+
+    def __init__(self, recordIDs: np.ndarray, A: np.ndarray, n: np.ndarray, Ea: np.ndarray,
+                 Tmin: np.ndarray, Tmax: np.ndarray, order: np.ndarray):
+        self.recordIDs = np.asarray(recordIDs, dtype=np.int64)
+        self.A = np.asarray(A, dtype=np.float64)
+        self.n = np.asarray(n, dtype=np.float64)
+        self.Ea = np.asarray(Ea, dtype=np.float64)
+        self.Tmin = np.asarray(Tmin, dtype=np.float64)
+        self.Tmax = np.asarray(Tmax, dtype=np.float64)
+        self.order = np.asarray(order, dtype=np.float64)
+        # cached for evaluation: ln A and Ea/R per row
+        self.logA = np.log(self.A, where=self.A > 0, out=np.full_like(self.A, np.nan))
+        self.activationTemperature = self.Ea / gasConstant
+
+    def __len__(self) -> int:
+        return len(self.recordIDs)
+
+    @classmethod
+    def fromExtracted(cls, dataframe: pandas.DataFrame, dropIncomplete: bool = True) -> 'KineticsTable':
+        """
+        Builds the table from the scraper's columns in one vectorized pass, no per-row Python
+
+        Records without a usable A ('Parse Error', 'Url Fetch Error', missing) are dropped unless dropIncomplete is False.
+        A missing n or Ea means the page had no such term, so they become 0. A single temperature (no upper bound)
+        becomes Tmin == Tmax.
+
+        Args:
+            dataframe (pandas.DataFrame): extracted NIST table (NIST Extracted / Filtered NIST Extracted)
+            dropIncomplete (bool): drop rows whose A isn't a number
+
+        Returns:
+            KineticsTable: one row per kept record, in dataframe order
+        """
+        rowCount = len(dataframe)
+        column = lambda columnName: dataframe[columnName] if columnName in dataframe.columns else None
+
+        A = toNumbers(column('Pre-Exp Factor Coeff'), rowCount) * 10.0 ** toNumbers(column('Pre-Exp Factor Power'), rowCount)
+        n = np.nan_to_num(toNumbers(column('Temperature Ratio Exponent'), rowCount), nan=0.0)
+
+        # the page shows exp(x [units]/RT), so Ea = -x converted to J/mol
+        exponentValues = np.nan_to_num(toNumbers(column('Activation Energy'), rowCount), nan=0.0)
+        unitColumn = column('Activation Energy Units')
+        if unitColumn is None:
+            unitFactors = np.full(rowCount, activationEnergyFactors[defaultActivationEnergyUnits])
+        else:
+            unitKeys = unitColumn.fillna('').astype(str).str.lower().str.replace(' ', '', regex=False)
+            unitKeys = unitKeys.where(unitKeys != '', defaultActivationEnergyUnits)
+            unitFactors = unitKeys.map(activationEnergyFactors).to_numpy(dtype=np.float64) # unknown units -> NaN
+        Ea = -exponentValues * unitFactors
+
+        Tmin = toNumbers(column('Temperature'), rowCount)
+        Tmax = toNumbers(column('Temperature Max'), rowCount)
+        Tmax = np.where(np.isnan(Tmax), Tmin, Tmax)
+        order = toNumbers(column('Reaction Order'), rowCount)
+        recordIDs = toNumbers(column('RecordID'), rowCount)
+
+        keep = np.isfinite(A) & np.isfinite(recordIDs) if dropIncomplete else np.ones(rowCount, dtype=bool)
+        return cls(np.nan_to_num(recordIDs[keep], nan=-1).astype(np.int64), A[keep], n[keep], Ea[keep],
+                   Tmin[keep], Tmax[keep], order[keep])
+
+    @classmethod
+    def fromTable(cls, tablePath: str, **options) -> 'KineticsTable':
+        # only the kinetic columns get loaded (for parquet/arrow the rest of the file isn't even read)
+        presentColumns = set(tableColumns(tablePath))
+        return cls.fromExtracted(readTable(tablePath, columns=[columnName for columnName in kineticSourceColumns if columnName in presentColumns]),
+                                 **options)
+
+    def save(self, tablePath: str) -> None:
+        np.savez(tablePath, **{field: getattr(self, field) for field in self.fields})
+
+    @classmethod
+    def load(cls, tablePath: str) -> 'KineticsTable':
+        with np.load(tablePath) as arrays:
+            return cls(*(arrays[field] for field in cls.fields))
+
+    def rateConstants(self, temperatures: np.ndarray, respectRange: bool = True, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        k(T) for every record at every temperature, as one broadcast expression over a (records, temperatures) grid
+
+        Done in log space: ln k = ln A + n ln(T/298) - (Ea/R)/T, then a single exp, so it's three fused passes
+        over the grid and no overflow in the intermediate (T/298)^n or exp terms.
+
+        Args:
+            temperatures (np.ndarray): 1D grid in K
+            respectRange (bool): NaN outside each record's [Tmin, Tmax], unknown bounds don't limit anything
+            out (Optional[np.ndarray]): (len(self), len(temperatures)) float64 buffer to reuse between calls
+
+        Returns:
+            np.ndarray: (records, temperatures) rate constants, in each record's own A units
+        """
+        temperatures = np.asarray(temperatures, dtype=np.float64)
+        gridShape = (len(self), len(temperatures))
+        if out is None:
+            out = np.empty(gridShape, dtype=np.float64)
+        elif out.shape != gridShape:
+            raise ValueError(f"out has shape {out.shape}, expected {gridShape}")
+
+        np.multiply(self.n[:, None], np.log(temperatures / referenceTemperature)[None, :], out=out)
+        out -= self.activationTemperature[:, None] * (1.0 / temperatures)[None, :]
+        out += self.logA[:, None]
+        np.exp(out, out=out)
+
+        if respectRange:
+            outOfRange = (temperatures[None, :] < self.Tmin[:, None]) | (temperatures[None, :] > self.Tmax[:, None])
+            out[outOfRange] = np.nan # comparisons with NaN bounds are False, so unknown bounds never mask
+        return out
+
+    def rateConstantsAt(self, temperatures: np.ndarray, respectRange: bool = True) -> np.ndarray:
+        """
+        k at one temperature per record (eg. each record's own measurement temperature), elementwise, no grid
+
+        Returns:
+            np.ndarray: (records,) rate constants
+        """
+        temperatures = np.broadcast_to(np.asarray(temperatures, dtype=np.float64), self.A.shape)
+        rateConstants = np.exp(self.logA + self.n * np.log(temperatures / referenceTemperature) - self.activationTemperature / temperatures)
+        if respectRange:
+            rateConstants[(temperatures < self.Tmin) | (temperatures > self.Tmax)] = np.nan
+        return rateConstants
+
+    def toDataframe(self) -> pandas.DataFrame:
+        return pandas.DataFrame({'RecordID': self.recordIDs, 'A': self.A, 'n': self.n, 'Ea [J/mol]': self.Ea,
+                                 'Tmin [K]': self.Tmin, 'Tmax [K]': self.Tmax, 'Reaction Order': self.order})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the numeric kinetics table from the extracted NIST data')
+    parser.add_argument('--input', default='Filtered NIST Extracted.csv')
+    parser.add_argument('--output', default='kinetics.npz')
+    parser.add_argument('--grid', type=int, default=0, help='also time k(T) over this many temperatures (200-3000 K)')
+    args = parser.parse_args()
+
+    kineticsTable = KineticsTable.fromTable(args.input)
+    kineticsTable.save(args.output)
+    print(f"{len(kineticsTable)} records with usable kinetics written to {args.output}")
+
+    if args.grid:
+        temperatureGrid = np.linspace(200.0, 3000.0, args.grid)
+        startTime = time.perf_counter()
+        rateConstants = kineticsTable.rateConstants(temperatureGrid)
+        elapsedSeconds = time.perf_counter() - startTime
+        print(f"k(T) for {len(kineticsTable)} x {args.grid} grid in {elapsedSeconds:.4f} s, "
+              f"{int(np.isfinite(rateConstants).sum())} values in range")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import multiprocessing  # spawned workers, see opsinPool
+import os  # cpu count for the worker pool
+import time  # throughput numbers
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from backends import getOpsin  # one warm PyOpsin per process, started on first use
+from instrumentation import metrics
+
+
+def cleanOpsinResult(smiles: Union[None, str, List[Optional[str]]]) -> Optional[str]:
+    # opsin hands back None or '' when it can't parse a name, both mean failure; to_smiles on a single str wraps
+    # the answer in a one-element list, so that gets unwrapped first ([None] is a failure too)
+    if isinstance(smiles, (list, tuple)):
+        smiles = smiles[0] if len(smiles) == 1 else None
+    return str(smiles) if smiles else None
+
+
+def opsinChunk(names: List[str]) -> List[Optional[str]]:
+    """
+    Converts one chunk of names, this is what each worker process gets handed
+
+    OPSIN has no batch call (pyopsin's to_smiles on a list just loops over to_smiles_single), so it's one name at
+    a time here too; the chunk only means one task (one pickle round trip) per chunkSize names, and the speedup over
+    IUPAC2SMILES is the pool's. A name that makes OPSIN throw comes back None without failing the rest.
+
+    Returns:
+        List[Optional[str]]: SMILES or None for each name, same order as names
+    """
+    opsinObj = getOpsin()
+    results = []
+    for name in names:
+        try:
+            results.append(cleanOpsinResult(opsinObj.to_smiles_single(name)))
+        except Exception:
+            results.append(None)
+    return results
+
+
+def opsinPool(workers: Optional[int] = None) -> Optional[ProcessPoolExecutor]:
+    # a pool to hand to several opsinBatchResolve calls, so the worker JVMs start once per run instead of once per
+    # call; None on one cpu, where the names are converted in this process anyway. The caller shuts it down.
+    # Workers are spawned, not forked: a fork of a process that already started its JVM hangs on the first opsin call
+    workers = workers or os.cpu_count() or 1
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) if workers > 1 else None
+
+
+def opsinBatchResolve(names: Iterable[str], chunkSize: int = 1000, workers: Optional[int] = None,
+                      executor: Optional[Executor] = None) -> Tuple[Dict[str, Optional[str]], Dict[str, float]]:
+    """
+    Converts a lot of IUPAC names to SMILES with OPSIN, in chunks spread over a process pool (each worker keeps its
+    JVM warm across chunks); on one cpu it's the same one-name-at-a-time work as IUPAC2SMILES, minus cirpy
+
+    Args:
+        names (Iterable[str]): names to convert, duplicates are collapsed
+        chunkSize (int): names per worker task, bigger = fewer pickle round trips
+        workers (Optional[int]): worker processes (each keeps its own PyOpsin), all cpus if None, 1 runs in this process
+        executor (Optional[Executor]): an open pool (eg. from opsinPool) to run the chunks on instead of starting one,
+            it's left running for the next call and workers is ignored
+
+    Returns:
+        Tuple with:
+        - opsinResults (Dict[str, Optional[str]]): name -> SMILES, None where OPSIN couldn't parse it
+        - opsinStats (Dict[str, float]): names, seconds and names per second
+    """
+    uniqueNames = list(dict.fromkeys(names))
+    chunks = [uniqueNames[chunkStart:chunkStart + chunkSize] for chunkStart in range(0, len(uniqueNames), chunkSize)]
+    workers = min(workers or os.cpu_count() or 1, max(1, len(chunks)))
+
+    startTime = time.perf_counter()
+    if executor is not None:
+        chunkResults = list(executor.map(opsinChunk, chunks))
+    elif workers <= 1:
+        chunkResults = [opsinChunk(chunk) for chunk in chunks]
+    else:
+        with opsinPool(workers) as executor:
+            chunkResults = list(executor.map(opsinChunk, chunks))
+    elapsedSeconds = time.perf_counter() - startTime
+
+    opsinResults = {}
+    for chunk, results in zip(chunks, chunkResults):
+        opsinResults.update(zip(chunk, results))
+    metrics.addTime('resolver/opsin batch', elapsedSeconds)
+    parsedCount = sum(smiles is not None for smiles in opsinResults.values())
+    metrics.resolverResult('opsin', True, parsedCount)
+    metrics.resolverResult('opsin', False, len(uniqueNames) - parsedCount)
+
+    opsinStats = {
+        'names': len(uniqueNames),
+        'seconds': round(elapsedSeconds, 3),
+        'names per second': round(len(uniqueNames) / elapsedSeconds, 1) if elapsedSeconds > 0 else 0.0
+    }
+    return opsinResults, opsinStats
@@ -0,0 +1,232 @@
+import argparse  # command line options
+import ast  # mechanism cells are Python list literals
+import csv
+import json
+import re as regex
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas
+
+try:
+    from rdkit import Chem
+    from rdkit import RDLogger
+    RDLogger.DisableLog('rdApp.*')
+except ImportError: # without rdkit the map numbers get stripped with a regex and SMILES are compared as written
+    Chem = None
+
+from speciesRegistry import cleanReagentCell, productColumns, reactantColumns
+
+# pathways dataset columns (mech-USPTO-31K style), override with the options if a release names them differently
+defaultMechanismColumn = 'mechanism' # list of atom-mapped elementary steps, 'reactants>>products' each
+defaultReactionColumn = 'updated_reaction' # atom-mapped overall reaction
+defaultClassColumn = 'mechanistic_class'
+
+atomMapPattern = regex.compile(r'(\[[^\]:]+):\d+\]')
+csv.field_size_limit(sys.maxsize) # some mechanisms are long
+
+canonicalComponents = {} # component SMILES -> canonical map-free SMILES, most components repeat thousands of times
+
+
+def canonicalComponent(smiles: str) -> str:
+    # one '.'-free molecule, atom maps dropped, rdkit canonical when it parses
+    canonical = canonicalComponents.get(smiles)
+    if canonical is None:
+        canonical = atomMapPattern.sub(r'\1]', smiles)
+        if Chem is not None:
+            molecule = Chem.MolFromSmiles(smiles)
+            if molecule is not None:
+                for atom in molecule.GetAtoms():
+                    atom.SetAtomMapNum(0)
+                canonical = Chem.MolToSmiles(molecule)
+        canonicalComponents[smiles] = canonical
+    return canonical
+
+
+def sideKey(smilesList: List[str]) -> str:
+    # order-independent key for one side of a reaction: sorted canonical components joined with '.'
+    return '.'.join(sorted(canonicalComponent(component) for smiles in smilesList if smiles
+                           for component in smiles.split('.') if component))
+
+
+def reactionKeys(reactionSMILES: str) -> Tuple[str, str]:
+    """
+    'A.B>C>D' or 'A.B>>D' -> (reactant key, product key), agents in the middle are ignored
+
+    Returns:
+        Tuple with the canonical reactant side and product side keys
+    """
+    reactionParts = reactionSMILES.split('>')
+    if len(reactionParts) != 3:
+        return '', ''
+    return sideKey([reactionParts[0]]), sideKey([reactionParts[2]])
+
+
+def parseMechanism(mechanismCell: str) -> List[str]:
+    # "['a>>b', 'b>>c']" (how pandas wrote the lists out), a JSON list, or steps separated by whitespace / '|'
+    mechanismCell = (mechanismCell or '').strip()
+    if mechanismCell.startswith('['):
+        try:
+            return [str(step) for step in ast.literal_eval(mechanismCell)]
+        except (ValueError, SyntaxError):
+            return [str(step) for step in json.loads(mechanismCell)]
+    return [step for step in regex.split(r'[\s|]+', mechanismCell) if step]
+
+
+def readPathways(pathwaysPath: str, mechanismColumn: str = defaultMechanismColumn, reactionColumn: str = defaultReactionColumn,
+                 classColumn: str = defaultClassColumn) -> Iterator[Tuple[int, str, str, List[str]]]:
+    """
+    Streams the pathways dataset one reaction at a time, .csv or .jsonl, never holding the whole file
+
+    Returns:
+        Iterator: (pathwayID, mechanistic class, atom-mapped overall reaction, atom-mapped step SMILES) per reaction,
+        pathwayID being the row number in the file
+    """
+    with open(pathwaysPath, 'r', encoding='utf-8', newline='') as pathwaysFile:
+        if pathwaysPath.endswith('.jsonl') or pathwaysPath.endswith('.json'):
+            rows = (json.loads(line) for line in pathwaysFile if line.strip())
+        else:
+            rows = csv.DictReader(pathwaysFile)
+        for pathwayID, row in enumerate(rows):
+            steps = row.get(mechanismColumn)
+            steps = parseMechanism(steps) if isinstance(steps, str) else list(steps or [])
+            yield pathwayID, row.get(classColumn) or '', row.get(reactionColumn) or '', steps
+
+
+def iterSteps(pathwaysPath: str, **columns) -> Iterator[Tuple[int, int, str]]:
+    """
+    Flattens readPathways into elementary steps
+
+    Returns:
+        Iterator: (pathwayID, step number from 0, atom-mapped step SMILES) per step
+    """
+    for pathwayID, mechanismClass, reactionSMILES, steps in readPathways(pathwaysPath, **columns):
+        for stepNumber, stepSMILES in enumerate(steps):
+            yield pathwayID, stepNumber, stepSMILES
+
+
+class PathwayIndex:
+    """
+    Hash index from canonical reactant/product keys to mechanism steps and whole pathways
+
+    Every elementary step is indexed by (reactant key, product key) and by its reactant key alone, and every pathway by
+    its overall reaction, so a lookup is a dict hit. Steps are kept as two flat arrays, the step SMILES themselves
+    stay in the file.
+
+    Attributes:
+        stepPathways (np.ndarray): int32 pathwayID per step
+        stepNumbers (np.ndarray): int16 position of the step in its mechanism
+        pathwayClasses (List[str]): mechanistic class per pathwayID
+    """
+
+    def __init__(self):
+        self.stepPathways = []
+        self.stepNumbers = []
+        self.pathwayClasses = []
+        self.stepsByReaction = defaultdict(list) # (reactant key, product key) -> step rows
+        self.stepsByReactants = defaultdict(list) # reactant key -> step rows
+        self.pathwaysByReaction = defaultdict(list) # (reactant key, product key) of the overall reaction -> pathwayIDs
+
+    @classmethod
+    def build(cls, pathwaysPath: str, **columns) -> 'PathwayIndex':
+        pathwayIndex = cls()
+        for pathwayID, mechanismClass, reactionSMILES, steps in readPathways(pathwaysPath, **columns):
+            pathwayIndex.pathwayClasses.append(mechanismClass)
+            if reactionSMILES:
+                pathwayIndex.pathwaysByReaction[reactionKeys(reactionSMILES)].append(pathwayID)
+            for stepNumber, stepSMILES in enumerate(steps):
+                stepRow = len(pathwayIndex.stepPathways)
+                stepKeys = reactionKeys(stepSMILES)
+                pathwayIndex.stepPathways.append(pathwayID)
+                pathwayIndex.stepNumbers.append(stepNumber)
+                pathwayIndex.stepsByReaction[stepKeys].append(stepRow)
+                pathwayIndex.stepsByReactants[stepKeys[0]].append(stepRow)
+        pathwayIndex.stepPathways = np.array(pathwayIndex.stepPathways, dtype=np.int32)
+        pathwayIndex.stepNumbers = np.array(pathwayIndex.stepNumbers, dtype=np.int16)
+        return pathwayIndex
+
+    def __len__(self) -> int:
+        return len(self.stepPathways)
+
+    def lookup(self, reactantKey: str, productKey: str) -> Tuple[str, List[int]]:
+        """
+        Candidates for one reaction, most specific match first
+
+        Returns:
+            Tuple with:
+            - matchType (str): 'pathway' (overall reaction of a mechanism), 'step' (an elementary step), 'reactants'
+              (steps starting from the same species) or 'unmatched'
+            - candidates (List[int]): pathwayIDs for 'pathway', step rows otherwise
+        """
+        if not reactantKey:
+            return 'unmatched', []
+        candidates = self.pathwaysByReaction.get((reactantKey, productKey))
+        if candidates:
+            return 'pathway', candidates
+        candidates = self.stepsByReaction.get((reactantKey, productKey))
+        if candidates:
+            return 'step', candidates
+        candidates = self.stepsByReactants.get(reactantKey)
+        if candidates:
+            return 'reactants', candidates
+        return 'unmatched', []
+
+
+def joinReactions(dataframe: pandas.DataFrame, pathwayIndex: PathwayIndex) -> Tuple[pandas.DataFrame, Dict[str, int]]:
+    """
+    Hash join of NIST reactions (reagent cells already SMILES, ie. processed.csv) against the pathway index
+
+    Returns:
+        Tuple with:
+        - matches (pandas.DataFrame): RecordID, Match Type, Candidates, Ambiguous, Pathway ID, Step; one row per
+          candidate, unmatched reactions get a single row with no pathway
+        - joinStats (Dict[str, int]): reactions per match type plus ambiguous (candidates from more than one pathway)
+    """
+    recordIDs = dataframe['RecordID'].to_numpy()
+    reactantCells = dataframe[reactantColumns].fillna('').astype(str).to_numpy()
+    productCells = dataframe[productColumns].fillna('').astype(str).to_numpy()
+
+    joinStats = {'reactions': len(dataframe), 'pathway': 0, 'step': 0, 'reactants': 0, 'unmatched': 0, 'ambiguous': 0}
+    matchRows = []
+    for recordID, reactantRow, productRow in zip(recordIDs, reactantCells, productCells):
+        matchType, candidates = pathwayIndex.lookup(sideKey([cleanReagentCell(cell) for cell in reactantRow]),
+                                                    sideKey([cleanReagentCell(cell) for cell in productRow]))
+        joinStats[matchType] += 1
+        if matchType == 'pathway':
+            candidatePairs = [(pathwayID, -1) for pathwayID in candidates]
+        else:
+            candidatePairs = [(int(pathwayIndex.stepPathways[stepRow]), int(pathwayIndex.stepNumbers[stepRow])) for stepRow in candidates]
+        isAmbiguous = len({pathwayID for pathwayID, stepNumber in candidatePairs}) > 1
+        joinStats['ambiguous'] += isAmbiguous
+        for pathwayID, stepNumber in candidatePairs or [(-1, -1)]:
+            matchRows.append((recordID, matchType, len(candidatePairs), isAmbiguous, pathwayID, stepNumber))
+    matches = pandas.DataFrame(matchRows, columns=['RecordID', 'Match Type', 'Candidates', 'Ambiguous', 'Pathway ID', 'Step'])
+    return matches, joinStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Match NIST reactions to mechanisms in the reaction pathways dataset')
+    parser.add_argument('--pathways', required=True, help='pathways dataset, .csv or .jsonl')
+    parser.add_argument('--input', default='processed.csv', help='NIST reactions with SMILES reagent cells')
+    parser.add_argument('--output', default='pathway matches.csv')
+    parser.add_argument('--mechanism-column', default=defaultMechanismColumn)
+    parser.add_argument('--reaction-column', default=defaultReactionColumn)
+    parser.add_argument('--class-column', default=defaultClassColumn)
+    args = parser.parse_args()
+
+    startTime = time.perf_counter()
+    pathwayIndex = PathwayIndex.build(args.pathways, mechanismColumn=args.mechanism_column,
+                                      reactionColumn=args.reaction_column, classColumn=args.class_column)
+    print(f"Indexed {len(pathwayIndex)} steps from {len(pathwayIndex.pathwayClasses)} pathways in {time.perf_counter() - startTime:.2f} s")
+
+    from tableStore import readTable, writeTable
+    startTime = time.perf_counter()
+    matches, joinStats = joinReactions(readTable(args.input, columns=['RecordID'] + reactantColumns + productColumns), pathwayIndex)
+    writeTable(matches, args.output)
+    print(f"Join statistics: {joinStats}, {time.perf_counter() - startTime:.2f} s")
+
+if __name__ == '__main__':
+    main()
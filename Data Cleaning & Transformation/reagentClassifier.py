@@ -0,0 +1,69 @@
+import numpy as np
+import pandas
+from typing import List
+
+reagentColumns = ['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3']
+
+# per-cell categories
+EMPTY = 'empty' # NaN, not a string, or only whitespace
+NO_LETTERS = 'no-letters' # eg. '(.)' or a stray number, nothing to convert
+IUPAC = 'IUPAC' # mostly lowercase letters, eg. 2-methylpentane -> opsin/cirpy
+STRUCTURAL = 'structural' # mostly uppercase letters, eg. AlBr, CH3OH -> cactus/pubchem
+
+def classifyNames(names: np.ndarray) -> np.ndarray:
+    """
+    Classifies an array of distinct strings in one go by looking at their raw unicode code points
+
+    simple, IUPAC names (eg. 2-methylpentante) have mostly lowercase letters,
+    structural formulas have at most 1/2 lowercase letters (eg. AlBr)
+    so that's how I sort them
+
+    Args:
+        names (np.ndarray): 1D object array of str
+
+    Returns:
+        np.ndarray: 1D object array of categories, same length as names
+    """
+    categories = np.full(len(names), EMPTY, dtype=object)
+    if len(names) == 0:
+        return categories
+
+    # fixed width unicode array -> one uint32 code point per character, padded with 0s
+    fixedWidthNames = np.array(names, dtype=str)
+    codePoints = fixedWidthNames.view(np.uint32).reshape(len(names), -1)
+    uppercaseCounts = ((codePoints >= ord('A')) & (codePoints <= ord('Z'))).sum(axis=1)
+    lowercaseCounts = ((codePoints >= ord('a')) & (codePoints <= ord('z'))).sum(axis=1)
+    letterCounts = uppercaseCounts + lowercaseCounts
+    isBlank = np.char.str_len(np.char.strip(fixedWidthNames)) == 0
+
+    categories[letterCounts == 0] = NO_LETTERS
+    # same ratio test as before: lowercase / letters >= 0.5, written without the division
+    categories[(letterCounts > 0) & (2 * lowercaseCounts >= letterCounts)] = IUPAC
+    categories[(letterCounts > 0) & (2 * lowercaseCounts < letterCounts)] = STRUCTURAL
+    categories[isBlank] = EMPTY
+    return categories
+
+def classifyReagents(dataframe: pandas.DataFrame, columns: List[str] = reagentColumns) -> pandas.DataFrame:
+    """
+    Sorts every reagent cell into empty / no-letters / IUPAC / structural in a single vectorized pass
+
+    All the columns get stacked into one long array, only the distinct strings get classified, and the
+    categories get spread back out, so a name showing up 5000 times is looked at once.
+
+    Args:
+        dataframe (pandas.DataFrame): NIST extract with the reagent columns
+        columns (List[str]): which columns to classify, the six reactant/product columns by default
+
+    Returns:
+        pandas.DataFrame: same index and columns as dataframe[columns], holding one category per cell
+    """
+    cellValues = dataframe[columns].to_numpy(dtype=object).ravel()
+    codes, uniqueValues = pandas.factorize(cellValues) # NaN gets code -1
+
+    uniqueValues = np.asarray(uniqueValues, dtype=object)
+    isString = np.array([isinstance(value, str) for value in uniqueValues], dtype=bool)
+    uniqueCategories = np.full(len(uniqueValues) + 1, EMPTY, dtype=object) # extra slot at the end for code -1
+    uniqueCategories[:-1][isString] = classifyNames(uniqueValues[isString])
+
+    cellCategories = uniqueCategories[codes].reshape(len(dataframe), len(columns))
+    return pandas.DataFrame(cellCategories, index=dataframe.index, columns=columns)
@@ -0,0 +1,125 @@
+import sqlite3  # persistent cache in one file, no server needed
+import time  # for negative result expiry
+import unicodedata  # name normalization
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from instrumentation import metrics
+
+defaultNegativeTTL = 30 * 24 * 3600 # a name nobody could resolve gets asked again after 30 days, in seconds
+
+
+def normalizeName(name: str) -> str:
+    """
+    Cache key for a reagent name: unicode NFC, whitespace runs collapsed, ends stripped
+
+    Case is kept on purpose, 'CO' and 'Co' are different things.
+    """
+    return ' '.join(unicodedata.normalize('NFC', name).split())
+
+
+class ResolutionCache:
+    """
+    Persistent name -> SMILES cache, remembers which resolver answered and also remembers failures
+
+    Successful resolutions never expire; failures (smiles NULL) expire after negativeTTL seconds so names
+    that cactus/opsin learn later get another chance.
+    """
+
+    def __init__(self, cachePath: str = 'resolution cache.sqlite', negativeTTL: float = defaultNegativeTTL):
+        self.cachePath = cachePath
+        self.negativeTTL = negativeTTL
+        self.connection = sqlite3.connect(cachePath)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS resolutions (
+                name TEXT PRIMARY KEY,
+                resolver TEXT,
+                smiles TEXT,
+                resolvedAt REAL NOT NULL
+            )''')
+        self.connection.commit()
+
+    def lookup(self, names: Iterable[str]) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """
+        Gets cached answers for a bunch of names at once
+
+        Args:
+            names (Iterable[str]): raw names, normalized here
+
+        Returns:
+            Dict[str, Tuple]: raw name -> (resolver, smiles) for every name with a live cache entry,
+                smiles is None for a remembered failure
+        """
+        normalizedNames = {name: normalizeName(name) for name in names}
+        uniqueKeys = list(set(normalizedNames.values()))
+        cachedRows = {}
+        expiryCutoff = time.time() - self.negativeTTL
+        for batchStart in range(0, len(uniqueKeys), 500): # sqlite caps the number of ? parameters
+            keyBatch = uniqueKeys[batchStart:batchStart + 500]
+            placeholders = ','.join('?' * len(keyBatch))
+            for name, resolver, smiles, resolvedAt in self.connection.execute(
+                    f'SELECT name, resolver, smiles, resolvedAt FROM resolutions WHERE name IN ({placeholders})', keyBatch):
+                if smiles is None and resolvedAt < expiryCutoff:
+                    continue # stale failure, worth another try
+                cachedRows[name] = (resolver, smiles)
+        return {name: cachedRows[key] for name, key in normalizedNames.items() if key in cachedRows}
+
+    def store(self, results: Dict[str, Tuple[Optional[str], Optional[str]]]) -> None:
+        """
+        Saves answers, overwriting older ones
+
+        Args:
+            results (Dict[str, Tuple]): raw name -> (resolver, smiles), smiles None records a failure
+        """
+        now = time.time()
+        self.connection.executemany('INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?)',
+                                    [(normalizeName(name), resolver, smiles, now) for name, (resolver, smiles) in results.items()])
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+
+def resolveUniqueNames(names: Iterable[str], resolveMissing: Callable[[List[str]], Dict[str, Tuple[Optional[str], Optional[str]]]],
+                       cache: Optional[ResolutionCache] = None) -> Tuple[Dict[str, Optional[str]], Dict[str, int]]:
+    """
+    Resolves every distinct name once, asking the cache first and the real resolvers only for what's left
+
+    Args:
+        names (Iterable[str]): names, duplicates are fine (they're collapsed here)
+        resolveMissing (Callable): takes the list of uncached names, returns name -> (resolver, smiles or None);
+            names it leaves out (eg. the lookup threw a network error) aren't cached, so they're retried next run
+        cache (Optional[ResolutionCache]): None means always ask the resolvers
+
+    Returns:
+        Tuple with:
+        - resolvedNames (Dict[str, Optional[str]]): name -> SMILES, None when nothing could resolve it
+        - resolutionStats (Dict[str, int]): unique names, cache hits, resolver lookups
+    """
+    uniqueNames = list(dict.fromkeys(names)) # dedupes, keeps first-seen order
+    with metrics.timer('cache/resolution lookup'):
+        cachedResults = cache.lookup(uniqueNames) if cache else {}
+    missingNames = [name for name in uniqueNames if name not in cachedResults]
+    if cache:
+        metrics.cacheResult('resolution', len(cachedResults), len(missingNames))
+
+    freshResults = resolveMissing(missingNames) if missingNames else {}
+    if cache and freshResults:
+        cache.store(freshResults)
+
+    resolvedNames = {name: smiles for name, (resolver, smiles) in cachedResults.items()}
+    resolvedNames.update({name: smiles for name, (resolver, smiles) in freshResults.items()})
+    for name in missingNames:
+        resolvedNames.setdefault(name, None)
+
+    resolutionStats = {
+        'unique names': len(uniqueNames),
+        'cache hits': len(cachedResults),
+        'resolver lookups': len(missingNames)
+    }
+    return resolvedNames, resolutionStats
@@ -0,0 +1,311 @@
+import argparse  # command line options
+import hashlib  # change detection per reaction
+import json  # vocabulary and metadata
+import os
+import re as regex
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from speciesRegistry import cleanReagentCell, productColumns, reactantColumns
+
+try:
+    import selfies  # pinned in requirements.txt, only needed for --tokens selfies
+except ImportError:
+    selfies = None
+
+specialTokens = ['<pad>', '<unk>', '<bos>', '<eos>'] # ids 0-3 in every vocabulary, padding is always 0
+PAD, UNK, BOS, EOS = range(len(specialTokens))
+reactionArrow = '>>'
+
+# the usual reaction SMILES tokenizer regex (bracket atoms, two-letter organic atoms, ring closures, bonds, ...)
+smilesTokenPattern = regex.compile(r"(\[[^\]]+]|Br?|Cl?|N|O|S|P|F|I|b|c|n|o|s|p|\(|\)|\.|=|#|-|\+|\\|/|:|~|@|\?|>>?|\*|\$|%[0-9]{2}|[0-9])")
+
+workerCanonical = {} # molecule SMILES -> rdkit canonical SMILES, per process
+
+
+def canonicalMolecule(smiles: str) -> str:
+    # rdkit canonical form when rdkit is there and parses it, as written otherwise
+    canonical = workerCanonical.get(smiles)
+    if canonical is None:
+        canonical = smiles
+        try:
+            from rdkit import Chem, RDLogger # imported here so only processes that encode pay for rdkit
+            RDLogger.DisableLog('rdApp.*')
+            molecule = Chem.MolFromSmiles(smiles)
+            if molecule is not None:
+                canonical = Chem.MolToSmiles(molecule)
+        except ImportError:
+            pass
+        workerCanonical[smiles] = canonical
+    return canonical
+
+
+def tokenizeSmiles(smiles: str) -> Optional[List[str]]:
+    # None if the regex doesn't cover every character (the string isn't SMILES)
+    tokens = smilesTokenPattern.findall(smiles)
+    return tokens if sum(map(len, tokens)) == len(smiles) else None
+
+
+def tokenizeMolecule(smiles: str, tokenizer: str) -> Optional[List[str]]:
+    if tokenizer == 'smiles':
+        return tokenizeSmiles(smiles)
+    try:
+        return list(selfies.split_selfies(selfies.encoder(smiles)))
+    except Exception: # selfies raises its own EncoderError, and chokes on some valences rdkit accepts
+        return None
+
+
+def tokenizeChunk(task: Tuple[List[Tuple[List[str], List[str]]], str, bool]) -> List[Optional[List[str]]]:
+    """
+    Tokens for one chunk of reactions, what each worker process gets handed
+
+    Each side's molecules are sorted (canonical when canonicalize is on) and joined with '.', sides are split by '>>',
+    so for SELFIES the '.' and '>>' are their own tokens between the molecules' SELFIES tokens.
+
+    Returns:
+        List[Optional[List[str]]]: token list per reaction, None where a molecule couldn't be tokenized
+    """
+    reactionChunk, tokenizer, canonicalize = task
+    tokenLists = []
+    for reactantSmiles, productSmiles in reactionChunk:
+        if not reactantSmiles and not productSmiles:
+            tokenLists.append(None) # nothing resolved, a bare '>>' would only teach the model padding
+            continue
+        reactionTokens = []
+        for sideNumber, sideSmiles in enumerate((reactantSmiles, productSmiles)):
+            if sideNumber:
+                reactionTokens.append(reactionArrow)
+            molecules = sorted(canonicalMolecule(smiles) if canonicalize else smiles
+                               for cell in sideSmiles for smiles in cell.split('.') if smiles)
+            for moleculeNumber, smiles in enumerate(molecules):
+                moleculeTokens = tokenizeMolecule(smiles, tokenizer)
+                if moleculeTokens is None:
+                    reactionTokens = None
+                    break
+                if moleculeNumber:
+                    reactionTokens.append('.')
+                reactionTokens.extend(moleculeTokens)
+            if reactionTokens is None:
+                break
+        tokenLists.append(reactionTokens)
+    return tokenLists
+
+
+def tokenizeReactions(reactions: List[Tuple[List[str], List[str]]], tokenizer: str = 'smiles', canonicalize: bool = True,
+                      chunkSize: int = 2000, workers: Optional[int] = None) -> List[Optional[List[str]]]:
+    """
+    Tokenizes every reaction, in chunks spread over a process pool
+
+    Args:
+        reactions (List[Tuple[List[str], List[str]]]): (reactant SMILES, product SMILES) per reaction
+        tokenizer (str): 'smiles' or 'selfies'
+        canonicalize (bool): rdkit canonical SMILES per molecule first
+        chunkSize (int): reactions per task
+        workers (Optional[int]): processes, all cpus if None, 1 runs in this process
+
+    Returns:
+        List[Optional[List[str]]]: token list per reaction, None where it couldn't be tokenized
+    """
+    if tokenizer == 'selfies' and selfies is None:
+        raise ImportError("SELFIES tokens need the selfies package (pip install selfies)")
+    tasks = [(reactions[chunkStart:chunkStart + chunkSize], tokenizer, canonicalize)
+             for chunkStart in range(0, len(reactions), chunkSize)]
+    workers = min(workers or os.cpu_count() or 1, max(1, len(tasks)))
+    if workers <= 1:
+        chunkResults = [tokenizeChunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunkResults = list(executor.map(tokenizeChunk, tasks))
+    return [tokenList for chunkResult in chunkResults for tokenList in chunkResult]
+
+
+def reactionHash(reactantSmiles: List[str], productSmiles: List[str]) -> int:
+    # what decides whether a reaction has to be encoded again
+    reactionSMILES = '.'.join(reactantSmiles) + reactionArrow + '.'.join(productSmiles)
+    return int.from_bytes(hashlib.blake2b(reactionSMILES.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def tokenDtype(vocabularySize: int) -> np.dtype:
+    return np.dtype(np.int16) if vocabularySize <= np.iinfo(np.int16).max + 1 else np.dtype(np.int32)
+
+
+class SequenceStore:
+    """
+    Directory of padded token id sequences, one row per reaction, opened memory-mapped
+
+    Layout:
+        tokens.npy: (reactions, maxLength) int16 (int32 once the vocabulary outgrows int16) token ids, <bos> ... <eos>
+            then <pad> (0)
+        lengths.npy: int32 sequence length per row including <bos>/<eos>, 0 for reactions that couldn't be tokenized
+        index.npz: recordIDs and reaction SMILES hashes per row
+        vocabulary.json: token per id, only ever appended to so ids stay valid across re-encodes
+        meta.json: tokenizer, canonicalize, length limit, dtype, counts
+
+    A torch Dataset over it only needs __len__ = len(store) and __getitem__ = store.sequence(row); torch.from_numpy
+    on a row or a slice of store.tokens wraps the mapped pages without copying.
+    """
+
+    def __init__(self, storeDirectory: str):
+        self.storeDirectory = storeDirectory
+        with open(os.path.join(storeDirectory, 'meta.json'), 'r', encoding='utf-8') as metaFile:
+            self.meta = json.load(metaFile)
+        with open(os.path.join(storeDirectory, 'vocabulary.json'), 'r', encoding='utf-8') as vocabularyFile:
+            self.vocabulary = json.load(vocabularyFile)
+        with np.load(os.path.join(storeDirectory, 'index.npz')) as index:
+            self.recordIDs = index['recordIDs']
+            self.reactionHashes = index['reactionHashes']
+        # read-only memory maps, pages come off the disk as rows are touched
+        self.tokens = np.load(os.path.join(storeDirectory, 'tokens.npy'), mmap_mode='r')
+        self.lengths = np.load(os.path.join(storeDirectory, 'lengths.npy'), mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self.recordIDs)
+
+    def sequence(self, row: int) -> np.ndarray:
+        # one padded row, a view into the map
+        return self.tokens[row]
+
+    def batch(self, rowStart: int, rowStop: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Contiguous rows trimmed to the longest sequence among them, both still views into the maps
+
+        Returns:
+            Tuple with the (rows, longest) token ids and the lengths
+        """
+        lengths = self.lengths[rowStart:rowStop]
+        longest = int(lengths.max()) if len(lengths) else 0
+        return self.tokens[rowStart:rowStop, :longest], lengths
+
+    def decode(self, row: int) -> List[str]:
+        return [self.vocabulary[tokenID] for tokenID in self.tokens[row, 1:max(int(self.lengths[row]) - 1, 1)]]
+
+
+def encodeTable(dataframe, storeDirectory: str, tokenizer: str = 'smiles', canonicalize: bool = True,
+                maxLength: Optional[int] = None, workers: Optional[int] = None) -> Dict[str, float]:
+    """
+    Encodes every reaction in dataframe into storeDirectory, reusing the rows of an existing store whose reaction SMILES
+    haven't changed (same RecordID, same hash, same tokenizer and length settings) so only new and changed reactions
+    get tokenized
+
+    Args:
+        dataframe (pandas.DataFrame): RecordID plus reagent columns holding SMILES (processed.csv)
+        storeDirectory (str): store to write (and update, if it's already there)
+        tokenizer (str): 'smiles' or 'selfies'
+        canonicalize (bool): rdkit canonical SMILES per molecule before tokenizing
+        maxLength (Optional[int]): longest sequence kept, including <bos>/<eos>, longer ones are truncated (and counted)
+            at this length; the longest sequence if None
+        workers (Optional[int]): tokenizer processes, all cpus if None
+
+    Returns:
+        Dict[str, float]: reactions, encoded, reused, failed, truncated, vocabulary, max length, seconds
+    """
+    startTime = time.perf_counter()
+    os.makedirs(storeDirectory, exist_ok=True)
+    recordIDs = dataframe['RecordID'].to_numpy(dtype=np.int64)
+    reactantCells = dataframe[reactantColumns].fillna('').astype(str).to_numpy()
+    productCells = dataframe[productColumns].fillna('').astype(str).to_numpy()
+    reactions = [([smiles for smiles in map(cleanReagentCell, reactantRow) if smiles],
+                  [smiles for smiles in map(cleanReagentCell, productRow) if smiles])
+                 for reactantRow, productRow in zip(reactantCells, productCells)]
+    reactionHashes = np.array([reactionHash(*reaction) for reaction in reactions], dtype=np.uint64)
+
+    # rows of the previous encode that can be copied over as they are
+    previousStore = None
+    previousRows = np.full(len(reactions), -1, dtype=np.int64)
+    vocabulary = list(specialTokens)
+    if os.path.exists(os.path.join(storeDirectory, 'meta.json')):
+        previousStore = SequenceStore(storeDirectory)
+        previousSettings = (previousStore.meta['tokenizer'], previousStore.meta['canonicalize'], previousStore.meta.get('length limit'))
+        if previousSettings == (tokenizer, canonicalize, maxLength):
+            vocabulary = list(previousStore.vocabulary)
+            rowOfRecord = {recordID: row for row, recordID in enumerate(previousStore.recordIDs.tolist())}
+            candidateRows = np.array([rowOfRecord.get(recordID, -1) for recordID in recordIDs.tolist()], dtype=np.int64)
+            unchanged = (candidateRows >= 0) & (previousStore.reactionHashes[np.maximum(candidateRows, 0)] == reactionHashes)
+            previousRows = np.where(unchanged, candidateRows, -1)
+        else:
+            previousStore = None # different tokens or truncation, nothing to reuse
+
+    encodeRows = np.flatnonzero(previousRows < 0)
+    tokenLists = tokenizeReactions([reactions[row] for row in encodeRows], tokenizer, canonicalize, workers=workers)
+
+    # grow the vocabulary in first-seen order, existing ids never move
+    tokenIDs = {token: tokenID for tokenID, token in enumerate(vocabulary)}
+    encodedIDs = []
+    for tokenList in tokenLists:
+        if tokenList is None:
+            encodedIDs.append(None)
+            continue
+        for token in tokenList:
+            if token not in tokenIDs:
+                tokenIDs[token] = len(vocabulary)
+                vocabulary.append(token)
+        encodedIDs.append([BOS] + [tokenIDs[token] for token in tokenList] + [EOS])
+
+    encodedLengths = np.array([len(ids) if ids is not None else 0 for ids in encodedIDs], dtype=np.int32)
+    reusedMask = previousRows >= 0
+    reusedLengths = np.asarray(previousStore.lengths)[previousRows[reusedMask]] if previousStore is not None else np.zeros(0, dtype=np.int32)
+    longest = int(max(encodedLengths.max(initial=0), reusedLengths.max(initial=0)))
+    rowLength = min(longest, maxLength) if maxLength else longest
+
+    # written next to the old store and swapped in at the end, the old tokens stay mapped while rows are copied out
+    dtype = tokenDtype(len(vocabulary))
+    tokensPath = os.path.join(storeDirectory, 'tokens.npy')
+    tokenMatrix = np.lib.format.open_memmap(tokensPath + '.tmp', mode='w+', dtype=dtype, shape=(len(reactions), rowLength))
+    lengths = np.zeros(len(reactions), dtype=np.int32)
+    truncated = 0
+    for row, ids in zip(encodeRows.tolist(), encodedIDs):
+        if ids is None:
+            continue
+        if len(ids) > rowLength:
+            ids = ids[:rowLength - 1] + [EOS]
+            truncated += 1
+        tokenMatrix[row, :len(ids)] = ids
+        lengths[row] = len(ids)
+    if reusedMask.any():
+        reusedRows = np.flatnonzero(reusedMask)
+        copyLength = min(rowLength, previousStore.tokens.shape[1])
+        for blockStart in range(0, len(reusedRows), 8192):
+            blockRows = reusedRows[blockStart:blockStart + 8192]
+            tokenMatrix[blockRows, :copyLength] = previousStore.tokens[previousRows[blockRows], :copyLength]
+        lengths[reusedMask] = np.minimum(reusedLengths, rowLength)
+        cutRows = reusedRows[reusedLengths > rowLength]
+        tokenMatrix[cutRows, rowLength - 1] = EOS
+        truncated += len(cutRows)
+    tokenMatrix.flush()
+    del tokenMatrix
+    if previousStore is not None:
+        del previousStore # drop the old maps before the files under them get replaced
+
+    os.replace(tokensPath + '.tmp', tokensPath)
+    np.save(os.path.join(storeDirectory, 'lengths.npy'), lengths)
+    np.savez(os.path.join(storeDirectory, 'index.npz'), recordIDs=recordIDs, reactionHashes=reactionHashes)
+    with open(os.path.join(storeDirectory, 'vocabulary.json'), 'w', encoding='utf-8') as vocabularyFile:
+        json.dump(vocabulary, vocabularyFile, ensure_ascii=False, indent=0)
+    encodeStats = {'reactions': len(reactions), 'encoded': len(encodeRows), 'reused': int(reusedMask.sum()),
+                   'failed': int((lengths == 0).sum()), 'truncated': truncated,
+                   'vocabulary': len(vocabulary), 'max length': rowLength, 'seconds': round(time.perf_counter() - startTime, 3)}
+    with open(os.path.join(storeDirectory, 'meta.json'), 'w', encoding='utf-8') as metaFile:
+        json.dump({'tokenizer': tokenizer, 'canonicalize': canonicalize, 'length limit': maxLength, 'dtype': dtype.name, **encodeStats}, metaFile, indent=2)
+    return encodeStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tokenize processed.csv reactions into padded, memory-mappable id sequences')
+    parser.add_argument('--input', default='processed.csv', help='reagent cells hold resolved SMILES')
+    parser.add_argument('--output', default='sequences', help='store directory, updated in place if it exists')
+    parser.add_argument('--tokens', choices=['smiles', 'selfies'], default='smiles')
+    parser.add_argument('--as-written', action='store_true', help="don't canonicalize each molecule with rdkit first")
+    parser.add_argument('--max-length', type=int, default=None, help='truncate longer sequences (default: longest sequence)')
+    parser.add_argument('--workers', type=int, default=None, help='tokenizer processes (default: all cpus)')
+    args = parser.parse_args()
+
+    from tableStore import readTable
+    dataframe = readTable(args.input, columns=['RecordID'] + reactantColumns + productColumns)
+    encodeStats = encodeTable(dataframe, args.output, args.tokens, not args.as_written, args.max_length, args.workers)
+    print(f"Sequence store statistics: {encodeStats}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+import argparse  # command line options
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas
+
+from fingerprintStore import FingerprintStore
+from kineticsTable import KineticsTable
+
+
+def popcounts(packedRows: np.ndarray) -> np.ndarray:
+    # set bits per packed uint8 row
+    return np.bitwise_count(packedRows).sum(axis=1, dtype=np.int64)
+
+
+def tanimotoBound(queryCounts: np.ndarray, lowCounts: np.ndarray, highCounts: np.ndarray) -> np.ndarray:
+    """
+    Best Tanimoto any row with lowCount..highCount set bits could reach against each query: min(a, b) / max(a, b)
+    at the closest b, since |A & B| <= min(a, b) and |A | B| >= max(a, b)
+
+    Returns:
+        np.ndarray: (queries, blocks) upper bounds
+    """
+    queryCounts = queryCounts[:, None].astype(np.float64)
+    closestCounts = np.clip(queryCounts, lowCounts[None, :], highCounts[None, :])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bounds = np.minimum(queryCounts, closestCounts) / np.maximum(queryCounts, closestCounts)
+    return np.nan_to_num(bounds, nan=0.0)
+
+
+class SimilarityIndex:
+    """
+    Top-k Tanimoto search over packed reaction fingerprints
+
+    Identical fingerprints (the same reaction measured many times) are searched once. The distinct rows are sorted by
+    bit count and cut into blocks; a query batch is scored against a block with one float32 matrix multiply on the
+    unpacked bits (|A & B| = A . B), and whole blocks get skipped when the bit-count bound says nothing in them can beat
+    every query's current k-th best. Results are exact, the bound never prunes a row that could make the top k.
+
+    Args:
+        packedRows (np.ndarray): (rows, bytes) np.packbits fingerprints, eg. FingerprintStore.matrix('reaction morgan')
+        recordIDs (np.ndarray): RecordID per row
+        bitCount (int): fingerprint length in bits
+        blockRows (int): distinct fingerprints per block
+        cacheMB (float): unpacked float32 blocks kept in memory up to this size, the rest get unpacked per query batch
+    """
+
+    def __init__(self, packedRows: np.ndarray, recordIDs: np.ndarray, bitCount: int, blockRows: int = 4096, cacheMB: float = 512):
+        self.bitCount = bitCount
+        self.recordIDs = np.asarray(recordIDs, dtype=np.int64)
+        packedRows = np.ascontiguousarray(packedRows)
+
+        # distinct fingerprints, sorted by bit count, plus distinct -> rows lists (CSR style)
+        rowBytes = packedRows.shape[1]
+        _, firstRows, inverse = np.unique(packedRows.view(f'V{rowBytes}').ravel(), return_index=True, return_inverse=True)
+        uniquePacked = packedRows[firstRows]
+        uniqueCounts = popcounts(uniquePacked)
+        countOrder = np.argsort(uniqueCounts, kind='stable')
+        self.uniquePacked = uniquePacked[countOrder]
+        self.uniqueCounts = uniqueCounts[countOrder]
+        uniquePosition = np.empty_like(countOrder)
+        uniquePosition[countOrder] = np.arange(len(countOrder))
+        rowUnique = uniquePosition[inverse.ravel()]
+        self.rowsByUnique = np.argsort(rowUnique, kind='stable')
+        self.uniqueOffsets = np.concatenate([[0], np.cumsum(np.bincount(rowUnique, minlength=len(countOrder)))])
+
+        self.blockStarts = np.arange(0, len(self.uniquePacked), blockRows)
+        self.blockEnds = np.minimum(self.blockStarts + blockRows, len(self.uniquePacked))
+        self.blockLowCounts = self.uniqueCounts[self.blockStarts] if len(self.blockStarts) else np.zeros(0, dtype=np.int64)
+        self.blockHighCounts = self.uniqueCounts[self.blockEnds - 1] if len(self.blockStarts) else np.zeros(0, dtype=np.int64)
+        self.cachedBlocks = {}
+        self.cacheBlockLimit = int(cacheMB * 1e6 // max(1, blockRows * bitCount * 4))
+
+    @classmethod
+    def fromStore(cls, store: FingerprintStore, matrixName: str = 'reaction morgan', **options) -> 'SimilarityIndex':
+        return cls(store.matrix(matrixName), store.recordIDs, store.bitCount(matrixName), **options)
+
+    def blockBits(self, blockNumber: int) -> np.ndarray:
+        blockBits = self.cachedBlocks.get(blockNumber)
+        if blockBits is None:
+            packedBlock = self.uniquePacked[self.blockStarts[blockNumber]:self.blockEnds[blockNumber]]
+            blockBits = np.unpackbits(packedBlock, axis=1, count=self.bitCount).astype(np.float32)
+            if len(self.cachedBlocks) < self.cacheBlockLimit:
+                self.cachedBlocks[blockNumber] = blockBits
+        return blockBits
+
+    def searchDistinct(self, queryPacked: np.ndarray, k: int, prune: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k distinct fingerprints for one batch of queries
+
+        Returns:
+            Tuple with (queries, k) distinct-fingerprint positions (-1 if fewer exist) and float32 similarities, best first
+        """
+        queryCount = len(queryPacked)
+        queryBits = np.unpackbits(queryPacked, axis=1, count=self.bitCount).astype(np.float32)
+        queryCounts = queryBits.sum(axis=1)
+        bestSimilarities = np.full((queryCount, k), -1.0, dtype=np.float32)
+        bestPositions = np.full((queryCount, k), -1, dtype=np.int64)
+
+        blockBounds = tanimotoBound(queryCounts, self.blockLowCounts, self.blockHighCounts)
+        for blockNumber in np.argsort(-blockBounds.max(axis=0), kind='stable'): # most promising blocks first
+            if prune and np.all(blockBounds[:, blockNumber] < bestSimilarities[:, -1]):
+                continue
+            blockStart = self.blockStarts[blockNumber]
+            intersections = queryBits @ self.blockBits(blockNumber).T
+            unions = queryCounts[:, None] + self.uniqueCounts[blockStart:self.blockEnds[blockNumber]][None, :] - intersections
+            similarities = np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+
+            # merge the block into the running top k
+            candidateSimilarities = np.concatenate([bestSimilarities, similarities], axis=1)
+            candidatePositions = np.concatenate([bestPositions, np.broadcast_to(
+                np.arange(blockStart, self.blockEnds[blockNumber]), similarities.shape)], axis=1)
+            if candidateSimilarities.shape[1] > k:
+                topColumns = np.argpartition(-candidateSimilarities, k - 1, axis=1)[:, :k]
+                candidateSimilarities = np.take_along_axis(candidateSimilarities, topColumns, axis=1)
+                candidatePositions = np.take_along_axis(candidatePositions, topColumns, axis=1)
+            sortOrder = np.argsort(-candidateSimilarities, axis=1, kind='stable')
+            bestSimilarities = np.take_along_axis(candidateSimilarities, sortOrder, axis=1)
+            bestPositions = np.take_along_axis(candidatePositions, sortOrder, axis=1)
+        return bestPositions, bestSimilarities
+
+    def topK(self, queryPacked: np.ndarray, k: int = 10, excludeRecordIDs: Optional[np.ndarray] = None,
+             batchSize: int = 256, workers: int = 1, prune: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k most similar records per query
+
+        Args:
+            queryPacked (np.ndarray): (queries, bytes) packed fingerprints, same length as the index
+            k (int): neighbours per query
+            excludeRecordIDs (Optional[np.ndarray]): one RecordID per query to leave out (leave-one-out validation)
+            batchSize (int): queries per matrix multiply, sorted by bit count first so batches prune together
+            workers (int): threads running batches at once (numpy's matmul lets go of the GIL)
+            prune (bool): skip blocks the bit-count bound rules out
+
+        Returns:
+            Tuple with:
+            - neighbourRows (np.ndarray): (queries, k) row numbers into recordIDs, -1 where there aren't k
+            - similarities (np.ndarray): (queries, k) float32 Tanimoto, best first
+        """
+        queryPacked = np.ascontiguousarray(queryPacked)
+        distinctNeeded = k + (excludeRecordIDs is not None) # one spare in case the excluded record is the best hit
+        queryOrder = np.argsort(popcounts(queryPacked), kind='stable')
+        batches = [queryOrder[batchStart:batchStart + batchSize] for batchStart in range(0, len(queryOrder), batchSize)]
+
+        def searchBatch(batchRows):
+            return self.searchDistinct(queryPacked[batchRows], distinctNeeded, prune)
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                batchResults = list(executor.map(searchBatch, batches))
+        else:
+            batchResults = [searchBatch(batchRows) for batchRows in batches]
+
+        neighbourRows = np.full((len(queryPacked), k), -1, dtype=np.int64)
+        similarities = np.full((len(queryPacked), k), np.nan, dtype=np.float32)
+        for batchRows, (distinctPositions, distinctSimilarities) in zip(batches, batchResults):
+            for queryRow, positions, positionSimilarities in zip(batchRows, distinctPositions, distinctSimilarities):
+                excludedID = excludeRecordIDs[queryRow] if excludeRecordIDs is not None else None
+                found = 0
+                # expand each distinct fingerprint into its records, best first, until k
+                for position, similarity in zip(positions, positionSimilarities):
+                    if position < 0 or found == k:
+                        break
+                    for row in self.rowsByUnique[self.uniqueOffsets[position]:self.uniqueOffsets[position + 1]]:
+                        if excludedID is not None and self.recordIDs[row] == excludedID:
+                            continue
+                        neighbourRows[queryRow, found] = row
+                        similarities[queryRow, found] = similarity
+                        found += 1
+                        if found == k:
+                            break
+        return neighbourRows, similarities
+
+    def neighbours(self, queryPacked: np.ndarray, kinetics: KineticsTable, k: int = 10, **options) -> pandas.DataFrame:
+        """
+        topK joined with the kinetic parameters of each neighbour
+
+        Returns:
+            pandas.DataFrame: query, rank, RecordID, similarity, A, n, Ea [J/mol] (NaN where a neighbour has no kinetics)
+        """
+        neighbourRows, similarities = self.topK(queryPacked, k, **options)
+        hasNeighbour = neighbourRows >= 0
+        queryNumbers, ranks = np.nonzero(hasNeighbour)
+        neighbourIDs = self.recordIDs[neighbourRows[hasNeighbour]]
+        kineticsRows = pandas.Index(kinetics.recordIDs).get_indexer(neighbourIDs)
+        hasKinetics = kineticsRows >= 0
+        pick = lambda values: np.where(hasKinetics, values[np.maximum(kineticsRows, 0)], np.nan)
+        return pandas.DataFrame({'query': queryNumbers, 'rank': ranks, 'RecordID': neighbourIDs,
+                                 'similarity': similarities[hasNeighbour], 'A': pick(kinetics.A), 'n': pick(kinetics.n),
+                                 'Ea [J/mol]': pick(kinetics.Ea)})
+
+    def estimateKinetics(self, queryPacked: np.ndarray, kinetics: KineticsTable, k: int = 10, **options) -> pandas.DataFrame:
+        """
+        kNN baseline: similarity-weighted mean of log10 A and of Ea over the neighbours that have kinetics
+
+        Returns:
+            pandas.DataFrame: per query, log10 A, Ea [J/mol] and how many neighbours went into it
+        """
+        neighbourFrame = self.neighbours(queryPacked, kinetics, k, **options)
+        neighbourFrame = neighbourFrame[np.isfinite(neighbourFrame['A']) & (neighbourFrame['A'] > 0) & np.isfinite(neighbourFrame['Ea [J/mol]'])]
+        weights = neighbourFrame['similarity'].clip(lower=1e-6)
+        weightedFrame = pandas.DataFrame({'query': neighbourFrame['query'], 'weight': weights,
+                                          'weighted log10 A': np.log10(neighbourFrame['A']) * weights,
+                                          'weighted Ea': neighbourFrame['Ea [J/mol]'] * weights})
+        sums = weightedFrame.groupby('query').sum()
+        estimates = pandas.DataFrame({'log10 A': sums['weighted log10 A'] / sums['weight'],
+                                      'Ea [J/mol]': sums['weighted Ea'] / sums['weight'],
+                                      'neighbours': weightedFrame.groupby('query').size()})
+        return estimates.reindex(np.arange(len(queryPacked)))
+
+
+def bruteForceTopK(packedRows: np.ndarray, queryPacked: np.ndarray, k: int) -> np.ndarray:
+    """
+    Exact reference: popcount Tanimoto of every query against every row, no tricks
+
+    Returns:
+        np.ndarray: (queries, k) similarities, best first
+    """
+    wordRows = np.ascontiguousarray(packedRows)
+    rowCounts = popcounts(wordRows)
+    topSimilarities = np.empty((len(queryPacked), k), dtype=np.float64)
+    for queryNumber, query in enumerate(queryPacked):
+        intersections = np.bitwise_count(wordRows & query).sum(axis=1, dtype=np.int64)
+        unions = rowCounts + popcounts(query[None, :])[0] - intersections
+        similarities = np.divide(intersections, unions, out=np.zeros(len(unions)), where=unions > 0)
+        topSimilarities[queryNumber] = -np.sort(-similarities)[:k]
+    return topSimilarities
+
+
+def benchmarkIndex(index: SimilarityIndex, packedRows: np.ndarray, queryPacked: np.ndarray, k: int = 10,
+                   referenceQueries: int = 200, **options) -> Dict[str, float]:
+    """
+    Latency/throughput of topK, with and without pruning, and recall@k of each against brute force on a sample of
+    the queries ('recall@k' is the pruned run's, the one that can actually miss neighbours)
+
+    Recall counts a returned neighbour as right when its similarity reaches the exact k-th best, so ties don't count against it.
+    """
+    benchmarkStats = {'rows': len(packedRows), 'distinct rows': len(index.uniquePacked), 'queries': len(queryPacked), 'k': k}
+    labelSimilarities = {}
+    for label, prune in (('pruned', True), ('unpruned', False)):
+        startTime = time.perf_counter()
+        neighbourRows, labelSimilarities[label] = index.topK(queryPacked, k, prune=prune, **options)
+        elapsedSeconds = time.perf_counter() - startTime
+        benchmarkStats[f'{label} queries per second'] = round(len(queryPacked) / elapsedSeconds, 1)
+        benchmarkStats[f'{label} ms per query'] = round(1000 * elapsedSeconds / len(queryPacked), 3)
+
+    sampleRows = np.arange(min(referenceQueries, len(queryPacked)))
+    startTime = time.perf_counter()
+    exactSimilarities = bruteForceTopK(packedRows, queryPacked[sampleRows], k)
+    benchmarkStats['brute force ms per query'] = round(1000 * (time.perf_counter() - startTime) / len(sampleRows), 3)
+    kthBest = exactSimilarities[:, -1:] - 1e-6
+    benchmarkStats['recall@k'] = round(float((labelSimilarities['pruned'][sampleRows] >= kthBest).mean()), 4)
+    benchmarkStats['unpruned recall@k'] = round(float((labelSimilarities['unpruned'][sampleRows] >= kthBest).mean()), 4)
+    return benchmarkStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tanimoto kNN over the fingerprint store, benchmarked against brute force')
+    parser.add_argument('--store', default='fingerprints')
+    parser.add_argument('--matrix', default='reaction morgan', choices=FingerprintStore.matrixNames)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=2000, help='stored reactions used as queries')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--kinetics', default=None, help='kinetics .npz from kineticsTable.py, prints kNN estimates')
+    args = parser.parse_args()
+
+    store = FingerprintStore(args.store)
+    startTime = time.perf_counter()
+    index = SimilarityIndex.fromStore(store, args.matrix)
+    print(f"Index built in {time.perf_counter() - startTime:.3f} s")
+
+    packedRows = store.matrix(args.matrix)
+    queryRows = np.random.default_rng(0).choice(len(packedRows), size=min(args.queries, len(packedRows)), replace=False)
+    queryPacked = np.asarray(packedRows[np.sort(queryRows)])
+    print(f"Similarity index benchmark: {benchmarkIndex(index, packedRows, queryPacked, args.k, workers=args.workers)}")
+
+    if args.kinetics:
+        estimates = index.estimateKinetics(queryPacked[:10], KineticsTable.load(args.kinetics), args.k,
+                                           excludeRecordIDs=store.recordIDs[np.sort(queryRows)[:10]])
+        print(estimates)
+
+if __name__ == '__main__':
+    main()
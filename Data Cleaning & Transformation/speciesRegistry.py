@@ -0,0 +1,285 @@
+import argparse  # command line options
+import hashlib  # stable per-species hashes
+import json  # registry file
+import os
+import re as regex
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas
+
+try:
+    from rdkit import Chem
+    from rdkit import RDLogger
+    RDLogger.DisableLog('rdApp.*') # unparsable SMILES just fall back to the string, no need for the stderr spam
+except ImportError: # without rdkit SMILES are compared as written
+    Chem = None
+
+from reagentClassifier import EMPTY, NO_LETTERS, classifyReagents
+from resolutionCache import ResolutionCache, normalizeName
+
+reactantColumns = ['Reactant 1', 'Reactant 2', 'Reactant 3']
+productColumns = ['Product 1', 'Product 2', 'Product 3']
+NO_SPECIES = -1 # empty reagent slot in the int arrays
+
+# odd 64-bit constants for mixing species hashes into a reaction hash, one per side so A -> B != B -> A
+reactantSideSeed = np.uint64(0x9E3779B97F4A7C15)
+productSideSeed = np.uint64(0xC2B2AE3D27D4EB4F)
+mixMultiplier = np.uint64(0x100000001B3)
+
+listCellPattern = regex.compile(r"^\[\s*'([^']*)'") # "['C1=CC=CC=C1']", how a PubChem answer list got written into processed.csv
+
+
+def canonicalSMILES(smiles: str) -> str:
+    # rdkit's canonical form when it can parse it, the string itself otherwise
+    if Chem is not None:
+        molecule = Chem.MolFromSmiles(smiles)
+        if molecule is not None:
+            return Chem.MolToSmiles(molecule)
+    return smiles
+
+
+def cleanReagentCell(cell: str) -> str:
+    # processed.csv cell -> plain SMILES, '' for nothing ('[None]', 'nan')
+    cell = cell.strip()
+    if cell in ('', '[None]', 'None', 'nan'):
+        return ''
+    listMatchObj = listCellPattern.match(cell)
+    return listMatchObj.group(1) if listMatchObj else cell
+
+
+def smilesCells(dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Copy of a processed.csv-style table with every reagent cell cleaned: list-wrapped answers unwrapped, placeholders
+    ('[None]', 'nan', ...) made missing so classifyReagents sees them as empty slots instead of species
+    """
+    cleanedDataframe = dataframe.copy()
+    for columnName in reactantColumns + productColumns:
+        if columnName in cleanedDataframe.columns:
+            cleanedDataframe[columnName] = cleanedDataframe[columnName].astype(object).map(
+                lambda cell: (cleanReagentCell(cell) or None) if isinstance(cell, str) else cell)
+    return cleanedDataframe
+
+
+def speciesHash(speciesKey: str) -> np.uint64:
+    # 64-bit hash of a species key that's the same in every run and every process (unlike hash())
+    return np.uint64(int.from_bytes(hashlib.blake2b(speciesKey.encode('utf-8'), digest_size=8).digest(), 'little'))
+
+
+class SpeciesRegistry:
+    """
+    Interns reagent names to integer species IDs, one ID per distinct species rather than per spelling
+
+    A name with a known SMILES is keyed by its canonical SMILES, so 'methane', 'CH4' and 'C' all get the same ID
+    once they resolve; an unresolved name is keyed by its normalized self until it does.
+
+    Attributes:
+        speciesKeys (List[str]): speciesID -> 'smiles:<canonical SMILES>' or 'name:<normalized name>'
+        nameIDs (Dict[str, int]): normalized name -> speciesID
+    """
+
+    def __init__(self):
+        self.speciesKeys = []
+        self.keyIDs = {}
+        self.nameIDs = {}
+        self.speciesHashes = []
+
+    def __len__(self) -> int:
+        return len(self.speciesKeys)
+
+    def internKey(self, speciesKey: str) -> int:
+        speciesID = self.keyIDs.get(speciesKey)
+        if speciesID is None:
+            speciesID = len(self.speciesKeys)
+            self.keyIDs[speciesKey] = speciesID
+            self.speciesKeys.append(speciesKey)
+            self.speciesHashes.append(speciesHash(speciesKey))
+        return speciesID
+
+    def intern(self, name: str, smiles: Optional[str] = None) -> int:
+        """
+        speciesID for a name, making one if it's new; a SMILES given later for an already interned name re-keys it
+        """
+        normalizedName = normalizeName(name)
+        speciesKey = f"smiles:{canonicalSMILES(smiles)}" if smiles else f"name:{normalizedName}"
+        knownID = self.nameIDs.get(normalizedName)
+        if knownID is not None and (not smiles or self.speciesKeys[knownID] == speciesKey):
+            return knownID
+        speciesID = self.internKey(speciesKey)
+        self.nameIDs[normalizedName] = speciesID
+        return speciesID
+
+    def internMany(self, names: Iterable[str], smilesLookup: Optional[Callable[[List[str]], Dict[str, Optional[str]]]] = None) -> np.ndarray:
+        """
+        Interns a batch of distinct names, asking smilesLookup for all their SMILES in one call
+
+        Returns:
+            np.ndarray: int32 speciesID per name, same order
+        """
+        names = list(names)
+        smilesByName = smilesLookup(names) if smilesLookup else {}
+        return np.array([self.intern(name, smilesByName.get(name)) for name in names], dtype=np.int32)
+
+    def hashes(self) -> np.ndarray:
+        # uint64 hash per speciesID, index with the reaction arrays (after shifting NO_SPECIES out of the way)
+        return np.array(self.speciesHashes, dtype=np.uint64)
+
+    def save(self, registryPath: str) -> None:
+        temporaryPath = registryPath + '.tmp'
+        with open(temporaryPath, 'w', encoding='utf-8') as registryFile:
+            json.dump({'speciesKeys': self.speciesKeys, 'nameIDs': self.nameIDs}, registryFile, ensure_ascii=False)
+        os.replace(temporaryPath, registryPath)
+
+    @classmethod
+    def load(cls, registryPath: str) -> 'SpeciesRegistry':
+        with open(registryPath, 'r', encoding='utf-8') as registryFile:
+            savedRegistry = json.load(registryFile)
+        registry = cls()
+        for speciesKey in savedRegistry['speciesKeys']:
+            registry.internKey(speciesKey)
+        registry.nameIDs = savedRegistry['nameIDs']
+        return registry
+
+
+def reactionHashes(reactantIDs: np.ndarray, productIDs: np.ndarray, speciesHashes: np.ndarray) -> np.ndarray:
+    """
+    Order-independent, direction-dependent 64-bit hash per reaction, vectorized over all rows
+
+    Each side's species hashes get sorted (so reagent order and column doesn't matter, duplicates like 2 OH still
+    count twice) and folded together with a multiply-add; the hashes come from the canonical species keys, so the same
+    reaction gets the same hash in every run no matter what IDs the registry handed out.
+
+    Args:
+        reactantIDs (np.ndarray): (reactions, 3) int32 speciesIDs, NO_SPECIES for empty slots
+        productIDs (np.ndarray): (reactions, 3) int32 speciesIDs, NO_SPECIES for empty slots
+        speciesHashes (np.ndarray): uint64 per speciesID, SpeciesRegistry.hashes()
+
+    Returns:
+        np.ndarray: uint64 hash per reaction
+    """
+    paddedHashes = np.concatenate([speciesHashes, np.zeros(1, dtype=np.uint64)]) # NO_SPECIES (-1) indexes the 0 at the end
+    with np.errstate(over='ignore'): # uint64 wraparound is the point
+        reactionHash = np.zeros(len(reactantIDs), dtype=np.uint64)
+        for sideIDs, sideSeed in ((reactantIDs, reactantSideSeed), (productIDs, productSideSeed)):
+            sideHashes = np.sort(paddedHashes[sideIDs], axis=1)
+            for slot in range(sideHashes.shape[1]):
+                reactionHash = (reactionHash ^ (sideHashes[:, slot] + sideSeed)) * mixMultiplier
+    return reactionHash
+
+
+class ReactionTable:
+    """
+    Reactions as compact int arrays of speciesIDs plus a canonical hash, aligned with the rows they came from
+
+    Attributes:
+        recordIDs (np.ndarray): int64 RecordID per reaction
+        reactantIDs, productIDs (np.ndarray): (reactions, 3) int32 speciesIDs, NO_SPECIES for empty slots
+        hashes (np.ndarray): uint64 canonical reaction hash, equal for the same reaction written differently
+    """
+
+    def __init__(self, recordIDs: np.ndarray, reactantIDs: np.ndarray, productIDs: np.ndarray, hashes: np.ndarray):
+        self.recordIDs = np.asarray(recordIDs, dtype=np.int64)
+        self.reactantIDs = np.asarray(reactantIDs, dtype=np.int32)
+        self.productIDs = np.asarray(productIDs, dtype=np.int32)
+        self.hashes = np.asarray(hashes, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self.recordIDs)
+
+    @classmethod
+    def fromDataframe(cls, dataframe: pandas.DataFrame, registry: SpeciesRegistry,
+                      smilesLookup: Optional[Callable[[List[str]], Dict[str, Optional[str]]]] = None) -> 'ReactionTable':
+        """
+        Interns every distinct reagent string once and turns the six reagent columns into two int arrays
+
+        Empty cells and cells with no letters (eg. '(.)') become NO_SPECIES.
+
+        Args:
+            dataframe (pandas.DataFrame): NIST extract, or processed.csv where the cells already are SMILES
+            registry (SpeciesRegistry): registry to intern into, it keeps growing across calls
+            smilesLookup (Optional[Callable]): distinct names -> {name: SMILES or None}, eg. from the resolution cache
+
+        Returns:
+            ReactionTable: one reaction per dataframe row, in order
+        """
+        reagentColumns = reactantColumns + productColumns
+        categories = classifyReagents(dataframe, reagentColumns).to_numpy()
+        cellValues = dataframe[reagentColumns].to_numpy(dtype=object)
+        isSpecies = (categories != EMPTY) & (categories != NO_LETTERS)
+
+        codes, uniqueNames = pandas.factorize(cellValues[isSpecies])
+        speciesIDs = np.full(cellValues.shape, NO_SPECIES, dtype=np.int32)
+        speciesIDs[isSpecies] = registry.internMany(uniqueNames, smilesLookup)[codes] if len(uniqueNames) else NO_SPECIES
+
+        reactantIDs, productIDs = speciesIDs[:, :3], speciesIDs[:, 3:]
+        recordIDs = pandas.to_numeric(dataframe['RecordID'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+        return cls(recordIDs, reactantIDs, productIDs, reactionHashes(reactantIDs, productIDs, registry.hashes()))
+
+    def groups(self):
+        """
+        Integer group-by on the canonical hash: all measurements of the same reaction share a group
+
+        Returns:
+            Tuple with:
+            - uniqueHashes (np.ndarray): one hash per distinct reaction
+            - groupIDs (np.ndarray): distinct reaction index per row
+            - groupSizes (np.ndarray): measurements per distinct reaction
+        """
+        uniqueHashes, groupIDs, groupSizes = np.unique(self.hashes, return_inverse=True, return_counts=True)
+        return uniqueHashes, groupIDs, groupSizes
+
+    def save(self, tablePath: str) -> None:
+        np.savez(tablePath, recordIDs=self.recordIDs, reactantIDs=self.reactantIDs, productIDs=self.productIDs, hashes=self.hashes)
+
+    @classmethod
+    def load(cls, tablePath: str) -> 'ReactionTable':
+        with np.load(tablePath) as arrays:
+            return cls(arrays['recordIDs'], arrays['reactantIDs'], arrays['productIDs'], arrays['hashes'])
+
+
+def cachedSmilesLookup(cache: ResolutionCache) -> Callable[[List[str]], Dict[str, Optional[str]]]:
+    # resolution cache answers as a smilesLookup, names the cache doesn't know stay keyed by name
+    return lambda names: {name: smiles for name, (resolver, smiles) in cache.lookup(names).items()}
+
+
+def identitySmilesLookup(names: List[str]) -> Dict[str, Optional[str]]:
+    # for tables like processed.csv where the reagent cells already are SMILES (run them through smilesCells first);
+    # a cell rdkit can't parse (a formula nothing resolved) stays keyed by name rather than posing as a SMILES
+    smilesByName = {}
+    for name in names:
+        smiles = cleanReagentCell(name) or None
+        if smiles and Chem is not None and Chem.MolFromSmiles(smiles) is None:
+            smiles = None
+        smilesByName[name] = smiles
+    return smilesByName
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Intern reagents to species IDs and hash every reaction')
+    parser.add_argument('--input', default='Filtered NIST Extracted.csv')
+    parser.add_argument('--registry', default='species registry.json', help='grows across runs if it exists')
+    parser.add_argument('--output', default='reactions.npz')
+    parser.add_argument('--cache', default='resolution cache.sqlite', help='name -> SMILES answers from SMILES Processing')
+    parser.add_argument('--cells-are-smiles', action='store_true', help='the reagent cells are SMILES already (processed.csv)')
+    args = parser.parse_args()
+
+    from tableStore import readTable
+    dataframe = readTable(args.input, columns=['RecordID'] + reactantColumns + productColumns)
+    registry = SpeciesRegistry.load(args.registry) if os.path.exists(args.registry) else SpeciesRegistry()
+
+    if args.cells_are_smiles:
+        reactionTable = ReactionTable.fromDataframe(smilesCells(dataframe), registry, identitySmilesLookup)
+    elif os.path.exists(args.cache):
+        with ResolutionCache(args.cache) as cache:
+            reactionTable = ReactionTable.fromDataframe(dataframe, registry, cachedSmilesLookup(cache))
+    else:
+        reactionTable = ReactionTable.fromDataframe(dataframe, registry)
+
+    registry.save(args.registry)
+    reactionTable.save(args.output)
+    uniqueHashes, groupIDs, groupSizes = reactionTable.groups()
+    print(f"{len(reactionTable)} reactions, {len(uniqueHashes)} distinct, {len(registry)} species "
+          f"({len(registry.nameIDs)} distinct names), biggest group {groupSizes.max() if len(groupSizes) else 0} measurements")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+import argparse  # command line options for the size/speed comparison
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+import pandas
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError: # columnar formats are optional, csv works without pyarrow
+    pyarrow = None
+
+from instrumentation import metrics
+from reagentClassifier import reagentColumns
+
+# numeric kinetic fields, stored as float64 in the columnar formats instead of strings
+kineticColumns = ['Pre-Exp Factor Coeff', 'Pre-Exp Factor Power', 'Activation Energy']
+
+# strings read_csv turns into NaN by default, the columnar writers make the same cells missing
+csvMissingValues = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+                    'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# file suffix -> format, anything else is csv
+tableFormats = {'.parquet': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+
+
+def tableFormat(tablePath: str) -> str:
+    return tableFormats.get(os.path.splitext(tablePath)[1].lower(), 'csv')
+
+
+def requireArrow(tablePath: str) -> None:
+    if pyarrow is None:
+        raise ImportError(f"Reading/writing {tablePath} needs pyarrow (pip install pyarrow), or use a .csv path")
+
+
+def cleanNumbers(column: pandas.Series) -> Optional[pandas.Series]:
+    # the column as floats if every value in it is a number once spaces are gone (NIST writes '- 13'), None if any
+    # isn't ('Parse Error', 'Url Fetch Error', ...), so a marker never quietly turns into NaN
+    if pandas.api.types.is_numeric_dtype(column):
+        return column.astype(float)
+    text = column.astype(object).map(lambda value: ''.join(value.split()) or None if isinstance(value, str) else value)
+    numbers = pandas.to_numeric(text, errors='coerce')
+    if (numbers.isna() & text.notna()).any():
+        return None
+    return numbers.astype(float)
+
+
+def blankToMissing(column: pandas.Series) -> pandas.Series:
+    # text cells read_csv would hand back as NaN ('' and its other default NA strings) made missing here too
+    if pandas.api.types.is_numeric_dtype(column) or isinstance(column.dtype, pandas.CategoricalDtype):
+        return column
+    return column.mask(column.isin(csvMissingValues))
+
+
+def toColumnar(dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Column types for the columnar formats: kinetic fields become floats when every value in them is a number (a column
+    still holding error markers like 'Parse Error' stays text), reagent columns become categoricals so they're stored
+    dictionary-encoded. Text cells a csv reader would see as missing ('', 'nan', ...) are written missing, so a table
+    reads back the same whichever format it went through
+    """
+    columnarDataframe = dataframe.copy(deep=False)
+    for columnName in columnarDataframe.columns:
+        columnarDataframe[columnName] = blankToMissing(columnarDataframe[columnName])
+    for columnName in kineticColumns:
+        if columnName in columnarDataframe.columns:
+            numbers = cleanNumbers(columnarDataframe[columnName])
+            if numbers is not None:
+                columnarDataframe[columnName] = numbers
+    for columnName in reagentColumns:
+        if columnName in columnarDataframe.columns:
+            columnarDataframe[columnName] = columnarDataframe[columnName].astype('category')
+    return columnarDataframe
+
+
+def fromColumnar(dataframe: pandas.DataFrame, keepCategories: bool = False) -> pandas.DataFrame:
+    # categoricals back to plain object columns unless asked not to, the cleaning code assigns new strings into them
+    if not keepCategories:
+        for columnName, dtype in dataframe.dtypes.items():
+            if isinstance(dtype, pandas.CategoricalDtype):
+                dataframe[columnName] = dataframe[columnName].astype(object)
+    return dataframe
+
+
+def readTable(tablePath: str, columns: Optional[List[str]] = None, keepCategories: bool = False) -> pandas.DataFrame:
+    """
+    Reads a table in whichever format its suffix says, only the requested columns
+
+    Args:
+        tablePath (str): .csv, .parquet or .arrow/.feather
+        columns (Optional[List[str]]): columns to load, all if None; the columnar formats never touch the others
+        keepCategories (bool): leave reagent columns as categoricals (columnar formats only), less memory for read-only use
+
+    Returns:
+        pandas.DataFrame: the table
+    """
+    fileFormat = tableFormat(tablePath)
+    with metrics.timer(f"table/read {fileFormat}"):
+        if fileFormat == 'csv':
+            return pandas.read_csv(tablePath, usecols=columns)
+        requireArrow(tablePath)
+        if fileFormat == 'parquet':
+            arrowTable = pyarrow.parquet.read_table(tablePath, columns=columns)
+        else:
+            arrowTable = pyarrow.feather.read_table(tablePath, columns=columns, memory_map=True)
+        return fromColumnar(arrowTable.to_pandas(), keepCategories)
+
+
+def tableColumns(tablePath: str) -> List[str]:
+    # column names from the header/schema only, no data read
+    fileFormat = tableFormat(tablePath)
+    if fileFormat == 'csv':
+        return list(pandas.read_csv(tablePath, nrows=0).columns)
+    requireArrow(tablePath)
+    if fileFormat == 'parquet':
+        return pyarrow.parquet.read_schema(tablePath).names
+    with pyarrow.memory_map(tablePath, 'r') as source:
+        return pyarrow.ipc.open_file(source).schema.names
+
+
+def writeTable(dataframe: pandas.DataFrame, tablePath: str, compression: Optional[str] = None) -> None:
+    """
+    Writes a table in whichever format its suffix says, never with the index
+
+    Args:
+        dataframe (pandas.DataFrame): table to write
+        tablePath (str): .csv, .parquet or .arrow/.feather
+        compression (Optional[str]): columnar formats only; parquet defaults to zstd, arrow defaults to uncompressed
+            so it can be memory-mapped straight off the disk
+    """
+    fileFormat = tableFormat(tablePath)
+    with metrics.timer(f"table/write {fileFormat}"):
+        if fileFormat == 'csv':
+            dataframe.to_csv(tablePath, index=False, encoding='utf-8')
+            return
+        requireArrow(tablePath)
+        arrowTable = pyarrow.Table.from_pandas(toColumnar(dataframe), preserve_index=False)
+        temporaryPath = tablePath + '.tmp'
+        if fileFormat == 'parquet':
+            pyarrow.parquet.write_table(arrowTable, temporaryPath, compression=compression or 'zstd')
+        else:
+            pyarrow.feather.write_feather(arrowTable, temporaryPath, compression=compression or 'uncompressed')
+        os.replace(temporaryPath, tablePath) # readers never see half a file
+
+
+def iterTable(tablePath: str, chunkRows: int = 50000, columns: Optional[List[str]] = None,
+              dtype: Optional[object] = None) -> Iterator[pandas.DataFrame]:
+    """
+    Reads a table chunkRows rows at a time, only one chunk is ever in memory
+
+    Chunks keep their row labels from the whole table (the second chunk of a csv starts at chunkRows, and so on),
+    same as slicing readTable's result would give.
+
+    Args:
+        tablePath (str): .csv, .parquet or .arrow/.feather
+        chunkRows (int): rows per chunk
+        columns (Optional[List[str]]): columns to load, all if None
+        dtype (Optional[object]): csv only, passed to read_csv; str keeps every cell as written since a chunk
+            can't see the rest of the file to infer column types the same way a full read would
+
+    Returns:
+        Iterator[pandas.DataFrame]: the chunks, in file order
+    """
+    fileFormat = tableFormat(tablePath)
+    if fileFormat == 'csv':
+        yield from pandas.read_csv(tablePath, usecols=columns, chunksize=chunkRows, dtype=dtype)
+        return
+    requireArrow(tablePath)
+    rowStart = 0
+    if fileFormat == 'parquet':
+        batches = pyarrow.parquet.ParquetFile(tablePath).iter_batches(batch_size=chunkRows, columns=columns)
+    else:
+        mappedTable = mapTable(tablePath, columns)
+        batches = (mappedTable.slice(batchStart, chunkRows) for batchStart in range(0, mappedTable.num_rows, chunkRows))
+    for batch in batches:
+        chunk = fromColumnar(batch.to_pandas())
+        chunk.index = pandas.RangeIndex(rowStart, rowStart + len(chunk))
+        rowStart += len(chunk)
+        yield chunk
+
+
+class TableAppender:
+    """
+    Writes a table a chunk at a time in whichever format its suffix says, for outputs too big to build in memory
+
+    The file only appears under tablePath on close(), like writeTable, so readers never see half a table. In the
+    columnar formats every chunk is converted to the first chunk's schema, with the reagent columns as plain strings
+    (each chunk would have its own categories, an Arrow file only takes one dictionary per column; parquet
+    dictionary-encodes them on its own) and columns that were all empty in the first chunk as strings too.
+    """
+
+    def __init__(self, tablePath: str, compression: Optional[str] = None):
+        self.tablePath = tablePath
+        self.fileFormat = tableFormat(tablePath)
+        self.compression = compression
+        self.temporaryPath = tablePath + '.tmp'
+        self.writer = None
+        self.schema = None
+        self.columns = None
+        self.rowCount = 0
+        if self.fileFormat != 'csv':
+            requireArrow(tablePath)
+
+    def append(self, dataframe: pandas.DataFrame) -> None:
+        if self.columns is None:
+            self.columns = list(dataframe.columns)
+        with metrics.timer(f"table/write {self.fileFormat}"):
+            if self.fileFormat == 'csv':
+                dataframe[self.columns].to_csv(self.temporaryPath, mode='a' if self.writer else 'w', header=self.writer is None,
+                                               index=False, encoding='utf-8')
+                self.writer = self.temporaryPath # header's written, appends from here on
+            else:
+                arrowTable = pyarrow.Table.from_pandas(toColumnar(dataframe[self.columns]), preserve_index=False)
+                if self.schema is None:
+                    self.schema = pyarrow.schema([
+                        pyarrow.field(field.name, pyarrow.string())
+                        if pyarrow.types.is_dictionary(field.type) or pyarrow.types.is_null(field.type) else field
+                        for field in arrowTable.schema])
+                    if self.fileFormat == 'parquet':
+                        self.writer = pyarrow.parquet.ParquetWriter(self.temporaryPath, self.schema, compression=self.compression or 'zstd')
+                    else:
+                        self.writer = pyarrow.ipc.new_file(self.temporaryPath, self.schema,
+                                                           options=pyarrow.ipc.IpcWriteOptions(compression=self.compression))
+                self.writer.write_table(arrowTable.cast(self.schema))
+        self.rowCount += len(dataframe)
+
+    def close(self, emptyColumns: Optional[List[str]] = None) -> None:
+        """
+        Finishes the file and moves it into place; with no chunks appended an empty table with emptyColumns is written
+        """
+        if self.writer is None:
+            writeTable(pandas.DataFrame(columns=self.columns or emptyColumns or []), self.tablePath, self.compression)
+            return
+        if self.fileFormat != 'csv':
+            self.writer.close()
+        os.replace(self.temporaryPath, self.tablePath)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, *excInfo):
+        if excType is None:
+            self.close()
+        elif self.fileFormat != 'csv' and self.writer is not None:
+            self.writer.close() # leave the half-written .tmp, the old table stays untouched
+
+
+def mapTable(tablePath: str, columns: Optional[List[str]] = None):
+    """
+    Memory-maps an uncompressed .arrow table without reading it in: columns are paged in by the OS as they're used
+    and several processes mapping the same file share the pages
+
+    Returns:
+        pyarrow.Table: zero-copy view of the file, .column(name).to_numpy() on the float columns stays zero-copy too
+    """
+    requireArrow(tablePath)
+    if tableFormat(tablePath) != 'arrow':
+        raise ValueError(f"Only Arrow IPC (.arrow/.feather) tables can be memory-mapped, not {tablePath}")
+    with pyarrow.memory_map(tablePath, 'r') as source:
+        arrowTable = pyarrow.ipc.open_file(source).read_all()
+    return arrowTable.select(columns) if columns else arrowTable
+
+
+def compareFormats(inputPath: str, outputDirectory: str = '.', subsetColumns: List[str] = kineticColumns) -> Dict[str, Dict[str, float]]:
+    """
+    Saves the same table as csv, parquet and arrow and times full loads, column-subset loads and a memory-mapped open
+
+    Returns:
+        Dict[str, Dict[str, float]]: format -> MB on disk, save seconds, load seconds, subset load seconds
+    """
+    dataframe = readTable(inputPath)
+    baseName = os.path.splitext(os.path.basename(inputPath))[0]
+    formatStats = {}
+    for suffix in ('.csv', '.parquet', '.arrow'):
+        tablePath = os.path.join(outputDirectory, f"{baseName} comparison{suffix}")
+        startTime = time.perf_counter()
+        writeTable(dataframe, tablePath)
+        saveSeconds = time.perf_counter() - startTime
+
+        startTime = time.perf_counter()
+        readTable(tablePath)
+        loadSeconds = time.perf_counter() - startTime
+
+        startTime = time.perf_counter()
+        readTable(tablePath, columns=subsetColumns)
+        subsetSeconds = time.perf_counter() - startTime
+
+        formatStats[tableFormat(tablePath)] = {
+            'MB': round(os.path.getsize(tablePath) / 1e6, 2),
+            'save seconds': round(saveSeconds, 3),
+            'load seconds': round(loadSeconds, 3),
+            'subset load seconds': round(subsetSeconds, 3)
+        }
+        if suffix == '.arrow':
+            startTime = time.perf_counter()
+            mappedTable = mapTable(tablePath, subsetColumns)
+            float(pandas.Series(mappedTable.column(subsetColumns[0]).to_numpy()).sum())
+            formatStats['arrow']['mapped subset seconds'] = round(time.perf_counter() - startTime, 4)
+        os.remove(tablePath)
+    return formatStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a table between csv/parquet/arrow, or compare the formats')
+    parser.add_argument('--input', default='NIST Extracted.csv')
+    parser.add_argument('--output', default=None, help='write the input here, format from the suffix')
+    parser.add_argument('--compare', action='store_true', help='time and size csv vs parquet vs arrow on the input')
+    args = parser.parse_args()
+
+    if args.output:
+        writeTable(readTable(args.input), args.output)
+    if args.compare:
+        for fileFormat, stats in compareFormats(args.input).items():
+            print(f"{fileFormat}: {stats}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import argparse  # command line options
+import os
+import sqlite3  # remembers answers and definitive misses between runs
+import sys
+import time  # latency numbers
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import requests
+
+cleaningDirectory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'Data Cleaning & Transformation')
+if cleaningDirectory not in sys.path:
+    sys.path.insert(0, cleaningDirectory) # run metrics live with the cleaning modules
+from concurrentFetcher import PoliteFetcher  # pooled keep-alive session, per-host limits, retries
+from instrumentation import metrics
+
+cactusLinkPrefix = 'https://cactus.nci.nih.gov/chemical/structure/'
+reagentColumns = ['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3']
+
+
+class CactusAnswerStore:
+    """
+    Persistent url -> answer table; a 404 is stored with smiles NULL and never asked again
+    """
+
+    def __init__(self, storePath: str = 'cactus answers.sqlite'):
+        self.connection = sqlite3.connect(storePath)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS answers (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                smiles TEXT
+            )''')
+        self.connection.commit()
+
+    def known(self, urls: List[str]) -> Dict[str, Optional[str]]:
+        answers = {}
+        for batchStart in range(0, len(urls), 500): # sqlite caps the number of ? parameters
+            urlBatch = urls[batchStart:batchStart + 500]
+            placeholders = ','.join('?' * len(urlBatch))
+            for url, smiles in self.connection.execute(
+                    f'SELECT url, smiles FROM answers WHERE url IN ({placeholders})', urlBatch):
+                answers[url] = smiles
+        return answers
+
+    def record(self, answers: List[Tuple[str, int, Optional[str]]]) -> None:
+        self.connection.executemany('INSERT OR REPLACE INTO answers VALUES (?, ?, ?)', answers)
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+
+def fetchCactusSMILES(fetcher: PoliteFetcher, url: str) -> Tuple[str, Optional[int], Optional[str], float]:
+    """
+    Asks Cactus for one structure
+
+    Returns:
+        Tuple with:
+        - url (str): same url back, handy with fetcher.map
+        - status (Optional[int]): HTTP status, None if the request never got an answer (after retries)
+        - smiles (Optional[str]): first line of the answer on a 200, None otherwise
+        - latency (float): seconds the request took, retries included
+    """
+    startTime = time.perf_counter()
+    try:
+        response = fetcher.get(url)
+    except requests.RequestException:
+        return url, None, None, time.perf_counter() - startTime
+    latency = time.perf_counter() - startTime
+
+    if response.status_code == 200:
+        answerLines = response.text.strip().splitlines()
+        return url, 200, (answerLines[0].strip() if answerLines else None), latency
+    return url, response.status_code, None, latency
+
+
+def resolveCactusLinks(urls: Iterable[str], concurrency: int = 8, perHostLimit: int = 4, requestsPerSecond: Optional[float] = None,
+                       maxRetries: int = 3, answerStore: Optional[CactusAnswerStore] = None,
+                       progressInterval: int = 200) -> Tuple[Dict[str, Optional[str]], Dict[str, float]]:
+    """
+    Fetches every distinct Cactus url once, concurrently over one pooled session
+
+    404s are definitive (Cactus doesn't know the name) and get stored as misses so later runs skip them;
+    connection errors and 5xx that outlast the retries aren't stored, so they get tried again next run.
+
+    Args:
+        urls (Iterable[str]): cactus .../structure/<name>/smiles urls, duplicates are fine
+        concurrency (int): worker threads
+        perHostLimit (int): max requests in flight to cactus at once
+        requestsPerSecond (Optional[float]): max request starts per second, None means no limit
+        maxRetries (int): retries with backoff on connection errors and 429/5xx
+        answerStore (Optional[CactusAnswerStore]): persistent answers, None to always ask
+        progressInterval (int): print a progress line every this many urls
+
+    Returns:
+        Tuple with:
+        - smilesByUrl (Dict[str, Optional[str]]): url -> SMILES, None for misses and errors
+        - cactusStats (Dict[str, float]): counts, rate and latency percentiles
+    """
+    uniqueUrls = list(dict.fromkeys(urls))
+    knownAnswers = answerStore.known(uniqueUrls) if answerStore else {}
+    toFetch = [url for url in uniqueUrls if url not in knownAnswers]
+    print(f"{len(uniqueUrls)} unique cactus urls, {len(knownAnswers)} already known, fetching {len(toFetch)}")
+    if answerStore:
+        metrics.cacheResult('cactus answers', len(knownAnswers), len(toFetch))
+
+    smilesByUrl = dict(knownAnswers)
+    cactusStats = {'unique urls': len(uniqueUrls), 'already known': len(knownAnswers), 'fetched': 0,
+                   'found': 0, 'not found (404)': 0, 'errors': 0}
+    latencies = []
+    newAnswers = []
+    startTime = time.perf_counter()
+
+    with PoliteFetcher(concurrency=concurrency, perHostLimit=perHostLimit, requestsPerSecond=requestsPerSecond,
+                       maxRetries=maxRetries) as fetcher:
+        for url, status, smiles, latency in fetcher.map(lambda url: fetchCactusSMILES(fetcher, url), toFetch):
+            cactusStats['fetched'] += 1
+            latencies.append(latency)
+            smilesByUrl[url] = smiles
+            if status == 200 and smiles:
+                cactusStats['found'] += 1
+                newAnswers.append((url, status, smiles))
+            elif status == 404:
+                cactusStats['not found (404)'] += 1
+                newAnswers.append((url, status, None))
+            else:
+                cactusStats['errors'] += 1
+            if status is not None:
+                metrics.resolverResult('cactus', status == 200 and bool(smiles)) # network errors aren't Cactus's answer
+
+            if cactusStats['fetched'] % progressInterval == 0:
+                elapsedSeconds = time.perf_counter() - startTime
+                print(f"--- Milestone: '{cactusStats['fetched']}' of {len(toFetch)} cactus urls, "
+                      f"{cactusStats['fetched'] / elapsedSeconds:.1f}/s ---")
+                if answerStore:
+                    answerStore.record(newAnswers)
+                    newAnswers = []
+
+    if answerStore:
+        answerStore.record(newAnswers)
+
+    elapsedSeconds = time.perf_counter() - startTime
+    cactusStats['seconds'] = round(elapsedSeconds, 3)
+    cactusStats['urls per second'] = round(cactusStats['fetched'] / elapsedSeconds, 2) if elapsedSeconds > 0 else 0.0
+    if latencies:
+        sortedLatencies = sorted(latencies)
+        for percentile in (50, 95, 99):
+            latencyIndex = min(len(sortedLatencies) - 1, int(len(sortedLatencies) * percentile / 100))
+            cactusStats[f'p{percentile} latency ms'] = round(sortedLatencies[latencyIndex] * 1000, 1)
+    return smilesByUrl, cactusStats
+
+
+def resolveCactusTable(inputCSVPath: str, outputCSVPath: str, answerStorePath: Optional[str] = 'cactus answers.sqlite',
+                       baseURL: Optional[str] = None, columns: List[str] = reagentColumns, **fetchOptions) -> Dict[str, float]:
+    """
+    Resolves the cactus.csv link table from SMILES Processing and puts the SMILES in place of the links
+
+    Links Cactus couldn't answer stay as links, so cactusReviewer.py can still tell which cells are unresolved.
+
+    Args:
+        inputCSVPath (str): cactus.csv
+        outputCSVPath (str): where the table with SMILES filled in goes
+        answerStorePath (Optional[str]): persistent answers/404s, None to not keep any
+        baseURL (Optional[str]): swap the Cactus prefix for this one, eg. 'http://127.0.0.1:8000/chemical/structure/' for a local stand-in
+        columns (List[str]): reagent columns holding the links
+        **fetchOptions: passed to resolveCactusLinks
+
+    Returns:
+        Dict[str, float]: resolver statistics
+    """
+    cactusDataframe = pd.read_csv(inputCSVPath)
+    linkCells = {columnName: cactusDataframe[columnName].map(
+                     lambda cellContents: isinstance(cellContents, str) and cellContents.startswith(cactusLinkPrefix))
+                 for columnName in columns}
+
+    def visitUrl(cactusLink: str) -> str:
+        return baseURL + cactusLink[len(cactusLinkPrefix):] if baseURL else cactusLink
+
+    allLinks = pd.concat([cactusDataframe.loc[linkCells[columnName], columnName] for columnName in columns])
+
+    answerStore = CactusAnswerStore(answerStorePath) if answerStorePath else None
+    try:
+        smilesByUrl, cactusStats = resolveCactusLinks(allLinks.map(visitUrl).unique(), answerStore=answerStore, **fetchOptions)
+    finally:
+        if answerStore:
+            answerStore.close()
+
+    for columnName in columns:
+        isLink = linkCells[columnName]
+        smiles = cactusDataframe.loc[isLink, columnName].map(lambda cactusLink: smilesByUrl.get(visitUrl(cactusLink)))
+        cactusDataframe.loc[isLink, columnName] = smiles.where(smiles.notna(), cactusDataframe.loc[isLink, columnName])
+
+    cactusDataframe.to_csv(outputCSVPath, index=False)
+    print(f"Cactus statistics: {cactusStats}")
+    return cactusStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch the cactus.csv links and put the SMILES in place')
+    parser.add_argument('--input', default='cactus.csv')
+    parser.add_argument('--output', default='cactus resolved.csv')
+    parser.add_argument('--answers', default='cactus answers.sqlite', help='persistent answers and 404s')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--per-host-limit', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=None, help='max requests per second')
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--base-url', default=None, help='replace the Cactus structure prefix, eg. for a local stand-in')
+    parser.add_argument('--metrics', default=None, help='write a JSON summary of timers, latencies and rates here')
+    parser.add_argument('--progress', type=float, default=None, help='with --metrics, print a progress line every this many seconds')
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(progressInterval=args.progress)
+    try:
+        with metrics.timer('stage/cactus'):
+            resolveCactusTable(args.input, args.output, answerStorePath=args.answers, baseURL=args.base_url, concurrency=args.concurrency,
+                               perHostLimit=args.per_host_limit, requestsPerSecond=args.rate, maxRetries=args.retries)
+    finally:
+        if args.metrics:
+            metrics.disable()
+            metrics.writeSummary(args.metrics)
+
+if __name__ == '__main__':
+    main()
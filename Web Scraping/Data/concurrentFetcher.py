@@ -0,0 +1,167 @@
+import threading  # locks and semaphores shared between worker threads
+import time  # for spacing out requests
+from collections import deque  # sliding window of in-flight futures
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional, TypeVar
+from urllib.parse import urlsplit  # pulls the host out of a url
+
+import requests  # for fetching HTML from URLs
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import metrics  # per-host latency histograms, the entry point puts the cleaning modules on the path
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+retryStatusCodes = (429, 500, 502, 503, 504) # worth another go, everything else is final
+
+
+def makePooledSession(poolSize: int = 8, maxRetries: int = 3, backoffFactor: float = 0.5) -> requests.Session:
+    """
+    Builds a requests Session that keeps connections alive and retries with exponential backoff
+
+    Args:
+        poolSize (int): max number of kept-alive connections per host
+        maxRetries (int): how many times a failed/throttled request is retried
+        backoffFactor (float): sleeps backoffFactor * 2^(attempt - 1) seconds between retries
+
+    Returns:
+        requests.Session: session with the pooled, retrying adapter mounted for http and https
+    """
+    retryPolicy = Retry(
+        total=maxRetries,
+        connect=maxRetries,
+        read=maxRetries,
+        status=maxRetries,
+        backoff_factor=backoffFactor,
+        status_forcelist=retryStatusCodes,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True, # NIST/Cactus send Retry-After when they're annoyed
+        raise_on_status=False # hand the last response back, raise_for_status deals with it
+    )
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retryPolicy)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter that spaces request starts at least 1/requestsPerSecond apart
+    """
+
+    def __init__(self, requestsPerSecond: Optional[float] = None):
+        self.interval = 1.0 / requestsPerSecond if requestsPerSecond else 0.0
+        self.nextSlot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        if self.interval <= 0:
+            return
+        # reserve a slot under the lock, sleep outside it so other threads can reserve theirs
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.nextSlot)
+            self.nextSlot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class PoliteFetcher:
+    """
+    Shared, connection-pooled HTTP client with a per-host concurrency cap, a per-host rate limit and retries
+
+    Use one per scrape and share it between threads; Session connection pools are thread-safe for plain GETs.
+    """
+
+    def __init__(self, concurrency: int = 8, perHostLimit: int = 4, requestsPerSecond: Optional[float] = None,
+                 maxRetries: int = 3, backoffFactor: float = 0.5, timeout: float = 30.0):
+        """
+        Args:
+            concurrency (int): number of worker threads
+            perHostLimit (int): max requests in flight to any single host
+            requestsPerSecond (Optional[float]): max request starts per second per host, None means no limit
+            maxRetries (int): retries for connection errors and 429/5xx responses
+            backoffFactor (float): exponential backoff base in seconds
+            timeout (float): seconds before a single request gives up
+        """
+        self.concurrency = max(1, concurrency)
+        self.perHostLimit = max(1, perHostLimit)
+        self.requestsPerSecond = requestsPerSecond
+        self.timeout = timeout
+        self.session = makePooledSession(max(self.concurrency, self.perHostLimit), maxRetries, backoffFactor)
+
+        self.hostLock = threading.Lock()
+        self.hostSemaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self.hostRateLimiters: Dict[str, RateLimiter] = {}
+
+    def hostGuards(self, url: str):
+        host = urlsplit(url).netloc
+        with self.hostLock:
+            if host not in self.hostSemaphores:
+                self.hostSemaphores[host] = threading.BoundedSemaphore(self.perHostLimit)
+                self.hostRateLimiters[host] = RateLimiter(self.requestsPerSecond)
+            return self.hostSemaphores[host], self.hostRateLimiters[host]
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Polite drop-in for requests.get, blocks until the host has a free slot
+
+        Args:
+            url (str): page to fetch
+            **kwargs: passed straight to Session.get (headers, etc.)
+
+        Returns:
+            requests.Response: the (possibly retried) response, check it with raise_for_status
+        """
+        hostSemaphore, hostRateLimiter = self.hostGuards(url)
+        kwargs.setdefault('timeout', self.timeout)
+        with hostSemaphore:
+            hostRateLimiter.wait()
+            if not metrics.enabled:
+                return self.session.get(url, **kwargs)
+            # latency includes retries and backoff, it's what the scrape actually waited on
+            startTime = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except requests.RequestException:
+                metrics.request(url, time.perf_counter() - startTime, None)
+                raise
+            metrics.request(url, time.perf_counter() - startTime, response.status_code)
+            return response
+
+    def map(self, function: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """
+        Runs function over items on the thread pool, yielding results in the same order as items
+
+        Only a window of concurrency * 4 items is in flight at once, so 70k urls don't all become futures up front.
+
+        Args:
+            function (Callable): called once per item, usually something that calls self.get
+            items (Iterable): inputs, consumed lazily
+
+        Returns:
+            Iterator: function(item) for every item, in input order
+        """
+        windowSize = self.concurrency * 4
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            inFlight = deque()
+            for item in items:
+                inFlight.append(executor.submit(function, item))
+                if len(inFlight) >= windowSize:
+                    yield inFlight.popleft().result()
+            while inFlight:
+                yield inFlight.popleft().result()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
@@ -0,0 +1,181 @@
+import hashlib  # content addresses for the blobs
+import sqlite3  # single-file index + blob store, no server needed
+import threading  # the concurrent scraper writes from several threads
+import time  # fetch timestamps
+import zlib  # fallback compression when zstandard isn't installed
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from scrapeJournal import recordKey  # same RecordID normalization as the checkpoint journal
+
+try:
+    import zstandard  # much faster than zlib at a better ratio, but optional
+except ImportError:
+    zstandard = None
+
+
+def compressPage(pageHTML: str) -> Tuple[str, bytes]:
+    """
+    Compresses a page with zstd if available, zlib otherwise
+
+    Returns:
+        Tuple with:
+        - codec (str): 'zstd' or 'zlib', stored next to the blob so either kind can be read back
+        - data (bytes): compressed page
+    """
+    rawBytes = pageHTML.encode('utf-8')
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(rawBytes)
+    return 'zlib', zlib.compress(rawBytes, 6)
+
+
+def decompressPage(codec: str, data: bytes) -> str:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Page was stored with zstd, install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    return zlib.decompress(data).decode('utf-8')
+
+
+def pageHash(pageHTML: str) -> str:
+    # what blobs are keyed by, and what a sync compares a re-fetched page against
+    return hashlib.sha256(pageHTML.encode('utf-8')).hexdigest()
+
+
+class PageStore:
+    """
+    Compressed, content-addressed store of raw record pages, keyed by RecordID
+
+    Blobs are keyed by the sha256 of the page, so identical pages are only stored once; the pages table maps
+    RecordID -> url + blob hash, plus the ETag/Last-Modified the server sent so a sync can ask "changed since?".
+    Everything lives in one SQLite file so it can be copied around like a csv.
+    """
+
+    def __init__(self, storePath: str):
+        self.storePath = storePath
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(storePath, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                contentHash TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                data BLOB NOT NULL
+            )''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                recordID TEXT PRIMARY KEY,
+                url TEXT,
+                contentHash TEXT NOT NULL REFERENCES blobs(contentHash),
+                fetchedAt REAL
+            )''')
+        # stores from before incremental sync don't have the validator columns yet
+        pageColumns = {row[1] for row in self.connection.execute('PRAGMA table_info(pages)')}
+        for columnName in ('etag', 'lastModified'):
+            if columnName not in pageColumns:
+                self.connection.execute(f'ALTER TABLE pages ADD COLUMN {columnName} TEXT')
+        self.connection.commit()
+
+    def put(self, recordID: Any, url: str, pageHTML: str, etag: Optional[str] = None, lastModified: Optional[str] = None) -> str:
+        """
+        Stores a fetched page, replacing whatever was stored for that RecordID before
+
+        Args:
+            recordID (Any): NIST RecordID, normalized to a string key
+            url (str): where the page came from
+            pageHTML (str): raw page
+            etag (Optional[str]): the response's ETag header, if it had one
+            lastModified (Optional[str]): the response's Last-Modified header, if it had one
+
+        Returns:
+            str: sha256 content hash of the page
+        """
+        contentHash = pageHash(pageHTML)
+        with self.lock:
+            blobExists = self.connection.execute(
+                'SELECT 1 FROM blobs WHERE contentHash = ?', (contentHash,)).fetchone()
+            if not blobExists:
+                codec, data = compressPage(pageHTML)
+                self.connection.execute('INSERT INTO blobs VALUES (?, ?, ?)', (contentHash, codec, data))
+            self.connection.execute('INSERT OR REPLACE INTO pages (recordID, url, contentHash, fetchedAt, etag, lastModified) '
+                                    'VALUES (?, ?, ?, ?, ?, ?)',
+                                    (recordKey(recordID), url, contentHash, time.time(), etag, lastModified))
+            self.connection.commit()
+        return contentHash
+
+    def touch(self, revalidated: Iterable[Tuple[Any, Optional[str], Optional[str]]]) -> None:
+        """
+        Marks stored pages as still current (revalidated, unchanged), keeping the newest validators the server sent
+
+        Args:
+            revalidated (Iterable[Tuple]): (recordID, etag, lastModified), None for a header the server didn't send
+        """
+        touchedAt = time.time()
+        with self.lock:
+            self.connection.executemany('''
+                UPDATE pages SET fetchedAt = ?, etag = COALESCE(?, etag), lastModified = COALESCE(?, lastModified)
+                WHERE recordID = ?''', [(touchedAt, etag, lastModified, recordKey(recordID)) for recordID, etag, lastModified in revalidated])
+            self.connection.commit()
+
+    def validators(self, recordIDs: Optional[Iterable[Any]] = None) -> Dict[str, Tuple[str, str, Optional[str], Optional[str], float]]:
+        """
+        What a revalidation needs for each stored page, without touching the blobs
+
+        Args:
+            recordIDs (Optional[Iterable[Any]]): only these, every stored page if None
+
+        Returns:
+            Dict[str, Tuple]: normalized RecordID -> (url, contentHash, etag, lastModified, fetchedAt)
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT recordID, url, contentHash, etag, lastModified, fetchedAt FROM pages').fetchall()
+        pageValidators = {row[0]: row[1:] for row in rows}
+        if recordIDs is None:
+            return pageValidators
+        return {key: pageValidators[key] for key in map(recordKey, recordIDs) if key in pageValidators}
+
+    def get(self, recordID: Any) -> Optional[str]:
+        """
+        Gets the stored page for a RecordID, None if it was never fetched
+        """
+        with self.lock:
+            row = self.connection.execute('''
+                SELECT blobs.codec, blobs.data FROM pages JOIN blobs USING (contentHash)
+                WHERE pages.recordID = ?''', (recordKey(recordID),)).fetchone()
+        if row is None:
+            return None
+        return decompressPage(row[0], row[1])
+
+    def __contains__(self, recordID: Any) -> bool:
+        with self.lock:
+            return self.connection.execute(
+                'SELECT 1 FROM pages WHERE recordID = ?', (recordKey(recordID),)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def iterPages(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        Streams every stored page without loading the corpus into memory
+
+        Returns:
+            Iterator: (recordID, url, pageHTML) tuples in RecordID order
+        """
+        cursor = self.connection.cursor() # own cursor so iterating doesn't hold the lock between pages
+        cursor.execute('''
+            SELECT pages.recordID, pages.url, blobs.codec, blobs.data FROM pages JOIN blobs USING (contentHash)
+            ORDER BY CAST(pages.recordID AS INTEGER)''')
+        for recordID, url, codec, data in cursor:
+            yield recordID, url, decompressPage(codec, data)
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
@@ -1,116 +1,41 @@
 import pandas as pd  # dealing with weird lists and datatypes
 import requests  # for fetching HTML from URLs
-import re as regex  # HTML parser
 import os  # checks if file exists
-from typing import List, Dict, Optional, Tuple, Any, Union # allows specification of datatype 
-import cirpy # for chemical name (eg. (CH_3)2(CH_2O_2)CC(O)CH_3) to SMILES conversion
-
-# pre-compile regex patterns to make it faster
-preExpFactorPattern = regex.compile(r'(\d+\.\d+)\s*[Xx]?\s*10\s*<sup>\s*([+-]?\s*\d+)\s*</sup>', regex.IGNORECASE) # ignores alphabet case, ie. A vs. a
-activEnergyPattern = regex.compile(r'e\s*<sup>\s*([+-]?\d+)\s*\[.*?\]/RT\s*</sup>', regex.IGNORECASE)
-rxnPattern = regex.compile(r'<B>Reaction:</B>(.*?)(?:<BR>|$)', regex.IGNORECASE | regex.DOTALL)
-temperaturePattern = regex.compile(r'<B>Temperature:</B>\s*(?:&nbsp;)*\s*([0-9]+(?:\.?[0-9]*)?\s*K?)(?:\s*-\s*([0-9]+(?:\.?[0-9]*)?\s*K?))?', regex.IGNORECASE)
-reactionOrderPattern = regex.compile(r'<B>Reaction\s+Order:</B>\s*(?:&nbsp;|\s)*(\d)', regex.IGNORECASE)
-tempRatioExpPattern = regex.compile(r'\(T\s*/298 \s* K\) \s* <sup> (-?\d+)', regex.IGNORECASE)
-
-def extractParams(pageHTMLParam: str) -> Optional[Tuple[str, str, str, List[str], List[str], str]]:
-    """
-    Extracts parameters from the HTML content (given as plain text) of a reaction page.
-    
-    Args:
-        pageHTMLParam (str): The HTML content of the reaction page as a string
+import sys
+import time  # page ages for --max-age
+from typing import Dict, Optional, Tuple, Any # allows specification of datatype 
+import argparse  # command line options
 
-    Returns:
-        Tuple with:
-        - preExpFactorCoeff (str): Coefficient of the pre-exponential factor
-        - preExpFactorPower (str): Power of ten of the pre-exponential factor
-        - activEnergy (str): Activation energy
-        - reactants (List[str]): List of reactants as strings
-        - products (List[str]): List of products as strings
-    """
-    preExpFactorCoeff = ''
-    preExpFactorPower = ''
-    activEnergy = ''
-    temperature = ''
-    reactionOrder = ''
-    tempRatioExp = ''
-    reactants = ['', '', '']
-    reactantsRaw = []
-    products = ['', '', '']
-    productsRaw = []
-    rxnParts = []
-    
-    temperatureMatchObj = regex.search(temperaturePattern, pageHTMLParam)
-    if temperatureMatchObj:
-        temperature = temperatureMatchObj.group(1).strip() # (1) refers to first 'capturing group' (regex only captures stuff inside ()s, called capturing groups)
-
-    reactionOrderMatchObj = regex.search(reactionOrderPattern, pageHTMLParam)
-    if reactionOrderMatchObj:
-        reactionOrder = reactionOrderMatchObj.group(1).strip()
-
-    tempRatioExpMatchObj = regex.search(tempRatioExpPattern, pageHTMLParam)
-    if tempRatioExpMatchObj:
-        tempRatioExp = tempRatioExpMatchObj.group(1).strip()
-
-    preExpFactorMatchObj = regex.search(preExpFactorPattern, pageHTMLParam)
-    if preExpFactorMatchObj:
-        preExpFactorCoeff = preExpFactorMatchObj.group(1).strip()
-        preExpFactorPower = preExpFactorMatchObj.group(2).strip()
-    
-    activEnergyMatchObj = regex.search(activEnergyPattern, pageHTMLParam)
-    if activEnergyMatchObj:
-        activEnergy = activEnergyMatchObj.group(1).strip()
-
-    rxnMatchObj = regex.search(rxnPattern, pageHTMLParam)
-
-    if rxnMatchObj:
-        # Clean and normalize the reaction HTML string
-        rxnHTML = rxnMatchObj.group(1).strip()
-        rxnHTML = rxnHTML.replace('&nbsp;', ' ')
-        rxnHTML = rxnHTML.replace('&plus;', '+')
-        rxnHTML = rxnHTML.replace('&plus', '+')
-        rxnHTML = rxnHTML.replace('&middot;', '(.)')
-        rxnHTML = rxnHTML.replace('((.))', '(.)')
-        rxnHTML = rxnHTML.replace('⇒', '->')
-        rxnHTML = rxnHTML.replace('⟶', '->')
-        rxnHTML = rxnHTML.replace('→', '->')
-        rxnHTML = rxnHTML.replace('<sub>', '')
-        rxnHTML = rxnHTML.replace('</sub>', '')
-        rxnHTML = rxnHTML.replace('â‰¡', '≡')
-        rxnHTML = regex.sub(r'<.*?>', '', rxnHTML) # Strip all remaining HTML tags
-        rxnHTML = regex.sub(r'\s+', ' ', rxnHTML).strip()
-        rxnParts = rxnHTML.split('->')
-
-        # split rxn, then split reactants and products
-        if len(rxnParts) >= 2:
-            reactantsRaw = rxnParts[0].split('+')
-            productsRaw = rxnParts[1].split('+')
-        else:
-            return ('Parse Error',) * 10
-        
-        # replaces empty entries of reactants list; doing this to avoid out of index error
-        for i in range(3):
-            if len(reactantsRaw) > i:
-                reactants[i] = reactantsRaw[i]
-            if len(productsRaw) > i:
-                products[i] = productsRaw[i]
-
-        reactants = [r.strip() for r in reactants]
-        products = [p.strip() for p in products]
-
-    print(rxnParts)
-    print(reactants)
-    print(products)
-    
-    return preExpFactorCoeff, preExpFactorPower, activEnergy, reactants[0], reactants[1], reactants[2], products[0], products[1], products[2], temperature, reactionOrder, tempRatioExp 
+cleaningDirectory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'Data Cleaning & Transformation')
+if cleaningDirectory not in sys.path:
+    sys.path.insert(0, cleaningDirectory) # shared table formats and run metrics live with the cleaning modules
+from concurrentFetcher import PoliteFetcher  # pooled keep-alive session, per-host limits, retries
+from scrapeJournal import CheckpointJournal, recordKey, removedMarker  # append-only checkpoints keyed by RecordID
+from pageStore import PageStore, pageHash  # compressed raw pages, so regex changes don't mean re-downloading everything
+from recordParser import extractParams, extractParamsBatch, newColumnNames  # regexes live here so workers import them cheaply
 
-def fetchAndExtract(url: str, rowIndex: int) -> Optional[Tuple[str, str, str, str, str, str, str, str, str, str, str]]:
+from tableStore import writeTable  # csv, or parquet/arrow when the output path says so
+from instrumentation import metrics  # stage timers and counters, --metrics turns them on
+
+# for cross reference with original 'NIST Records.csv' file
+columns2keep = [
+    'RecordID',
+    'RID',
+    'Squib',
+    'ReactionOrder'
+]
+
+def fetchAndExtract(url: str, rowIndex: int, fetcher: Optional[PoliteFetcher] = None, pageStore: Optional[PageStore] = None,
+                    recordID: Any = None) -> Optional[Tuple[str, str, str, str, str, str, str, str, str, str, str]]:
     """
     Gets url from overarching function, extracts with extractParams
     
     Args:
         url (str): reaction page url from NIST 
         rowIndex (int): index of row in dataframe
+        fetcher (Optional[PoliteFetcher]): shared pooled client, plain requests.get if None
+        pageStore (Optional[PageStore]): if given, the raw page is saved under recordID before extracting
+        recordID (Any): NIST RecordID of the page, only needed with pageStore
 
     Returns:
         Tuple with:
@@ -121,30 +46,51 @@ def fetchAndExtract(url: str, rowIndex: int) -> Optional[Tuple[str, str, str, st
         - products (List[str]): List of products as strings
     """
     try:
-        response = requests.get(url)
+        response = fetcher.get(url) if fetcher else requests.get(url)
         response.raise_for_status()  # Raise an error for bad responses
         pageHTML = response.text # turns it into a string so regex can parse
+        if pageStore is not None:
+            with metrics.timer('scrape/page store'):
+                pageStore.put(recordID, url, pageHTML, response.headers.get('ETag'), response.headers.get('Last-Modified'))
         
-        extractedParams = extractParams(pageHTML)
+        with metrics.timer('scrape/parse'):
+            extractedParams = extractParams(pageHTML)
         if extractedParams:
             return extractedParams
-        elif not extractedParams or len(extractedParams) != 10:
-            return ('Parse Error',) * 10
+        elif not extractedParams or len(extractedParams) != len(newColumnNames):
+            metrics.count('scrape/parse errors')
+            return ('Parse Error',) * len(newColumnNames)
     except requests.RequestException as e:
         print(f"Error fetching URL at row {rowIndex + 1}: {e}")
-        return ('Url Fetch Error',) * 10
+        metrics.count('scrape/fetch errors')
+        return ('Url Fetch Error',) * len(newColumnNames)
 
-def scrapeDatabaseWithPandas(inputCSVPath: str, outputCSVPath: str) -> None:
+def scrapeDatabaseWithPandas(inputCSVPath: str, outputCSVPath: str, concurrency: int = 1, perHostLimit: int = 4,
+                             requestsPerSecond: Optional[float] = None, maxRetries: int = 3,
+                             checkpointPath: str = 'checkpoint.jsonl', resume: bool = False,
+                             pageStorePath: Optional[str] = 'pages.sqlite') -> None:
     """
     Tells fetchAndExtract what url to parse iteratively, saving to new file
 
+    With concurrency > 1 the pages are fetched on a thread pool over one pooled keep-alive session,
+    results still come back in input (RecordID) order so checkpoints and the output line up with the original rows
+
+    Every checkpointInterval rows only the new rows get appended to the journal at checkpointPath, and the
+    output csv is written from the journal at the end, so a crashed run can pick up where it left off with resume=True
+
     Args:
         inputCSVPath (str): original 'NIST Records.csv' file from the dude on github, with links and other data
-        outputCSVPath (str): fresh file
+        outputCSVPath (str): fresh file, .parquet or .arrow for a columnar table (needs pyarrow)
+        concurrency (int): number of pages fetched at once, 1 keeps the old one-at-a-time behaviour
+        perHostLimit (int): max requests in flight to kinetics.nist.gov at once
+        requestsPerSecond (Optional[float]): max request starts per second, None means no limit
+        maxRetries (int): retries with exponential backoff on connection errors and 429/5xx responses
+        checkpointPath (str): append-only JSONL journal of scraped rows, keyed by RecordID
+        resume (bool): skip records already in the journal instead of starting over (fetch errors get retried)
+        pageStorePath (Optional[str]): where raw pages get kept for offline re-extraction, None to not keep them
     """
     if not os.path.exists(inputCSVPath):
         raise FileNotFoundError(f"Input file {inputCSVPath} does not exist.")
-        return
 
 
     try:
@@ -152,91 +98,368 @@ def scrapeDatabaseWithPandas(inputCSVPath: str, outputCSVPath: str) -> None:
         print("Successfully read input CSV file.")
     except Exception as e:
         print("Error reading the CSV file:", e)
-        return
+        raise
     
     urlColumn = dataframe.columns[3] # urls in 4th column, index 3
 
-    latestAllRows = [] # temporary array I save to every time
+    pendingRows = [] # rows scraped since the last checkpoint, only these get appended
     checkpointInterval = 50 # save every 50 rows
-    checkpointPath = 'checkpoint.csv'
-
-    # for cross reference with original 'NIST Records.csv' file
-    columns2keep = [
-        'RecordID',
-        'RID',
-        'Squib',
-        'ReactionOrder'
-    ]
+    journal = CheckpointJournal(checkpointPath)
+
     originalDataSubset = dataframe[columns2keep].copy()
-    newColumnNames = [
-        'Pre-Exp Factor Coeff',
-        'Pre-Exp Factor Power',
-        'Activation Energy',
-        'Reactant 1',
-        'Reactant 2',
-        'Reactant 3',
-        'Product 1',
-        'Product 2',
-        'Product 3',
-        'Temperature',
-        'Reaction Order',
-        'Temperature Ratio Exponent'
-    ]
-
-    for rowIndex, rowContents in dataframe.iterrows():
-
-        url = rowContents[urlColumn]
-        extractedParams = fetchAndExtract(url, rowIndex)
-        latestAllRows.append(extractedParams)
-
-        if (len(latestAllRows) % checkpointInterval == 0): # if divisible by checkpoint, save
+
+    if resume:
+        completedKeys = journal.completedKeys(requiredColumns=newColumnNames)
+        toScrapeMask = ~dataframe['RecordID'].map(recordKey).isin(completedKeys)
+        print(f"Resuming: {len(dataframe) - toScrapeMask.sum()} records already journaled, {toScrapeMask.sum()} to go.")
+    else:
+        journal.reset()
+        toScrapeMask = pd.Series(True, index=dataframe.index)
+
+    toScrapeRows = dataframe.index[toScrapeMask]
+    toScrapeUrls = dataframe.loc[toScrapeRows, urlColumn]
+    pageStore = PageStore(pageStorePath) if pageStorePath else None
+
+    if concurrency > 1:
+        fetcher = PoliteFetcher(concurrency=concurrency, perHostLimit=perHostLimit,
+                                requestsPerSecond=requestsPerSecond, maxRetries=maxRetries)
+        # fetcher.map keeps input order, so rowIndex still lines up with the original dataframe
+        extractedIterator = fetcher.map(
+            lambda indexAndUrl: fetchAndExtract(indexAndUrl[1], indexAndUrl[0], fetcher, pageStore,
+                                                dataframe.at[indexAndUrl[0], 'RecordID']),
+            zip(toScrapeRows, toScrapeUrls))
+    else:
+        fetcher = None
+        extractedIterator = (fetchAndExtract(url, rowIndex, None, pageStore, dataframe.at[rowIndex, 'RecordID'])
+                             for rowIndex, url in zip(toScrapeRows, toScrapeUrls))
+
+    for scrapedCount, (rowIndex, extractedParams) in enumerate(zip(toScrapeRows, extractedIterator), start=1):
+
+        # original columns + extracted fields, keyed by RecordID in the journal
+        journalRow = dict(zip(columns2keep, originalDataSubset.loc[rowIndex].tolist()))
+        journalRow.update(zip(newColumnNames, extractedParams))
+        pendingRows.append(journalRow)
+        metrics.rows('scrape', 1)
+
+        if (scrapedCount % checkpointInterval == 0): # if divisible by checkpoint, save
             try:
-                # get processed rows from original subset, works like a mask i think
-                processedOriginalRows = originalDataSubset.iloc[:len(latestAllRows)]
-                
-                # Create extracted dataframe
-                extractedDataframe = pd.DataFrame(latestAllRows, columns=newColumnNames)
-                
-                # Combine extracted dataframe with stuff I want to keep from old
-                combinedDataframe = pd.concat([
-                    processedOriginalRows.reset_index(drop=True), 
-                    extractedDataframe
-                ], axis=1)
-                
-                # Save checkpoint
-                combinedDataframe.to_csv(checkpointPath, index=False, encoding='utf-8')
-                print(f"Checkpoint saved at {len(latestAllRows)} rows with {combinedDataframe.shape[1]} columns.")
-                
+                with metrics.timer('scrape/checkpoint'):
+                    journal.append(pendingRows)
+                print(f"Checkpoint saved at {scrapedCount} rows, appended {len(pendingRows)} to {checkpointPath}.")
+                pendingRows = []
             except Exception as e:
                 print(f"Checkpoint save failed: {e}")
 
         rowNumber = rowIndex + 1
         
         # Check if the row number is exactly one of our milestones
-        if rowNumber < 70000:
-            print(f"--- Milestone: '{rowNumber}' links scraped ---")
         if rowNumber % 100 == 0:
             print(f"--- Milestone: '{rowNumber}' links scraped")
 
-    extractedDataframe = pd.DataFrame(latestAllRows, columns = newColumnNames) # I think it already was a dataframe but this made it work soooo
-
-    
+    if fetcher:
+        fetcher.close()
+    if pageStore:
+        pageStore.close()
 
-    # finalDataframe = pd.concat([dataframe, extractedDataframe], axis=1) # this is wrong, extracted has duplicate junk
+    journal.append(pendingRows) # whatever's left since the last checkpoint
 
+    # build the final file straight from the journal, in the same order as the input records
     try:
-        extractedDataframe.to_csv(outputCSVPath, index=False, encoding='utf-8')
-        print("Extraction complete")
+        with metrics.timer('scrape/write output'):
+            outputDataframe = journal.latestDataframe(columns2keep + newColumnNames, keyOrder=dataframe['RecordID'])
+            writeTable(outputDataframe, outputCSVPath)
+        print(f"Extraction complete, {len(outputDataframe)} rows written")
     except Exception as e:
         print("Error writing to output CSV file:", e)
+        raise
+
+def reextractFromPageStore(inputCSVPath: str, outputCSVPath: str, pageStorePath: str = 'pages.sqlite',
+                           workers: Optional[int] = None) -> None:
+    """
+    Re-runs extractParams over the stored pages, no network at all, for when one of the regexes changes
+
+    Args:
+        inputCSVPath (str): original 'NIST Records.csv', for the RecordID order and the columns to keep
+        outputCSVPath (str): fresh file, same columns as a normal scrape
+        pageStorePath (str): page store filled by an earlier scrape
+        workers (Optional[int]): extraction processes, all cpus if None (serial on one cpu or a small store)
+    """
+    if not os.path.exists(pageStorePath):
+        raise FileNotFoundError(f"Page store {pageStorePath} does not exist, scrape with it enabled first.")
+
+    dataframe = pd.read_csv(inputCSVPath, usecols=columns2keep) # the urls aren't needed, pages come from the store
+    with PageStore(pageStorePath) as pageStore:
+        cachedMask = dataframe['RecordID'].map(lambda recordID: recordID in pageStore)
+        cachedRows = dataframe.loc[cachedMask, columns2keep]
+        missingCount = int((~cachedMask).sum())
+
+        # pages are read lazily and parsed on a process pool, results come back in the same order
+        pageIterator = (pageStore.get(recordID) for recordID in cachedRows['RecordID'])
+        extractedRows = []
+        for originalRow, extractedParams in zip(cachedRows.itertuples(index=False),
+                                                extractParamsBatch(pageIterator, workers=workers)):
+            if not extractedParams or len(extractedParams) != len(newColumnNames):
+                extractedParams = ('Parse Error',) * len(newColumnNames)
+            extractedRows.append(tuple(originalRow) + tuple(extractedParams))
+    metrics.rows('reextract', len(extractedRows))
+
+    with metrics.timer('reextract/write output'):
+        writeTable(pd.DataFrame(extractedRows, columns=columns2keep + newColumnNames), outputCSVPath)
+    print(f"Re-extracted {len(extractedRows)} cached pages, {missingCount} records not in the page store")
+
+def cellKey(value: Any) -> str:
+    # compares input cells with journaled ones: NaN/None are '', 2 and 2.0 are the same number
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def revalidateRecord(fetcher: PoliteFetcher, url: str, recordID: Any, pageStore: PageStore,
+                     storedValidators: Optional[Tuple] = None) -> Tuple[str, Optional[Tuple], Optional[str], Optional[str]]:
+    """
+    Fetches one record page for a sync, conditionally when the page store has it from the same url
+
+    With stored validators the request carries If-None-Match/If-Modified-Since and a 304 ends it; servers that
+    send neither header get the page back in full, and its sha256 against the stored one decides. Only a page
+    that's new or actually different gets stored and run through extractParams.
+
+    Args:
+        fetcher (PoliteFetcher): shared pooled client
+        url (str): record page url from the input list
+        recordID (Any): NIST RecordID
+        pageStore (PageStore): stored pages and their validators
+        storedValidators (Optional[Tuple]): (url, contentHash, etag, lastModified, fetchedAt) from the page store,
+            None to fetch unconditionally
+
+    Returns:
+        Tuple with:
+        - outcome (str): 'not modified', 'same content', 'new content' or 'fetch error'
+        - extractedParams (Optional[Tuple]): fields from the new page, only for 'new content'
+        - etag (Optional[str]): ETag the server sent
+        - lastModified (Optional[str]): Last-Modified the server sent
+    """
+    conditionalHeaders = {}
+    if storedValidators is not None:
+        storedUrl, storedHash, storedETag, storedLastModified, fetchedAt = storedValidators
+        if storedETag:
+            conditionalHeaders['If-None-Match'] = storedETag
+        if storedLastModified:
+            conditionalHeaders['If-Modified-Since'] = storedLastModified
+    try:
+        response = fetcher.get(url, headers=conditionalHeaders)
+        if response.status_code == 304:
+            return 'not modified', None, response.headers.get('ETag'), response.headers.get('Last-Modified')
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Error revalidating record {recordID}: {e}")
+        return 'fetch error', None, None, None
+
+    pageHTML = response.text
+    etag, lastModified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    if storedValidators is not None and pageHash(pageHTML) == storedHash:
+        return 'same content', None, etag, lastModified
+
+    with metrics.timer('sync/page store'):
+        pageStore.put(recordID, url, pageHTML, etag, lastModified)
+    with metrics.timer('sync/parse'):
+        extractedParams = extractParams(pageHTML, verbose=False)
+    if not extractedParams or len(extractedParams) != len(newColumnNames):
+        extractedParams = ('Parse Error',) * len(newColumnNames)
+    return 'new content', extractedParams, etag, lastModified
+
+def syncDatabase(inputCSVPath: str, outputCSVPath: str, concurrency: int = 8, perHostLimit: int = 4,
+                 requestsPerSecond: Optional[float] = None, maxRetries: int = 3, checkpointPath: str = 'checkpoint.jsonl',
+                 pageStorePath: str = 'pages.sqlite', maxAge: Optional[float] = None,
+                 reportPath: Optional[str] = 'sync report.csv') -> Dict[str, int]:
+    """
+    Brings an earlier scrape up to date with the record list without scraping everything again
+
+    The input list is diffed against the journal by RecordID (and RID): records the journal doesn't have (or only
+    has as fetch errors) are fetched and extracted, records that disappeared from the list are dropped from the
+    output (and marked removed in the journal), and every other record is revalidated with a conditional request (see revalidateRecord), so an
+    unchanged page costs one small request and no parsing. Journal rows only get appended for what changed, and
+    the output is rewritten from the journal in input order like a normal scrape.
+
+    Args:
+        inputCSVPath (str): current 'NIST Records.csv', with the urls in the 4th column
+        outputCSVPath (str): fresh file, .parquet or .arrow for a columnar table (needs pyarrow)
+        concurrency (int): requests in flight at once
+        perHostLimit (int): max requests in flight to kinetics.nist.gov at once
+        requestsPerSecond (Optional[float]): max request starts per second, None means no limit
+        maxRetries (int): retries with exponential backoff on connection errors and 429/5xx responses
+        checkpointPath (str): journal of the earlier scrape, appended to
+        pageStorePath (str): page store of the earlier scrape, revalidation needs the stored hashes/validators
+        maxAge (Optional[float]): seconds; pages fetched or revalidated more recently than this are trusted
+            without a request, None revalidates everything
+        reportPath (Optional[str]): csv listing every added/changed/removed/failed record, None to not write one
+
+    Returns:
+        Dict[str, int]: how many records were added, changed, unchanged, removed or failed, plus request counts
+    """
+    if not os.path.exists(inputCSVPath):
+        raise FileNotFoundError(f"Input file {inputCSVPath} does not exist.")
+    dataframe = pd.read_csv(inputCSVPath)
+    urlColumn = dataframe.columns[3] # urls in 4th column, index 3
+    inputKeys = dataframe['RecordID'].map(recordKey)
+
+    journal = CheckpointJournal(checkpointPath)
+    latestRows = journal.latestRows()
+    completedKeys = journal.completedKeys(requiredColumns=newColumnNames)
+    inputKeySet = set(inputKeys)
+    # already-removed records were reported by the sync that removed them
+    removedKeys = [key for key in latestRows if key not in inputKeySet and latestRows[key].get(newColumnNames[0]) != removedMarker]
+
+    syncStats = {'input records': len(dataframe), 'added': 0, 'changed': 0, 'unchanged': 0, 'removed': len(removedKeys),
+                 'errors': 0, 'not modified (304)': 0, 'same content': 0, 'page changed, fields same': 0,
+                 'skipped (recent)': 0}
+    reportRows = [{'RecordID': key, 'RID': latestRows[key].get('RID'), 'Change': 'removed'} for key in removedKeys]
+
+    # what each record needs: a plain fetch (new), a conditional one (known), or nothing (revalidated recently)
+    now = time.time()
+    tasks = []
+    with PageStore(pageStorePath) as pageStore:
+        storedValidators = pageStore.validators()
+        for rowIndex, key, url in zip(dataframe.index, inputKeys, dataframe[urlColumn]):
+            journalRow = latestRows.get(key)
+            if key not in completedKeys:
+                tasks.append((rowIndex, 'new', None))
+                continue
+            pageValidators = storedValidators.get(key)
+            sameRecord = pageValidators is not None and pageValidators[0] == url and \
+                cellKey(journalRow.get('RID')) == cellKey(dataframe.at[rowIndex, 'RID'])
+            if not sameRecord:
+                tasks.append((rowIndex, 'refetch', None)) # moved, re-numbered or never stored: compare the fields instead
+            elif maxAge is not None and pageValidators[4] is not None and now - pageValidators[4] < maxAge:
+                tasks.append((rowIndex, 'recent', None))
+            else:
+                tasks.append((rowIndex, 'revalidate', pageValidators))
+        print(f"Sync: {len(dataframe)} records listed, {sum(task[1] == 'new' for task in tasks)} new, "
+              f"{sum(task[1] in ('refetch', 'revalidate') for task in tasks)} to revalidate, {len(removedKeys)} removed.")
+
+        def runTask(task):
+            rowIndex, taskType, pageValidators = task
+            if taskType == 'recent':
+                return task, 'recent', None, None, None
+            with metrics.timer('sync/revalidate'):
+                return (task,) + revalidateRecord(fetcher, dataframe.at[rowIndex, urlColumn], dataframe.at[rowIndex, 'RecordID'],
+                                                  pageStore, pageValidators)
+
+        pendingRows, touchedPages = [], []
+        with PoliteFetcher(concurrency=concurrency, perHostLimit=perHostLimit, requestsPerSecond=requestsPerSecond,
+                           maxRetries=maxRetries) as fetcher:
+            for doneCount, ((rowIndex, taskType, pageValidators), outcome, extractedParams, etag, lastModified) in \
+                    enumerate(fetcher.map(runTask, tasks), start=1):
+                key = inputKeys.at[rowIndex]
+                journalRow = latestRows.get(key)
+                originalValues = dataframe.loc[rowIndex, columns2keep].tolist()
+                # unchanged pages can still come with changed Squib/ReactionOrder in the list
+                metadataChanged = journalRow is not None and \
+                    [cellKey(value) for value in originalValues] != [cellKey(journalRow.get(column)) for column in columns2keep]
+
+                newRow, change = None, None # change is what goes in the report, None for unchanged
+                if outcome == 'fetch error':
+                    change = 'error'
+                    if taskType == 'new': # journaled like a scrape would, so the next sync or resume retries it
+                        newRow = dict(zip(columns2keep, originalValues))
+                        newRow.update(zip(newColumnNames, ('Url Fetch Error',) * len(newColumnNames)))
+                elif outcome == 'new content':
+                    newRow = dict(zip(columns2keep, originalValues))
+                    newRow.update(zip(newColumnNames, extractedParams))
+                    if taskType == 'new':
+                        change = 'added'
+                    elif metadataChanged or [cellKey(value) for value in extractedParams] != \
+                            [cellKey(journalRow.get(column)) for column in newColumnNames]:
+                        change = 'changed'
+                    else:
+                        newRow = None # the page changed somewhere the parser doesn't look
+                        syncStats['page changed, fields same'] += 1
+                else:
+                    if outcome != 'recent':
+                        touchedPages.append((key, etag, lastModified))
+                    syncStats[{'not modified': 'not modified (304)', 'same content': 'same content',
+                               'recent': 'skipped (recent)'}[outcome]] += 1
+                    if metadataChanged:
+                        newRow = {**journalRow, **dict(zip(columns2keep, originalValues))}
+                        change = 'changed'
+
+                syncStats[{'error': 'errors', None: 'unchanged'}.get(change, change)] += 1
+                if change is not None:
+                    reportRows.append({'RecordID': key, 'RID': dataframe.at[rowIndex, 'RID'], 'Change': change})
+                if newRow is not None:
+                    pendingRows.append(newRow)
+                    latestRows[key] = newRow
+                metrics.rows('sync', 1)
+
+                if doneCount % 500 == 0:
+                    journal.append(pendingRows)
+                    pageStore.touch(touchedPages)
+                    pendingRows, touchedPages = [], []
+                    print(f"--- Milestone: '{doneCount}' of {len(tasks)} records synced ---")
+
+        # removals get a marker row so the next sync doesn't report them again (and re-adds them if they come back)
+        journal.append(pendingRows + [{**{column: latestRows[key].get(column) for column in columns2keep},
+                                       **dict.fromkeys(newColumnNames, removedMarker)} for key in removedKeys])
+        pageStore.touch(touchedPages)
+
+    # same output a full scrape would write: latest row per record, in list order, removed records left out
+    with metrics.timer('sync/write output'):
+        outputRows = [latestRows[key] for key in inputKeys if key in latestRows]
+        writeTable(pd.DataFrame(outputRows, columns=columns2keep + newColumnNames), outputCSVPath)
+    if reportPath:
+        pd.DataFrame(reportRows, columns=['RecordID', 'RID', 'Change']).to_csv(reportPath, index=False)
+    for statName, statValue in syncStats.items():
+        metrics.count(f"sync/{statName}", statValue)
+    print(f"Sync complete: {syncStats}")
+    return syncStats
 
 def main():
-    inputCSVPath = 'NIST Records.csv'
-    outputCSVPath = 'extracted.csv'
-    
+    parser = argparse.ArgumentParser(description='Scrape the NIST Reaction Kinetics record pages')
+    parser.add_argument('--input', default='NIST Records.csv', help='csv with the record urls in the 4th column')
+    parser.add_argument('--output', default='extracted.csv', help='.csv, or .parquet/.arrow for a columnar table')
+    parser.add_argument('--concurrency', type=int, default=1, help='pages fetched at once (1 = serial)')
+    parser.add_argument('--per-host-limit', type=int, default=4, help='max requests in flight per host')
+    parser.add_argument('--rate', type=float, default=None, help='max requests per second per host')
+    parser.add_argument('--retries', type=int, default=3, help='retries with backoff on errors and 429/5xx')
+    parser.add_argument('--checkpoint', default='checkpoint.jsonl', help='append-only journal of scraped rows')
+    parser.add_argument('--resume', action='store_true', help='skip records already in the checkpoint journal')
+    parser.add_argument('--page-store', default='pages.sqlite', help='compressed store of the raw record pages')
+    parser.add_argument('--no-page-store', action='store_true', help="don't keep the raw pages")
+    parser.add_argument('--from-cache', action='store_true', help='re-extract from the page store, no network')
+    parser.add_argument('--workers', type=int, default=None, help='extraction processes for --from-cache (default: all cpus)')
+    parser.add_argument('--sync', action='store_true', help='only fetch new records and revalidate the rest (needs an earlier scrape)')
+    parser.add_argument('--max-age', type=float, default=None, help='with --sync, trust pages checked less than this many hours ago')
+    parser.add_argument('--sync-report', default='sync report.csv', help='with --sync, csv of added/changed/removed records')
+    parser.add_argument('--metrics', default=None, help='write a JSON summary of timers, latencies and rates here')
+    parser.add_argument('--progress', type=float, default=None, help='with --metrics, print a progress line every this many seconds')
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(progressInterval=args.progress)
     try:
-        scrapeDatabaseWithPandas(inputCSVPath, outputCSVPath)
+        if args.from_cache:
+            with metrics.timer('stage/reextract'):
+                reextractFromPageStore(args.input, args.output, args.page_store, workers=args.workers)
+            return
+        if args.sync:
+            with metrics.timer('stage/sync'):
+                syncDatabase(args.input, args.output, concurrency=max(1, args.concurrency), perHostLimit=args.per_host_limit,
+                             requestsPerSecond=args.rate, maxRetries=args.retries, checkpointPath=args.checkpoint,
+                             pageStorePath=args.page_store, maxAge=args.max_age * 3600 if args.max_age is not None else None,
+                             reportPath=args.sync_report)
+            return
+        with metrics.timer('stage/scrape'):
+            scrapeDatabaseWithPandas(args.input, args.output, concurrency=args.concurrency, perHostLimit=args.per_host_limit,
+                                     requestsPerSecond=args.rate, maxRetries=args.retries,
+                                     checkpointPath=args.checkpoint, resume=args.resume,
+                                     pageStorePath=None if args.no_page_store else args.page_store)
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        if args.metrics:
+            metrics.disable()
+            metrics.writeSummary(args.metrics)
+            print(f"Run metrics written to {args.metrics}")
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,280 @@
+import argparse  # command line options
+import os
+import queue  # work queue shared by the browser workers
+import sys
+import threading  # one thread drives one browser
+import time  # latency numbers
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+# allows access to live/dynamic HTML after pubchem page filled by Java (requests gets 'stale' HTML)
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import WebDriverException, TimeoutException, NoSuchElementException
+
+cleaningDirectory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'Data Cleaning & Transformation')
+if cleaningDirectory not in sys.path:
+    sys.path.insert(0, cleaningDirectory) # run metrics live with the cleaning modules
+from instrumentation import metrics
+
+pubchemLinkPrefix = 'https://pubchem.ncbi.nlm.nih.gov/compound/'
+smilesSectionXPath = "//section[text()='SMILES']"
+smilesDivXPath = ".//div[@class='break-words space-y-1']"
+reagentColumns = ['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3']
+
+# images, stylesheets and fonts don't matter for reading one div of text, and they're most of the page weight
+blockedAssetPatterns = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp', '*.ico',
+                        '*.css', '*.woff', '*.woff2', '*.ttf', '*.otf']
+
+
+def makeBrowserOptions(headless: bool = True, blockAssets: bool = True) -> Options:
+    """
+    Chrome options for one farm worker
+
+    Args:
+        headless (bool): no window, turn off to watch a worker go
+        blockAssets (bool): don't download images/css/fonts
+
+    Returns:
+        Options: ready for webdriver.Chrome
+    """
+    myOptions = Options()
+    if headless:
+        myOptions.add_argument("--headless=new")
+    # Essential stability options
+    myOptions.add_argument("--no-sandbox")
+    myOptions.add_argument("--disable-dev-shm-usage")
+    myOptions.add_argument("--disable-gpu")
+    myOptions.add_argument("--disable-extensions")
+    myOptions.add_argument("--disable-background-networking")
+    myOptions.add_argument("--remote-allow-origins=*")
+    # no --remote-debugging-port here, every worker would fight over the same port
+    if blockAssets:
+        myOptions.add_argument("--blink-settings=imagesEnabled=false")
+        myOptions.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    myOptions.page_load_strategy = 'eager' # get() returns at DOMContentLoaded, the explicit wait does the rest
+    return myOptions
+
+
+def startChromeBrowser(headless: bool = True, blockAssets: bool = True) -> webdriver.Chrome:
+    """
+    Starts one Chrome for a worker, with asset blocking done through the devtools protocol
+    """
+    driver = webdriver.Chrome(options=makeBrowserOptions(headless, blockAssets))
+    if blockAssets:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blockedAssetPatterns})
+    return driver
+
+
+def pageOutcome(driver) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Wait condition: ('found', smiles) once the SMILES section is rendered, ('missing', None) for a not-found page,
+    None (keep waiting) otherwise
+    """
+    smilesContainers = driver.find_elements(By.XPATH, smilesSectionXPath)
+    if smilesContainers:
+        try:
+            smilesDiv = smilesContainers[0].find_element(By.XPATH, smilesDivXPath)
+        except NoSuchElementException:
+            return None # section is there but the value isn't filled in yet
+        smiles = smilesDiv.text.strip()
+        return ('found', smiles) if smiles else None
+    if "404" in driver.title or "not found" in driver.title.lower():
+        return ('missing', None)
+    return None
+
+
+def lookupSMILES(driver, pubchemUrl: str, timeout: float = 10.0) -> Optional[str]:
+    """
+    Reads the SMILES off one PubChem compound page, explicit waits only
+
+    Args:
+        driver: a live webdriver
+        pubchemUrl (str): compound page
+        timeout (float): seconds to wait for the SMILES section to render
+
+    Returns:
+        Optional[str]: SMILES, None if PubChem doesn't have it (redirect, 404, or nothing rendered in time)
+
+    Raises:
+        WebDriverException: the browser itself broke, the worker restarts it
+    """
+    driver.get(pubchemUrl)
+    currentUrl = driver.current_url
+    if currentUrl != pubchemUrl:
+        print(f"Redirected to: {currentUrl}")
+        return None
+    try:
+        outcome, smiles = WebDriverWait(driver, timeout, poll_frequency=0.1).until(pageOutcome)
+    except TimeoutException:
+        return None # nothing rendered in time, treat it like a miss
+    return smiles
+
+
+def browserWorker(taskQueue: queue.Queue, results: Dict[str, Optional[str]], resultsLock: threading.Lock,
+                  startBrowser: Callable[[], object], timeout: float, maxAttempts: int, farmStats: Dict[str, float]) -> None:
+    """
+    One farm worker: owns one browser for its whole life, restarts it if it crashes, stops on a None task
+    """
+    driver = None
+    while True:
+        pubchemUrl = taskQueue.get()
+        if pubchemUrl is None:
+            break
+
+        smiles = None
+        for attempt in range(maxAttempts):
+            try:
+                if driver is None:
+                    driver = startBrowser()
+                startTime = time.perf_counter()
+                smiles = lookupSMILES(driver, pubchemUrl, timeout)
+                lookupSeconds = time.perf_counter() - startTime
+                with resultsLock:
+                    farmStats['lookup seconds'] += lookupSeconds
+                metrics.observeLatency(f"host/{urlsplit(pubchemUrl).netloc}", lookupSeconds) # page load + wait for the SMILES div
+                metrics.resolverResult('pubchem', smiles is not None)
+                break
+            except WebDriverException as e:
+                print(f"Browser crashed on {pubchemUrl} (attempt {attempt + 1}): {e.__class__.__name__}")
+                try:
+                    if driver is not None:
+                        driver.quit()
+                except Exception:
+                    pass
+                driver = None
+                with resultsLock:
+                    farmStats['restarts'] += 1
+                metrics.count('pubchem/browser restarts')
+
+        with resultsLock:
+            results[pubchemUrl] = smiles
+            farmStats['lookups'] += 1
+            farmStats['found'] += smiles is not None
+            if farmStats['lookups'] % 50 == 0:
+                print(f"--- Milestone: '{int(farmStats['lookups'])}' pubchem pages read ---")
+
+    if driver is not None:
+        driver.quit()
+
+
+def resolvePubchemLinks(pubchemUrls: Iterable[str], workers: int = 4, timeout: float = 10.0, maxAttempts: int = 2,
+                        startBrowser: Optional[Callable[[], object]] = None,
+                        headless: bool = True, blockAssets: bool = True) -> Tuple[Dict[str, Optional[str]], Dict[str, float]]:
+    """
+    Reads SMILES off a bunch of PubChem pages with a pool of reused browsers fed from one queue
+
+    Args:
+        pubchemUrls (Iterable[str]): compound page urls, duplicates are only visited once
+        workers (int): number of browsers running at once
+        timeout (float): per page explicit wait, seconds
+        maxAttempts (int): tries per page, a crash restarts that worker's browser before the next try
+        startBrowser (Optional[Callable]): makes a new driver, headless Chrome by default
+        headless (bool): only used for the default Chrome
+        blockAssets (bool): only used for the default Chrome
+
+    Returns:
+        Tuple with:
+        - results (Dict[str, Optional[str]]): url -> SMILES, None where PubChem didn't have one
+        - farmStats (Dict[str, float]): lookups, found, restarts, seconds, pages per second
+    """
+    if startBrowser is None:
+        startBrowser = lambda: startChromeBrowser(headless, blockAssets)
+
+    uniqueUrls = list(dict.fromkeys(pubchemUrls))
+    taskQueue = queue.Queue()
+    for pubchemUrl in uniqueUrls:
+        taskQueue.put(pubchemUrl)
+    workers = max(1, min(workers, len(uniqueUrls)))
+    for _ in range(workers):
+        taskQueue.put(None) # one stop signal per worker
+
+    results = {}
+    resultsLock = threading.Lock()
+    farmStats = {'lookups': 0, 'found': 0, 'restarts': 0, 'lookup seconds': 0.0}
+    startTime = time.perf_counter()
+    workerThreads = [threading.Thread(target=browserWorker,
+                                      args=(taskQueue, results, resultsLock, startBrowser, timeout, maxAttempts, farmStats))
+                     for _ in range(workers)]
+    for workerThread in workerThreads:
+        workerThread.start()
+    for workerThread in workerThreads:
+        workerThread.join()
+
+    farmStats['seconds'] = round(time.perf_counter() - startTime, 3)
+    farmStats['pages per second'] = round(farmStats['lookups'] / farmStats['seconds'], 2) if farmStats['seconds'] > 0 else 0.0
+    return results, farmStats
+
+
+def resolvePubchemTable(inputCSVPath: str, outputCSVPath: str, workers: int = 4, baseURL: Optional[str] = None,
+                        columns: List[str] = reagentColumns, **farmOptions) -> Dict[str, float]:
+    """
+    Takes the pubchem.csv link table from SMILES Processing and writes the SMILES back into the same (row, column) cells
+
+    Cells PubChem couldn't answer keep their link so they can be retried or looked at by hand.
+
+    Args:
+        inputCSVPath (str): pubchem.csv
+        outputCSVPath (str): where the table with SMILES filled in goes
+        workers (int): browsers running at once
+        baseURL (Optional[str]): swap the PubChem prefix for this one, eg. 'http://127.0.0.1:8000/compound/' for a local stand-in
+        columns (List[str]): reagent columns holding the links
+        **farmOptions: passed to resolvePubchemLinks
+
+    Returns:
+        Dict[str, float]: farm statistics
+    """
+    pubchemDataframe = pd.read_csv(inputCSVPath)
+    linkCells = {}
+    for columnName in columns:
+        columnValues = pubchemDataframe[columnName]
+        isLink = columnValues.map(lambda cellContents: isinstance(cellContents, str) and cellContents.startswith(pubchemLinkPrefix))
+        linkCells[columnName] = isLink
+
+    def visitUrl(pubchemLink: str) -> str:
+        return baseURL + pubchemLink[len(pubchemLinkPrefix):] if baseURL else pubchemLink
+
+    allLinks = pd.concat([pubchemDataframe.loc[linkCells[columnName], columnName] for columnName in columns])
+    results, farmStats = resolvePubchemLinks(allLinks.map(visitUrl).unique(), workers=workers, **farmOptions)
+
+    for columnName in columns:
+        isLink = linkCells[columnName]
+        smiles = pubchemDataframe.loc[isLink, columnName].map(lambda pubchemLink: results.get(visitUrl(pubchemLink)))
+        pubchemDataframe.loc[isLink, columnName] = smiles.where(smiles.notna(), pubchemDataframe.loc[isLink, columnName])
+
+    pubchemDataframe.to_csv(outputCSVPath, index=False)
+    print(f"PubChem farm statistics: {farmStats}")
+    return farmStats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve the pubchem.csv link table with a pool of headless browsers')
+    parser.add_argument('--input', default='pubchem.csv')
+    parser.add_argument('--output', default='pubchem resolved.csv')
+    parser.add_argument('--workers', type=int, default=4, help='browsers running at once')
+    parser.add_argument('--timeout', type=float, default=10.0, help='explicit wait per page, seconds')
+    parser.add_argument('--base-url', default=None, help='replace the PubChem compound prefix, eg. for a local stand-in')
+    parser.add_argument('--show-browser', action='store_true', help='not headless')
+    parser.add_argument('--load-assets', action='store_true', help="don't block images/css/fonts")
+    parser.add_argument('--metrics', default=None, help='write a JSON summary of timers, latencies and rates here')
+    parser.add_argument('--progress', type=float, default=None, help='with --metrics, print a progress line every this many seconds')
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(progressInterval=args.progress)
+    try:
+        with metrics.timer('stage/pubchem'):
+            resolvePubchemTable(args.input, args.output, workers=args.workers, baseURL=args.base_url, timeout=args.timeout,
+                                headless=not args.show_browser, blockAssets=not args.load_assets)
+    finally:
+        if args.metrics:
+            metrics.disable()
+            metrics.writeSummary(args.metrics)
+
+if __name__ == '__main__':
+    main()
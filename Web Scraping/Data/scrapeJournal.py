@@ -0,0 +1,149 @@
+import json  # one JSON object per line
+import os  # checks if file exists, fsync
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+import pandas as pd  # only for writing the final csv
+
+removedMarker = 'Removed From List' # fields of a record a sync found gone from the input list
+
+
+def recordKey(recordID: Any) -> str:
+    """
+    Normalizes a RecordID so 9, 9.0 and '9' all land on the same journal key
+    """
+    try:
+        return str(int(float(recordID)))
+    except (TypeError, ValueError):
+        return str(recordID)
+
+
+def jsonDefault(value: Any) -> Any:
+    # numpy scalars (int64, float64) out of pandas aren't JSON serializable by default
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Can't journal value of type {type(value).__name__}")
+
+
+class CheckpointJournal:
+    """
+    Append-only JSONL journal of scraped rows keyed by RecordID
+
+    Each checkpoint appends only the rows scraped since the last one, so saving is O(new rows) instead of
+    rewriting the whole checkpoint. If a RecordID shows up more than once (eg. a retried fetch error),
+    the latest line wins.
+    """
+
+    def __init__(self, journalPath: str, keyColumn: str = 'RecordID'):
+        self.journalPath = journalPath
+        self.keyColumn = keyColumn
+
+    def reset(self) -> None:
+        """
+        Starts a fresh journal, throwing away whatever was there
+        """
+        open(self.journalPath, 'w', encoding='utf-8').close()
+
+    def iterRows(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields every journaled row in the order it was written
+
+        A half-written last line (crash mid-write) is skipped instead of killing the resume.
+        """
+        if not os.path.exists(self.journalPath):
+            return
+        with open(self.journalPath, 'r', encoding='utf-8') as journalFile:
+            for line in journalFile:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping truncated journal line: {line[:80]}")
+
+    def latestRows(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Latest journaled row per normalized RecordID (see recordKey), in first-journaled order
+        """
+        latestRows = {}
+        for row in self.iterRows():
+            latestRows[recordKey(row.get(self.keyColumn))] = row
+        return latestRows
+
+    def completedKeys(self, failureMarkers: Iterable[str] = ('Url Fetch Error', removedMarker),
+                      requiredColumns: Iterable[str] = ()) -> Set[str]:
+        """
+        Gets the RecordIDs that are already done, so a resumed scrape can skip them
+
+        Args:
+            failureMarkers (Iterable[str]): rows with any of these in their fields get fetched again
+            requiredColumns (Iterable[str]): rows journaled without one of these (written before the parser grew
+                that field) get fetched again too, instead of coming out with it blank
+
+        Returns:
+            Set[str]: normalized RecordIDs (see recordKey) of rows that don't need scraping again
+        """
+        failureMarkers = set(failureMarkers)
+        requiredColumns = list(requiredColumns)
+        latestRows = self.latestRows()
+
+        completed = set()
+        for key, row in latestRows.items():
+            fieldValues = [value for column, value in row.items() if column != self.keyColumn]
+            if not any(value in failureMarkers for value in fieldValues) and all(column in row for column in requiredColumns):
+                completed.add(key)
+        return completed
+
+    def endsMidLine(self) -> bool:
+        if not os.path.exists(self.journalPath) or os.path.getsize(self.journalPath) == 0:
+            return False
+        with open(self.journalPath, 'rb') as journalFile:
+            journalFile.seek(-1, os.SEEK_END)
+            return journalFile.read(1) != b'\n'
+
+    def append(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Appends rows to the end of the journal and forces them to disk
+
+        Args:
+            rows (List[Dict[str, Any]]): one dict per scraped row, must include the key column
+        """
+        if not rows:
+            return
+        lines = ''.join(json.dumps(row, default=jsonDefault, ensure_ascii=False) + '\n' for row in rows)
+        if self.endsMidLine():
+            lines = '\n' + lines # don't glue the first new row onto a half-written one from a crash
+        with open(self.journalPath, 'a', encoding='utf-8') as journalFile:
+            journalFile.write(lines)
+            journalFile.flush()
+            os.fsync(journalFile.fileno())
+
+    def materialize(self, outputCSVPath: str, columns: List[str], keyOrder: Optional[Iterable[Any]] = None) -> int:
+        """
+        Writes the final csv from the journal in one pass over it
+
+        Args:
+            outputCSVPath (str): csv to write
+            columns (List[str]): output columns, in order
+            keyOrder (Optional[Iterable[Any]]): RecordIDs in the order rows should come out (usually the input csv order),
+                journal order if None; keys missing from the journal are skipped
+
+        Returns:
+            int: number of rows written
+        """
+        outputDataframe = self.latestDataframe(columns, keyOrder)
+        outputDataframe.to_csv(outputCSVPath, index=False, encoding='utf-8')
+        return len(outputDataframe)
+
+    def latestDataframe(self, columns: List[str], keyOrder: Optional[Iterable[Any]] = None) -> pd.DataFrame:
+        """
+        Latest journaled row per key as a dataframe, same rows materialize writes (for writing some other format)
+        """
+        latestRows = self.latestRows()
+
+        if keyOrder is None:
+            orderedRows = list(latestRows.values())
+        else:
+            orderedRows = [latestRows[key] for key in map(recordKey, keyOrder) if key in latestRows]
+
+        return pd.DataFrame(orderedRows, columns=columns)
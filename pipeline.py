@@ -0,0 +1,447 @@
+import argparse  # command line options
+import hashlib  # fingerprints of code and data
+import importlib.util  # loads the stage scripts, some of them have spaces in their names
+import json  # pipeline state file
+import os
+import sys
+import threading  # stages run on worker threads and share the state
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+repoDirectory = os.path.dirname(os.path.abspath(__file__))
+scrapingDirectory = os.path.join(repoDirectory, 'Web Scraping', 'Data')
+cleaningDirectory = os.path.join(repoDirectory, 'Data Cleaning & Transformation')
+for moduleDirectory in (scrapingDirectory, cleaningDirectory):
+    if moduleDirectory not in sys.path:
+        sys.path.insert(0, moduleDirectory)
+
+from tableStore import readTable, writeTable  # csv, or parquet/arrow by suffix
+from instrumentation import metrics  # --metrics summary: per-stage timers, resolver latencies, rows per second
+
+# how stage code files get fingerprinted, read in 1 MB blocks
+hashBlockSize = 1 << 20
+
+
+def loadScript(scriptPath: str):
+    """
+    Imports a stage script by path (eg. 'SMILES Processing.py'), once per process
+    """
+    moduleName = os.path.splitext(os.path.basename(scriptPath))[0].replace(' ', '_').replace('-', '_')
+    if moduleName not in sys.modules:
+        spec = importlib.util.spec_from_file_location(moduleName, scriptPath)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[moduleName] = module
+    return sys.modules[moduleName]
+
+
+class Stage:
+    """
+    One step of the pipeline with its inputs, outputs and the code it depends on
+
+    A stage either has a run() that reads its inputs and writes its outputs itself, or a rowTransform that
+    takes a dataframe of input rows and returns one dataframe per output, in outputs order. A rowTransform has to be row-local
+    (each output row comes from exactly one input row and keeps its index label, each input row makes at most one
+    row per output), which is what lets the runner only recompute the rows that changed.
+
+    Args:
+        name (str): stage name, also what --stages takes
+        inputs (List[str]): data files read, relative to the work directory
+        outputs (List[str]): data files written, relative to the work directory
+        code (List[str]): source files the results depend on, relative to the repo
+        run (Optional[Callable]): run(stage, workDirectory, options) for whole-file stages
+        rowTransform (Optional[Callable]): rowTransform(dataframe) -> [dataframe per output] for row-local stages
+        after (List[str]): stages that have to finish first besides the ones producing the inputs
+    """
+
+    def __init__(self, name: str, inputs: List[str], outputs: List[str], code: List[str],
+                 run: Optional[Callable] = None, rowTransform: Optional[Callable] = None, after: List[str] = ()):
+        if (run is None) == (rowTransform is None):
+            raise ValueError(f"Stage '{name}' needs exactly one of run or rowTransform")
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.code = list(code)
+        self.run = run
+        self.rowTransform = rowTransform
+        self.after = list(after)
+
+
+class PipelineState:
+    """
+    What the last run saw: per-stage fingerprints, plus a (size, mtime) -> sha256 memo so big unchanged
+    files don't get rehashed every run
+    """
+
+    def __init__(self, statePath: str):
+        self.statePath = statePath
+        self.stateLock = threading.Lock()
+        self.state = {'stages': {}, 'fileHashes': {}}
+        if os.path.exists(statePath):
+            with open(statePath, 'r', encoding='utf-8') as stateFile:
+                self.state = json.load(stateFile)
+
+    def fileHash(self, filePath: str) -> str:
+        if not os.path.exists(filePath):
+            return 'missing'
+        fileStat = os.stat(filePath)
+        statKey = f"{fileStat.st_size}:{fileStat.st_mtime_ns}"
+        with self.stateLock:
+            knownHash = self.state['fileHashes'].get(filePath)
+        if knownHash and knownHash[0] == statKey:
+            return knownHash[1]
+        digest = hashlib.sha256()
+        with open(filePath, 'rb') as dataFile:
+            for block in iter(lambda: dataFile.read(hashBlockSize), b''):
+                digest.update(block)
+        with self.stateLock:
+            self.state['fileHashes'][filePath] = [statKey, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def stageFingerprint(self, stage: Stage, workDirectory: str, options: Dict) -> Dict[str, str]:
+        """
+        Separate fingerprints for the code (+ options) and the data, row-incremental stages only care about the first
+        """
+        codeDigest = hashlib.sha256(json.dumps(options, sort_keys=True, default=str).encode())
+        for codePath in stage.code:
+            codeDigest.update(self.fileHash(os.path.join(repoDirectory, codePath)).encode())
+        dataDigest = hashlib.sha256()
+        for inputPath in stage.inputs:
+            dataDigest.update(self.fileHash(os.path.join(workDirectory, inputPath)).encode())
+        return {'code': codeDigest.hexdigest(), 'data': dataDigest.hexdigest()}
+
+    def isUpToDate(self, stage: Stage, fingerprint: Dict[str, str], workDirectory: str) -> bool:
+        outputsExist = all(os.path.exists(os.path.join(workDirectory, outputPath)) for outputPath in stage.outputs)
+        with self.stateLock:
+            return outputsExist and self.state['stages'].get(stage.name) == fingerprint
+
+    def markDone(self, stage: Stage, fingerprint: Dict[str, str]) -> None:
+        with self.stateLock:
+            self.state['stages'][stage.name] = fingerprint
+
+    def save(self) -> None:
+        temporaryPath = self.statePath + '.tmp'
+        with self.stateLock, open(temporaryPath, 'w', encoding='utf-8') as stateFile:
+            json.dump(self.state, stateFile, indent=2)
+        os.replace(temporaryPath, self.statePath) # never leaves a half-written state file behind
+
+
+def rowHashes(dataframe: pd.DataFrame) -> np.ndarray:
+    # one uint64 per row over the row's values, the index isn't part of it
+    return pd.util.hash_pandas_object(dataframe, index=False).to_numpy()
+
+
+def runRowIncremental(stage: Stage, workDirectory: str, codeFingerprint: str, cacheDirectory: str,
+                      reuseRows: bool = True) -> Dict[str, int]:
+    """
+    Runs a row-local stage on only the input rows it hasn't seen with this code before
+
+    The previous run's rows are kept per stage in a pickle: the hashes of every input row, and every output row
+    tagged with the hash of the input row it came from. Rows whose hash is known get their old output rows back,
+    new/changed rows go through rowTransform, rows that disappeared from the input disappear from the outputs.
+    Outputs come out in input order, same as a full run would write them.
+
+    Returns:
+        Dict[str, int]: input rows, recomputed rows, reused rows
+    """
+    inputFrame = readTable(os.path.join(workDirectory, stage.inputs[0]))
+    inputFrame.index = pd.RangeIndex(len(inputFrame)) # index label == input position from here on
+    inputHashes = rowHashes(inputFrame)
+    # dtypes are part of it since a column flipping int <-> float changes how every old row gets written
+    memoKey = codeFingerprint + ':' + ','.join(f"{columnName}:{dtype}" for columnName, dtype in inputFrame.dtypes.items())
+
+    memoPath = os.path.join(cacheDirectory, f"{stage.name} rows.pkl")
+    memo = pd.read_pickle(memoPath) if reuseRows and os.path.exists(memoPath) else None
+    if memo is not None and memo['key'] != memoKey:
+        memo = None # different code, columns or dtypes, nothing old can be trusted
+
+    isKnown = np.isin(inputHashes, memo['inputHashes']) if memo is not None else np.zeros(len(inputFrame), dtype=bool)
+    changedFrame = inputFrame.loc[~isKnown]
+    freshOutputs = dict(zip(stage.outputs, stage.rowTransform(changedFrame))) if len(changedFrame) else {}
+    metrics.rows(stage.name, len(inputFrame))
+    metrics.count(f"{stage.name}/reused rows", int(isKnown.sum()))
+
+    newMemo = {'key': memoKey, 'inputHashes': inputHashes, 'outputs': {}}
+    knownPositions = np.flatnonzero(isKnown)
+    for outputPath in stage.outputs:
+        outputParts = []
+        if memo is not None and len(knownPositions):
+            memoRows = memo['outputs'][outputPath] # indexed by source row hash
+            memoLocations = memoRows.index.get_indexer(inputHashes[knownPositions])
+            hasOutputRow = memoLocations >= 0
+            reusedRows = memoRows.iloc[memoLocations[hasOutputRow]]
+            reusedRows.index = knownPositions[hasOutputRow]
+            outputParts.append(reusedRows)
+        if outputPath in freshOutputs:
+            outputParts.append(freshOutputs[outputPath])
+        if not outputParts:
+            # nothing ran and nothing was remembered: keep the columns from the output file if there is one
+            outputParts.append(readTable(os.path.join(workDirectory, outputPath)).iloc[:0]
+                               if os.path.exists(os.path.join(workDirectory, outputPath)) else inputFrame.iloc[:0])
+
+        outputFrame = pd.concat(outputParts).sort_index(kind='stable')
+        writeTable(outputFrame, os.path.join(workDirectory, outputPath))
+
+        memoRows = outputFrame.set_axis(inputHashes[outputFrame.index.to_numpy(dtype=np.int64)], axis=0)
+        newMemo['outputs'][outputPath] = memoRows[~memoRows.index.duplicated()] # identical input rows give identical output rows
+
+    os.makedirs(cacheDirectory, exist_ok=True)
+    pd.to_pickle(newMemo, memoPath)
+    return {'input rows': len(inputFrame), 'recomputed rows': len(changedFrame), 'reused rows': int(isKnown.sum())}
+
+
+def stageOrder(stages: List[Stage]) -> Dict[str, List[str]]:
+    """
+    Works out each stage's upstream stages from who writes its inputs, and checks the graph has no cycles
+
+    Returns:
+        Dict[str, List[str]]: stage name -> names of the stages it waits for
+    """
+    producers = {}
+    for stage in stages:
+        for outputPath in stage.outputs:
+            if outputPath in producers:
+                raise ValueError(f"'{outputPath}' is written by both '{producers[outputPath]}' and '{stage.name}'")
+            producers[outputPath] = stage.name
+
+    upstream = {stage.name: sorted({producers[inputPath] for inputPath in stage.inputs if inputPath in producers} | set(stage.after))
+                for stage in stages}
+
+    visiting, visited = set(), set()
+    def visit(stageName: str) -> None:
+        if stageName in visited:
+            return
+        if stageName in visiting:
+            raise ValueError(f"Stage graph has a cycle through '{stageName}'")
+        visiting.add(stageName)
+        for upstreamName in upstream[stageName]:
+            visit(upstreamName)
+        visiting.discard(stageName)
+        visited.add(stageName)
+    for stage in stages:
+        visit(stage.name)
+    return upstream
+
+
+def selectStages(stages: List[Stage], upstream: Dict[str, List[str]], targets: Optional[List[str]]) -> List[Stage]:
+    # the requested stages and everything they depend on, all of them if no targets
+    if not targets:
+        return stages
+    unknownTargets = set(targets) - set(upstream)
+    if unknownTargets:
+        raise ValueError(f"Unknown stages: {sorted(unknownTargets)}")
+    needed, toVisit = set(), list(targets)
+    while toVisit:
+        stageName = toVisit.pop()
+        if stageName not in needed:
+            needed.add(stageName)
+            toVisit.extend(upstream[stageName])
+    return [stage for stage in stages if stage.name in needed]
+
+
+def runPipeline(stages: List[Stage], workDirectory: str = '.', targets: Optional[List[str]] = None, force: bool = False,
+                maxParallel: int = 2, options: Optional[Dict[str, Dict]] = None, dryRun: bool = False) -> Dict[str, Dict]:
+    """
+    Runs the stage graph, skipping stages whose code, options and inputs haven't changed since they last ran,
+    and running stages whose upstreams are done side by side (eg. the cactus and pubchem resolvers)
+
+    Args:
+        stages (List[Stage]): the graph, edges come from matching outputs to inputs
+        workDirectory (str): where the data files live, state and row caches go in here too
+        targets (Optional[List[str]]): only run these stages and their upstreams
+        force (bool): run everything selected even if it looks up to date
+        maxParallel (int): stages running at once
+        options (Optional[Dict[str, Dict]]): stage name -> keyword options, part of that stage's fingerprint
+        dryRun (bool): only report what would run
+
+    Returns:
+        Dict[str, Dict]: stage name -> {'status': 'ran'/'skipped'/'would run'/'failed', 'seconds': ..., plus row counts}
+    """
+    options = options or {}
+    upstream = stageOrder(stages)
+    selectedStages = selectStages(stages, upstream, targets)
+    selectedNames = {stage.name for stage in selectedStages}
+    pipelineState = PipelineState(os.path.join(workDirectory, 'pipeline state.json'))
+    cacheDirectory = os.path.join(workDirectory, 'pipeline cache')
+
+    report = {}
+    pending = {stage.name: stage for stage in selectedStages}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, maxParallel)) as executor:
+        while pending or running:
+            for stageName in list(pending):
+                waitingFor = [name for name in upstream[stageName] if name in selectedNames]
+                if any(report.get(name, {}).get('status') == 'failed' for name in waitingFor):
+                    report[stageName] = {'status': 'failed', 'reason': 'upstream failed'}
+                    del pending[stageName]
+                elif all(name in report for name in waitingFor):
+                    stage = pending.pop(stageName)
+                    running[executor.submit(runStage, stage, workDirectory, pipelineState, cacheDirectory,
+                                            options.get(stageName, {}), force, dryRun)] = stageName
+            if not running:
+                continue
+            doneFutures, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in doneFutures:
+                stageName = running.pop(future)
+                try:
+                    report[stageName] = future.result()
+                except Exception as e:
+                    report[stageName] = {'status': 'failed', 'reason': f"{e.__class__.__name__}: {e}"}
+                print(f"[{stageName}] {report[stageName]}")
+                if not dryRun:
+                    pipelineState.save() # after every stage, so a crash later keeps the finished ones
+
+    return report
+
+
+def runStage(stage: Stage, workDirectory: str, pipelineState: PipelineState, cacheDirectory: str, stageOptions: Dict,
+             force: bool, dryRun: bool) -> Dict:
+    fingerprint = pipelineState.stageFingerprint(stage, workDirectory, stageOptions)
+    if not force and pipelineState.isUpToDate(stage, fingerprint, workDirectory):
+        return {'status': 'skipped'}
+    if dryRun:
+        return {'status': 'would run'}
+
+    print(f"[{stage.name}] running")
+    startTime = time.perf_counter()
+    with metrics.timer(f"stage/{stage.name}"):
+        if stage.rowTransform is not None:
+            stageReport = runRowIncremental(stage, workDirectory, fingerprint['code'], cacheDirectory, reuseRows=not force)
+        else:
+            stageReport = stage.run(stage, workDirectory, stageOptions) or {}
+    pipelineState.markDone(stage, fingerprint)
+    return {**stageReport, 'status': 'ran', 'seconds': round(time.perf_counter() - startTime, 3)}
+
+
+# ------------------------------------------------------------------ the NIST -> SMILES stages
+
+def runScrape(stage: Stage, workDirectory: str, options: Dict) -> Dict:
+    # the scraper's own journal makes reruns cheap: only records it hasn't finished get fetched. The pages are what
+    # 'extract' reads; the table the scraper builds on the side is only a by-product, no stage reads it
+    from pandasScrape import scrapeDatabaseWithPandas
+    inputPath, = [os.path.join(workDirectory, path) for path in stage.inputs]
+    pageStorePath, = [os.path.join(workDirectory, path) for path in stage.outputs]
+    extractedPath = os.path.join(workDirectory, 'scraped.csv')
+    scrapeDatabaseWithPandas(inputPath, extractedPath, pageStorePath=pageStorePath, resume=True,
+                             checkpointPath=os.path.join(workDirectory, 'checkpoint.jsonl'), **options)
+    # a scrape that wrote nothing mustn't get recorded as done, or every later run would skip it
+    if not os.path.exists(extractedPath) or os.path.getsize(extractedPath) == 0:
+        raise FileNotFoundError(f"Scrape finished without writing '{extractedPath}'")
+    return {}
+
+
+def runExtract(stage: Stage, workDirectory: str, options: Dict) -> Dict:
+    # parses the stored pages again, no network, so parser changes show up without a re-scrape
+    from pandasScrape import reextractFromPageStore
+    recordsPath, pageStorePath = [os.path.join(workDirectory, path) for path in stage.inputs]
+    outputPath, = [os.path.join(workDirectory, path) for path in stage.outputs]
+    reextractFromPageStore(recordsPath, outputPath, pageStorePath=pageStorePath, **options)
+    return {}
+
+
+def filterRows(dataframe: pd.DataFrame) -> List[pd.DataFrame]:
+    filtering = loadScript(os.path.join(cleaningDirectory, 'Tiny Single Use Scripts', 'filtering.py'))
+    return [filtering.filterExtracted(dataframe)]
+
+
+def classifyRows(dataframe: pd.DataFrame) -> List[pd.DataFrame]:
+    smilesProcessing = loadScript(os.path.join(cleaningDirectory, 'Data', 'SMILES Processing.py'))
+    routedTables = smilesProcessing.processReagents(dataframe)
+    return [routedTables['processed'], routedTables['unprocessed'], routedTables['cactus'], routedTables['pubchem']]
+
+
+def runCactusResolver(stage: Stage, workDirectory: str, options: Dict) -> Dict:
+    from cactusResolver import resolveCactusTable
+    inputPath, = [os.path.join(workDirectory, path) for path in stage.inputs]
+    outputPath, = [os.path.join(workDirectory, path) for path in stage.outputs]
+    return resolveCactusTable(inputPath, outputPath, answerStorePath=os.path.join(workDirectory, 'cactus answers.sqlite'), **options)
+
+
+def runPubchemFarm(stage: Stage, workDirectory: str, options: Dict) -> Dict:
+    from pubchemFarm import resolvePubchemTable
+    inputPath, = [os.path.join(workDirectory, path) for path in stage.inputs]
+    outputPath, = [os.path.join(workDirectory, path) for path in stage.outputs]
+    return resolvePubchemTable(inputPath, outputPath, **options)
+
+
+def reviewRows(dataframe: pd.DataFrame) -> List[pd.DataFrame]:
+    cactusReviewer = loadScript(os.path.join(cleaningDirectory, 'cactusReviewer.py'))
+    return [cactusReviewer.reviewCactus(dataframe)]
+
+
+tableCode = 'Data Cleaning & Transformation/tableStore.py' # how every stage's tables get read and written
+scrapingCode = [tableCode, 'Web Scraping/Data/pandasScrape.py', 'Web Scraping/Data/concurrentFetcher.py',
+                'Web Scraping/Data/scrapeJournal.py', 'Web Scraping/Data/pageStore.py', 'Web Scraping/Data/recordParser.py']
+
+def buildNistStages(tableSuffix: str = '.csv') -> List[Stage]:
+    """
+    The NIST -> SMILES graph, with the big tables in the format tableSuffix picks ('.csv', '.parquet' or '.arrow');
+    the cactus/pubchem link tables and the NIST record list stay csv, they're small and get looked at by hand
+    """
+    extractedTable = 'NIST Extracted' + tableSuffix
+    filteredTable = 'Filtered NIST Extracted' + tableSuffix
+    return [
+        Stage('scrape', inputs=['NIST Records.csv'], outputs=['pages.sqlite'],
+              code=scrapingCode, run=runScrape),
+        Stage('extract', inputs=['NIST Records.csv', 'pages.sqlite'], outputs=[extractedTable],
+              code=[tableCode, 'Web Scraping/Data/recordParser.py', 'Web Scraping/Data/pandasScrape.py', 'Web Scraping/Data/pageStore.py'],
+              run=runExtract),
+        Stage('filter', inputs=[extractedTable], outputs=[filteredTable],
+              code=[tableCode, 'Data Cleaning & Transformation/Tiny Single Use Scripts/filtering.py'], rowTransform=filterRows),
+        Stage('classify', inputs=[filteredTable],
+              outputs=['processed' + tableSuffix, 'unprocessed' + tableSuffix, 'cactus.csv', 'pubchem.csv'],
+              code=[tableCode, 'Data Cleaning & Transformation/Data/SMILES Processing.py', 'Data Cleaning & Transformation/reagentClassifier.py',
+                    'Data Cleaning & Transformation/resolutionCache.py', 'Data Cleaning & Transformation/opsinBatch.py'],
+              rowTransform=classifyRows),
+        Stage('resolve cactus', inputs=['cactus.csv'], outputs=['cactus resolved.csv'],
+              code=['Web Scraping/Data/cactusResolver.py', 'Web Scraping/Data/concurrentFetcher.py'], run=runCactusResolver),
+        Stage('resolve pubchem', inputs=['pubchem.csv'], outputs=['pubchem resolved.csv'],
+              code=['Web Scraping/Data/pubchemFarm.py'], run=runPubchemFarm),
+        Stage('review', inputs=['cactus resolved.csv'], outputs=['Processed Cactus.csv'],
+              code=[tableCode, 'Data Cleaning & Transformation/cactusReviewer.py'], rowTransform=reviewRows),
+    ]
+
+nistStages = buildNistStages()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the NIST -> SMILES pipeline, only redoing what changed')
+    parser.add_argument('--workdir', default='.', help='where the data files live')
+    parser.add_argument('--stages', nargs='+', default=None, help='only these stages (and what they need)')
+    parser.add_argument('--skip', nargs='+', default=[], help="stages to leave out entirely, eg. 'resolve pubchem' without Chrome")
+    parser.add_argument('--force', action='store_true', help='rerun even if up to date')
+    parser.add_argument('--parallel', type=int, default=2, help='stages running at once')
+    parser.add_argument('--dry-run', action='store_true', help='only show what would run')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow'], default='csv',
+                        help='format of the big intermediate tables, parquet/arrow need pyarrow')
+    parser.add_argument('--concurrency', type=int, default=8, help='scraper and cactus requests in flight')
+    parser.add_argument('--browsers', type=int, default=4, help='pubchem farm browsers')
+    parser.add_argument('--metrics', default=None, help='write a JSON summary of timers, latencies and rates here')
+    parser.add_argument('--progress', type=float, default=None, help='with --metrics, print a progress line every this many seconds')
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(progressInterval=args.progress)
+
+    stages = [stage for stage in buildNistStages('.' + args.format) if stage.name not in args.skip]
+    options = {
+        'scrape': {'concurrency': args.concurrency},
+        'resolve cactus': {'concurrency': args.concurrency},
+        'resolve pubchem': {'workers': args.browsers},
+    }
+    report = runPipeline(stages, workDirectory=args.workdir, targets=args.stages, force=args.force,
+                         maxParallel=args.parallel, options=options, dryRun=args.dry_run)
+    print(json.dumps(report, indent=2))
+    if args.metrics:
+        metrics.disable()
+        metrics.writeSummary(args.metrics)
+        print(f"Run metrics written to {args.metrics}")
+    if any(stageReport['status'] == 'failed' for stageReport in report.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
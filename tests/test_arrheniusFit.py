@@ -0,0 +1,32 @@
+import os
+import sys
+
+import numpy as np
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation'))
+from arrheniusFit import fitTable
+
+
+def test_fitTable_uses_unit_suffixed_temperature_ranges(tmp_path):
+    # two records of one reaction, same Ea, ranges written the way NIST pages give them
+    extracted = pandas.DataFrame({
+        'RecordID': ['1', '2'],
+        'RID': ['7', '7'],
+        'Pre-Exp Factor Coeff': ['1.0', '1.0'],
+        'Pre-Exp Factor Power': ['-11', '-11'],
+        'Activation Energy': ['-1000', '-1000'],
+        'Activation Energy Units': ['K', 'K'],
+        'Temperature': ['300 K', '500 K'],
+        'Temperature Max': ['400 K', '800 K'],
+    })
+    tablePath = str(tmp_path / 'extracted.csv')
+    extracted.to_csv(tablePath, index=False)
+
+    consolidated = fitTable(tablePath)
+    assert len(consolidated) == 1
+    fitRow = consolidated.iloc[0]
+    assert fitRow['Records'] == 2 and fitRow['Model'] == 'Ea' and fitRow['Records Without T'] == 0
+    assert (fitRow['Tmin [K]'], fitRow['Tmax [K]']) == (300.0, 800.0)
+    np.testing.assert_allclose(fitRow['A'], 1e-11, rtol=1e-9)
+    np.testing.assert_allclose(fitRow['Ea [J/mol]'], 1000.0 * 8.314462618, rtol=1e-9)
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation'))
+
+pytest.importorskip('rdkit')
+from bondChangeIndex import normalizeChange, stepBondChanges
+
+
+def test_hydrogen_abstraction_through_implicit_hydrogens():
+    # CH4 + OH -> CH3 + H2O: the C-H and H-O bonds only show up as H counts on the mapped heavy atoms
+    assert stepBondChanges('[CH4:1].[OH:2]>>[CH3:1].[OH2:2]') == ['break C-H', 'break C^4-H^1', 'form H-O', 'form H^1-O^2']
+
+
+def test_addition_across_a_double_bond():
+    # CH2=CH2 + Br2 -> BrCH2CH2Br: one order change, one break, two forms (kept twice)
+    assert stepBondChanges('[CH2:1]=[CH2:2].[Br:3][Br:4]>>[Br:3][CH2:1][CH2:2][Br:4]') == [
+        'break Br-Br', 'break Br^1-Br^1', 'change C=C>C-C', 'change C^3=C^3>C^3-C^3',
+        'form Br-C', 'form Br-C', 'form Br^1-C^4', 'form Br^1-C^4']
+
+
+def test_unreadable_steps():
+    assert stepBondChanges('[CH4:1]>[CH3:1]') is None # not reactants>agents>products
+    assert stepBondChanges('C1CC>>C') is None # unclosed ring
+
+
+def test_query_text_finds_the_indexed_tokens():
+    tokens = stepBondChanges('[CH2:1]=[CH2:2].[Br:3][Br:4]>>[Br:3][CH2:1][CH2:2][Br:4]')
+    for query in ('Break Br-Br', 'form C-Br', 'change C = C > C - C', 'form C^4-Br^1'):
+        assert normalizeChange(query) in tokens
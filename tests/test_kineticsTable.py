@@ -0,0 +1,32 @@
+import os
+import sys
+
+import numpy as np
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation'))
+from kineticsTable import KineticsTable, toNumbers
+
+
+def test_toNumbers_strips_units_from_text_columns():
+    # pandas 3 reads these as str dtype, older pandas as object, both have to lose the units
+    for dtype in (object, 'str'):
+        column = pandas.Series(['298 K', ' -12', 'Parse Error', None], dtype=dtype)
+        np.testing.assert_array_equal(toNumbers(column, 4), [298.0, -12.0, np.nan, np.nan])
+
+
+def test_fromExtracted_reads_unit_suffixed_temperatures():
+    extracted = pandas.DataFrame({
+        'RecordID': ['1', '2', '3'],
+        'Pre-Exp Factor Coeff': ['1.5', '2.0', 'Parse Error'],
+        'Pre-Exp Factor Power': ['-11', '- 12', ''],
+        'Activation Energy': ['-1000', '', ''],
+        'Temperature': ['298 K', '300 K', '250 K'],
+        'Temperature Max': ['1000 K', '', ''],
+    })
+    kineticsTable = KineticsTable.fromExtracted(extracted)
+    np.testing.assert_array_equal(kineticsTable.recordIDs, [1, 2])
+    np.testing.assert_allclose(kineticsTable.A, [1.5e-11, 2.0e-12])
+    np.testing.assert_array_equal(kineticsTable.Tmin, [298.0, 300.0])
+    np.testing.assert_array_equal(kineticsTable.Tmax, [1000.0, 300.0]) # no upper bound -> Tmin == Tmax
+    np.testing.assert_array_equal(kineticsTable.Ea, [1000.0, 0.0])
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation'))
+
+import opsinBatch
+from opsinBatch import cleanOpsinResult, opsinBatchResolve, opsinChunk
+
+# parseable, duplicated, and ones OPSIN can't make sense of
+testNames = ['ethanol', 'propan-2-ol', 'methane', 'ethanol', 'not a real name', '', '2-methylpropane', 'benzene',
+             'hydroxyl', 'chloromethane', 'xyzzy']
+
+
+class FakeOpsin:
+    # stands in for PyOpsin: upper-cases the name, throws on 'xyzzy', can't parse blanks or names with spaces
+    def to_smiles_single(self, name):
+        if name == 'xyzzy':
+            raise RuntimeError('the JVM threw')
+        return None if not name or ' ' in name else name.upper()
+
+
+def jvmAvailable() -> bool:
+    try:
+        import jpype
+        import pyopsin  # noqa: F401
+        jpype.getDefaultJVMPath()
+        return True
+    except Exception:
+        return False
+
+
+def test_cleanOpsinResult():
+    assert cleanOpsinResult('CCO') == 'CCO'
+    assert cleanOpsinResult(['CCO']) == 'CCO'
+    assert cleanOpsinResult(None) is None
+    assert cleanOpsinResult('') is None
+    assert cleanOpsinResult([None]) is None
+    assert cleanOpsinResult(['CCO', 'C']) is None
+
+
+def test_opsinChunk_keeps_order_and_survives_a_throw(monkeypatch):
+    monkeypatch.setattr(opsinBatch, 'getOpsin', FakeOpsin)
+    assert opsinChunk(testNames) == [None if name in ('not a real name', '', 'xyzzy') else name.upper() for name in testNames]
+
+
+def test_opsinBatchResolve_matches_one_at_a_time_in_process(monkeypatch):
+    monkeypatch.setattr(opsinBatch, 'getOpsin', FakeOpsin)
+    oneAtATime = {name: opsinChunk([name])[0] for name in testNames}
+    opsinResults, opsinStats = opsinBatchResolve(testNames, chunkSize=3, workers=1)
+    assert opsinResults == oneAtATime
+    assert opsinStats['names'] == len(oneAtATime)
+
+
+@pytest.mark.skipif(not jvmAvailable(), reason='OPSIN needs a JVM')
+@pytest.mark.parametrize('workers', [1, 2])
+def test_opsinBatchResolve_matches_opsin_one_at_a_time(workers):
+    from backends import getOpsin
+    opsinObj = getOpsin()
+    oneAtATime = {name: cleanOpsinResult(opsinObj.to_smiles_single(name)) for name in testNames if name != 'xyzzy'}
+    opsinResults = opsinBatchResolve([name for name in testNames if name != 'xyzzy'], chunkSize=3, workers=workers)[0]
+    assert opsinResults == oneAtATime
+    assert opsinResults['ethanol'] is not None and opsinResults['not a real name'] is None
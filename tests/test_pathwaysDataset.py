@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation'))
+
+from pathwaysDataset import PathwayIndex, joinReactions, reactionKeys, sideKey
+
+# pathway 0: CH4 + OH in one step; 1 and 2 share their second step; 3 repeats one step twice
+pathwayRows = [
+    ('[CH4:1].[OH:2]>>[CH3:1].[OH2:2]', ['[CH4:1].[OH:2]>>[CH3:1].[OH2:2]'], 'abstraction'),
+    ('CC.[OH]>>CCO[O]', ['CC.[OH]>>C[CH2].O', 'C[CH2].O=O>>CCO[O]'], 'oxidation'),
+    ('C=C>>CCO[O]', ['C=C.[H]>>C[CH2]', 'C[CH2].O=O>>CCO[O]'], 'addition'),
+    ('O=O.[H].[H]>>OO', ['O=O.[H]>>O[O]', 'O=O.[H]>>O[O]'], 'recombination'),
+]
+
+
+def pathwayIndex(tmp_path):
+    pathwaysPath = str(tmp_path / 'pathways.csv')
+    pandas.DataFrame([{'updated_reaction': reaction, 'mechanism': str(steps), 'mechanistic_class': mechanismClass}
+                      for reaction, steps, mechanismClass in pathwayRows]).to_csv(pathwaysPath, index=False)
+    return PathwayIndex.build(pathwaysPath)
+
+
+def test_lookup_precedence(tmp_path):
+    index = pathwayIndex(tmp_path)
+    assert len(index) == 7 and index.pathwayClasses[3] == 'recombination'
+    # CH4 + OH is both pathway 0's overall reaction and its only step, the pathway wins; reagent order doesn't matter
+    assert index.lookup(sideKey(['[OH]', 'C']), sideKey(['O', '[CH3]'])) == ('pathway', [0])
+    assert index.lookup(*reactionKeys('C[CH2].O=O>>CCO[O]')) == ('step', [2, 4])
+    assert index.lookup(*reactionKeys('CC.[OH]>>CCO')) == ('reactants', [1])
+    assert index.lookup(*reactionKeys('CCC>>CC')) == ('unmatched', [])
+    assert index.lookup('', sideKey(['O'])) == ('unmatched', [])
+
+
+def test_join_counts_ambiguity_by_pathway(tmp_path):
+    dataframe = pandas.DataFrame({
+        'RecordID': [1, 2, 3, 4, 5],
+        'Reactant 1': ['C', '[CH2]C', 'O=O', 'CCC', "['CC']"], 'Reactant 2': ['[OH]', 'O=O', '[H]', '', '[OH]'],
+        'Reactant 3': ['', '', '', '', ''],
+        'Product 1': ['[CH3]', 'CCO[O]', 'O[O]', 'CC', 'CCO'], 'Product 2': ['O', '', '', '', '[None]'],
+        'Product 3': ['', '', '', '', '']})
+    matches, joinStats = joinReactions(dataframe, pathwayIndex(tmp_path))
+    assert joinStats == {'reactions': 5, 'pathway': 1, 'step': 2, 'reactants': 1, 'unmatched': 1, 'ambiguous': 1}
+
+    matchesByRecord = {recordID: recordMatches for recordID, recordMatches in matches.groupby('RecordID')}
+    # the shared step comes from two pathways, that's ambiguous
+    assert matchesByRecord[2]['Pathway ID'].tolist() == [1, 2] and matchesByRecord[2]['Ambiguous'].all()
+    assert matchesByRecord[2]['Step'].tolist() == [1, 1]
+    # the same step twice in one pathway is two candidates but not ambiguous
+    assert matchesByRecord[3][['Match Type', 'Pathway ID', 'Step', 'Candidates']].values.tolist() == [['step', 3, 0, 2], ['step', 3, 1, 2]]
+    assert not matchesByRecord[3]['Ambiguous'].any()
+    # a pathway's overall reaction: one row, step -1
+    assert matchesByRecord[1][['Match Type', 'Pathway ID', 'Step', 'Candidates']].values.tolist() == [['pathway', 0, -1, 1]]
+    # list-wrapped and '[None]' cells are cleaned before the keys are made
+    assert matchesByRecord[5][['Match Type', 'Pathway ID', 'Step']].values.tolist() == [['reactants', 1, 0]]
+    assert matchesByRecord[4][['Match Type', 'Pathway ID', 'Candidates']].values.tolist() == [['unmatched', -1, 0]]
@@ -0,0 +1,148 @@
+import glob
+import os
+import re as regex
+import sys
+
+import pytest
+
+testsDirectory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(testsDirectory), 'Web Scraping', 'Data'))
+from recordParser import extractParams, extractParamsBatch, newColumnNames
+
+fixturePaths = sorted(glob.glob(os.path.join(testsDirectory, 'fixtures', 'record pages', '*.html')))
+
+# ---- the parser as it was before recordParser.py, verbatim apart from its debug prints, the reference to compare against
+baselinePreExpFactorPattern = regex.compile(r'(\d+\.\d+)\s*[Xx]?\s*10\s*<sup>\s*([+-]?\s*\d+)\s*</sup>', regex.IGNORECASE)
+baselineActivEnergyPattern = regex.compile(r'e\s*<sup>\s*([+-]?\d+)\s*\[.*?\]/RT\s*</sup>', regex.IGNORECASE)
+baselineRxnPattern = regex.compile(r'<B>Reaction:</B>(.*?)(?:<BR>|$)', regex.IGNORECASE | regex.DOTALL)
+baselineTemperaturePattern = regex.compile(r'<B>Temperature:</B>\s*(?:&nbsp;)*\s*([0-9]+(?:\.?[0-9]*)?\s*K?)(?:\s*-\s*([0-9]+(?:\.?[0-9]*)?\s*K?))?', regex.IGNORECASE)
+baselineReactionOrderPattern = regex.compile(r'<B>Reaction\s+Order:</B>\s*(?:&nbsp;|\s)*(\d)', regex.IGNORECASE)
+baselineTempRatioExpPattern = regex.compile(r'\(T\s*/298 \s* K\) \s* <sup> (-?\d+)', regex.IGNORECASE)
+
+
+def baselineExtractParams(pageHTMLParam: str):
+    preExpFactorCoeff = ''
+    preExpFactorPower = ''
+    activEnergy = ''
+    temperature = ''
+    reactionOrder = ''
+    tempRatioExp = ''
+    reactants = ['', '', '']
+    reactantsRaw = []
+    products = ['', '', '']
+    productsRaw = []
+    rxnParts = []
+
+    temperatureMatchObj = regex.search(baselineTemperaturePattern, pageHTMLParam)
+    if temperatureMatchObj:
+        temperature = temperatureMatchObj.group(1).strip()
+
+    reactionOrderMatchObj = regex.search(baselineReactionOrderPattern, pageHTMLParam)
+    if reactionOrderMatchObj:
+        reactionOrder = reactionOrderMatchObj.group(1).strip()
+
+    tempRatioExpMatchObj = regex.search(baselineTempRatioExpPattern, pageHTMLParam)
+    if tempRatioExpMatchObj:
+        tempRatioExp = tempRatioExpMatchObj.group(1).strip()
+
+    preExpFactorMatchObj = regex.search(baselinePreExpFactorPattern, pageHTMLParam)
+    if preExpFactorMatchObj:
+        preExpFactorCoeff = preExpFactorMatchObj.group(1).strip()
+        preExpFactorPower = preExpFactorMatchObj.group(2).strip()
+
+    activEnergyMatchObj = regex.search(baselineActivEnergyPattern, pageHTMLParam)
+    if activEnergyMatchObj:
+        activEnergy = activEnergyMatchObj.group(1).strip()
+
+    rxnMatchObj = regex.search(baselineRxnPattern, pageHTMLParam)
+
+    if rxnMatchObj:
+        rxnHTML = rxnMatchObj.group(1).strip()
+        rxnHTML = rxnHTML.replace('&nbsp;', ' ')
+        rxnHTML = rxnHTML.replace('&plus;', '+')
+        rxnHTML = rxnHTML.replace('&plus', '+')
+        rxnHTML = rxnHTML.replace('&middot;', '(.)')
+        rxnHTML = rxnHTML.replace('((.))', '(.)')
+        rxnHTML = rxnHTML.replace('⇒', '->')
+        rxnHTML = rxnHTML.replace('⟶', '->')
+        rxnHTML = rxnHTML.replace('→', '->')
+        rxnHTML = rxnHTML.replace('<sub>', '')
+        rxnHTML = rxnHTML.replace('</sub>', '')
+        rxnHTML = rxnHTML.replace('â‰¡', '≡')
+        rxnHTML = regex.sub(r'<.*?>', '', rxnHTML)
+        rxnHTML = regex.sub(r'\s+', ' ', rxnHTML).strip()
+        rxnParts = rxnHTML.split('->')
+
+        if len(rxnParts) >= 2:
+            reactantsRaw = rxnParts[0].split('+')
+            productsRaw = rxnParts[1].split('+')
+        else:
+            return ('Parse Error',) * 10
+
+        for i in range(3):
+            if len(reactantsRaw) > i:
+                reactants[i] = reactantsRaw[i]
+            if len(productsRaw) > i:
+                products[i] = productsRaw[i]
+
+        reactants = [r.strip() for r in reactants]
+        products = [p.strip() for p in products]
+
+    return preExpFactorCoeff, preExpFactorPower, activEnergy, reactants[0], reactants[1], reactants[2], products[0], products[1], products[2], temperature, reactionOrder, tempRatioExp
+# ----
+
+
+def readFixture(fixturePath: str) -> str:
+    with open(fixturePath, 'r', encoding='utf-8') as fixtureFile:
+        return fixtureFile.read()
+
+
+def assertMatchesBaseline(extractedParams, baselineParams, fixturePath):
+    """
+    Field-for-field against the baseline. Deliberate differences: a parse error fills every field (the baseline
+    returned 10 for 12 columns), 'Temperature Ratio Exponent' also reads '(T/298 K)<sup>n' without the baseline's
+    literal spaces, and the last two fields are new
+    """
+    fixtureName = os.path.basename(fixturePath)
+    assert len(extractedParams) == len(newColumnNames), fixtureName
+    if baselineParams == ('Parse Error',) * 10:
+        assert extractedParams == ('Parse Error',) * len(newColumnNames), fixtureName
+        return
+    for fieldIndex, columnName in enumerate(newColumnNames[:11]):
+        assert extractedParams[fieldIndex] == baselineParams[fieldIndex], f"{fixtureName}: {columnName}"
+    if baselineParams[11]:
+        assert extractedParams[11] == baselineParams[11], f"{fixtureName}: Temperature Ratio Exponent"
+
+
+def test_fixture_corpus_covers_the_edge_cases():
+    baselineResults = [baselineExtractParams(readFixture(fixturePath)) for fixturePath in fixturePaths]
+    assert len(fixturePaths) >= 8
+    assert ('Parse Error',) * 10 in baselineResults # reaction line without an arrow
+    assert any(baselineParams[:3] == ('', '', '') and baselineParams[3] == '' for baselineParams in baselineResults) # error/empty pages
+    assert any(baselineParams[2] == '' and baselineParams[0] for baselineParams in baselineResults) # no exponential term
+    assert any(baselineParams[9] == '' and baselineParams[0] for baselineParams in baselineResults) # no temperature
+
+
+@pytest.mark.parametrize('fixturePath', fixturePaths, ids=os.path.basename)
+def test_extractParams_matches_baseline(fixturePath):
+    pageHTML = readFixture(fixturePath)
+    assertMatchesBaseline(extractParams(pageHTML, verbose=False), baselineExtractParams(pageHTML), fixturePath)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_extractParamsBatch_matches_extractParams(workers):
+    pages = [readFixture(fixturePath) for fixturePath in fixturePaths] * 3
+    batchResults = list(extractParamsBatch(pages, workers=workers, chunkSize=2))
+    assert batchResults == [extractParams(pageHTML, verbose=False) for pageHTML in pages]
+    for fixturePath, pageHTML, extractedParams in zip(fixturePaths, pages, batchResults):
+        assertMatchesBaseline(extractedParams, baselineExtractParams(pageHTML), fixturePath)
+
+
+def test_new_fields_on_a_full_page():
+    fullPage = readFixture(os.path.join(testsDirectory, 'fixtures', 'record pages', 'full_range.html'))
+    extractedParams = dict(zip(newColumnNames, extractParams(fullPage, verbose=False)))
+    assert extractedParams['Temperature'] == '298'
+    assert extractedParams['Temperature Max'] == '1000 K'
+    assert extractedParams['Temperature Ratio Exponent'] == '2'
+    assert extractedParams['Activation Energy Units'] == 'J/mole'
+    assert (extractedParams['Reactant 1'], extractedParams['Reactant 2']) == ('CH4', '(.)OH')
@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Web Scraping', 'Data'))
+
+from recordParser import newColumnNames
+from scrapeJournal import CheckpointJournal
+
+
+def test_completedKeys_refetches_rows_from_before_the_new_columns(tmp_path):
+    journal = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+    oldColumns = [column for column in newColumnNames if column not in ('Temperature Max', 'Activation Energy Units')]
+    journal.append([{'RecordID': 1, **dict.fromkeys(oldColumns, '1.0')},
+                    {'RecordID': 2, **dict.fromkeys(newColumnNames, '1.0')},
+                    {'RecordID': 3, **dict.fromkeys(newColumnNames, 'Url Fetch Error')}])
+    assert journal.completedKeys() == {'1', '2'}
+    assert journal.completedKeys(requiredColumns=newColumnNames) == {'2'}
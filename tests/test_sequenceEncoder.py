@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation'))
+
+from sequenceEncoder import SequenceStore, encodeTable
+
+
+def reactionTable(reactions):
+    # RecordID -> (reactant SMILES, product SMILES)
+    return pandas.DataFrame([{'RecordID': recordID, 'Reactant 1': reactants, 'Reactant 2': '', 'Reactant 3': '',
+                              'Product 1': products, 'Product 2': '', 'Product 3': ''}
+                             for recordID, (reactants, products) in reactions.items()])
+
+
+def decodedRows(storeDirectory):
+    store = SequenceStore(storeDirectory)
+    return {int(recordID): store.decode(row) for row, recordID in enumerate(store.recordIDs)}
+
+
+def test_reencode_reuses_unchanged_rows(tmp_path):
+    storeDirectory = str(tmp_path / 'store')
+    encodeTable(reactionTable({1: ('C.[OH]', '[CH3].O'), 2: ('CC', 'C=C.[H][H]'), 3: ('O=O', '[O].[O]')}), storeDirectory,
+                canonicalize=False, workers=1)
+
+    # 1 dropped, 2 changed, 3 unchanged but moved, 4 new and longer than anything before
+    updatedReactions = {3: ('O=O', '[O].[O]'), 2: ('CCC', 'C=C.C'), 4: ('c1ccccc1Br.[Cl]', 'c1ccccc1Cl.[Br]')}
+    encodeStats = encodeTable(reactionTable(updatedReactions), storeDirectory, canonicalize=False, workers=1)
+    assert (encodeStats['reactions'], encodeStats['encoded'], encodeStats['reused']) == (3, 2, 1)
+
+    freshDirectory = str(tmp_path / 'fresh')
+    encodeTable(reactionTable(updatedReactions), freshDirectory, canonicalize=False, workers=1)
+    assert decodedRows(storeDirectory) == decodedRows(freshDirectory)
+    assert SequenceStore(storeDirectory).recordIDs.tolist() == [3, 2, 4]
+
+    # different settings, nothing reused
+    assert encodeTable(reactionTable(updatedReactions), storeDirectory, canonicalize=False, maxLength=8, workers=1)['reused'] == 0
+
+
+def test_vocabulary_outgrowing_int16(tmp_path):
+    storeDirectory = str(tmp_path / 'store')
+    reactions = {1: ('C.[OH]', '[CH3].O'), 2: ('CC', 'C=C.[H][H]')}
+    encodeTable(reactionTable(reactions), storeDirectory, canonicalize=False, workers=1)
+    smallRows = decodedRows(storeDirectory)
+    assert SequenceStore(storeDirectory).tokens.dtype == np.int16
+
+    # 33000 distinct bracket atoms push the vocabulary past 32768 ids
+    reactions[3] = ('.'.join(f"[C:{mapNumber}]" for mapNumber in range(1, 33001)), 'C')
+    encodeStats = encodeTable(reactionTable(reactions), storeDirectory, canonicalize=False, workers=1)
+    store = SequenceStore(storeDirectory)
+    assert encodeStats['reused'] == 2 and encodeStats['vocabulary'] > 32768
+    assert store.tokens.dtype == np.int32 and store.meta['dtype'] == 'int32'
+    storeRows = decodedRows(storeDirectory)
+    assert {recordID: storeRows[recordID] for recordID in smallRows} == smallRows
+    assert len(storeRows[3]) == 2 * 33000 - 1 + 2 and storeRows[3][-3:] == ['[C:9]', '>>', 'C'] # molecules sorted as text
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation'))
+
+from similarityIndex import SimilarityIndex, bruteForceTopK
+
+bitCount = 64
+
+
+def fingerprints(rowCount, seed=0):
+    # sparse-ish random fingerprints with varied bit counts, a few rows repeated like re-measured reactions
+    generator = np.random.default_rng(seed)
+    bits = generator.random((rowCount, bitCount)) < generator.uniform(0.05, 0.5, (rowCount, 1))
+    bits[rowCount // 2:rowCount // 2 + 10] = bits[:10]
+    bits[-1] = False # an empty fingerprint
+    return np.packbits(bits, axis=1)
+
+
+@pytest.mark.parametrize('prune', [True, False])
+def test_topK_matches_brute_force_leave_one_out(prune):
+    packedRows = fingerprints(300)
+    recordIDs = np.arange(1000, 1300)
+    index = SimilarityIndex(packedRows, recordIDs, bitCount, blockRows=16)
+    k = 5
+    neighbourRows, similarities = index.topK(packedRows, k, excludeRecordIDs=recordIDs, batchSize=32, prune=prune)
+
+    for queryRow in range(len(packedRows)):
+        otherRows = np.delete(packedRows, queryRow, axis=0)
+        expected = bruteForceTopK(otherRows, packedRows[queryRow:queryRow + 1], k)[0]
+        np.testing.assert_allclose(similarities[queryRow], expected, atol=1e-6)
+        assert queryRow not in neighbourRows[queryRow]
+    # a repeated fingerprint finds its twin under another RecordID
+    assert neighbourRows[0, 0] == 150 and similarities[0, 0] == 1.0
+
+
+def test_topK_reports_the_neighbours_real_similarity():
+    packedRows = fingerprints(120, seed=1)
+    index = SimilarityIndex(packedRows, np.arange(120), bitCount, blockRows=8)
+    neighbourRows, similarities = index.topK(packedRows[:20], 4, workers=2)
+    for queryRow in range(20):
+        for row, similarity in zip(neighbourRows[queryRow], similarities[queryRow]):
+            reference = bruteForceTopK(packedRows[row:row + 1], packedRows[queryRow:queryRow + 1], 1)[0, 0]
+            assert similarity == pytest.approx(reference, abs=1e-6)
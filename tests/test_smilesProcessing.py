@@ -0,0 +1,105 @@
+import importlib.util
+import os
+import sys
+
+import pandas
+import pytest
+
+cleaningDirectory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation')
+sys.path.insert(0, cleaningDirectory)
+
+# the script's file name has a space in it, so it's loaded by path
+moduleSpec = importlib.util.spec_from_file_location('smilesProcessing', os.path.join(cleaningDirectory, 'Data', 'SMILES Processing.py'))
+smilesProcessing = importlib.util.module_from_spec(moduleSpec)
+moduleSpec.loader.exec_module(smilesProcessing)
+
+
+def test_processReagents_with_an_all_empty_reagent_column(tmp_path):
+    # read_csv makes an all-empty column float64, the link building used to raise on it
+    tablePath = str(tmp_path / 'filtered.csv')
+    pandas.DataFrame({'RecordID': [1, 2], 'Reactant 1': ['CH4', 'OH'], 'Reactant 2': ['OH', ''], 'Reactant 3': ['', ''],
+                      'Product 1': ['CH3', 'H2O'], 'Product 2': ['H2O', ''], 'Product 3': ['', '']}).to_csv(tablePath, index=False)
+    rawDataframe = pandas.read_csv(tablePath)
+    assert rawDataframe['Product 3'].dtype == float
+
+    routedTables = smilesProcessing.processReagents(rawDataframe, cachePath=str(tmp_path / 'cache.sqlite'))
+    assert routedTables['cactus'].index.tolist() == [0, 1]
+    assert routedTables['cactus'].loc[0, 'Reactant 1'] == 'https://cactus.nci.nih.gov/chemical/structure/CH4/smiles'
+    assert routedTables['pubchem'].loc[1, 'Product 1'] == 'https://pubchem.ncbi.nlm.nih.gov/compound/H2O'
+    assert routedTables['cactus']['Product 3'].isna().all()
+
+
+def test_struct2SMILES_on_a_float_column():
+    cactusLinks, pubchemLinks = smilesProcessing.struct2SMILES(pandas.Series([], dtype=float))
+    assert len(cactusLinks) == len(pubchemLinks) == 0
+
+
+class FakeOpsin:
+    # parses names ending in 'ane'/'ol', anything else is left for cirpy
+    def to_smiles_single(self, name):
+        return f"opsin:{name}" if name.endswith(('ane', 'ol')) else None
+
+
+class FakeCirpy:
+    # knows names ending in 'ene', throws on 'offline' like a dropped connection
+    @staticmethod
+    def resolve(name, representation):
+        if name == 'offline':
+            raise ConnectionError('no network')
+        return f"cirpy:{name}" if name.endswith('ene') else None
+
+
+@pytest.fixture
+def fakeResolvers(monkeypatch):
+    # both paths resolve in this process, spawned opsin workers wouldn't see the fake
+    import backends
+    import opsinBatch
+    monkeypatch.setitem(backends.backendInstances, 'opsin', FakeOpsin())
+    monkeypatch.setitem(backends.backendInstances, 'cirpy', FakeCirpy())
+    monkeypatch.setattr(smilesProcessing, 'opsinPool', lambda: None)
+    monkeypatch.setattr(smilesProcessing, 'opsinBatchResolve',
+                        lambda reagentNames, executor=None: opsinBatch.opsinBatchResolve(reagentNames, workers=1))
+
+
+def routeBothWays(tmp_path, rawDataframe, chunkRows):
+    # processReagents on the whole file vs processReagentsStreaming chunkRows at a time, every output read back as text
+    inputPath = str(tmp_path / 'filtered.csv')
+    rawDataframe.to_csv(inputPath, index=False)
+    wholeTables = smilesProcessing.processReagents(pandas.read_csv(inputPath, dtype=str), cachePath=str(tmp_path / 'whole.sqlite'))
+    streamedPaths = {outputName: str(tmp_path / f"streamed {outputName}.csv") for outputName in smilesProcessing.outputPaths}
+    streamStats = smilesProcessing.processReagentsStreaming(inputPath, streamedPaths, chunkRows, str(tmp_path / 'streamed.sqlite'))
+
+    for outputName, streamedPath in streamedPaths.items():
+        wholePath = str(tmp_path / f"whole {outputName}.csv")
+        wholeTables[outputName].to_csv(wholePath, index=False)
+        pandas.testing.assert_frame_equal(pandas.read_csv(streamedPath, dtype=str), pandas.read_csv(wholePath, dtype=str))
+        assert streamStats[f"{outputName} rows"] == len(wholeTables[outputName])
+    return wholeTables, streamStats
+
+
+def test_streaming_routes_like_processReagents(tmp_path, fakeResolvers):
+    rawDataframe = pandas.DataFrame({
+        'RecordID': range(1, 8),
+        'Reactant 1': ['methane', 'CH4', 'ethanol', 'benzene', 'offline', 'OH', 'propane'],
+        'Reactant 2': ['OH', 'hydroxyl', '', 'methane', 'H', '', 'ethene'],
+        'Reactant 3': ['', '', '', '', '', 'O2', ''],
+        'Product 1': ['CH3', 'methanol', 'ethanol', 'xyzzy', 'propane', 'HO2', 'butane'],
+        'Product 2': ['H2O', '', '', '', '', '', ''],
+        'Product 3': ['', '', '', '', '', '', ''],
+        'Temperature Min': ['300', '298.0', '', '1.0e3', '400', '250', '300']})
+    wholeTables, streamStats = routeBothWays(tmp_path, rawDataframe, chunkRows=2)
+    assert streamStats['chunks'] == 4 and streamStats['input rows'] == 7
+    # every route got rows, so the comparison covered each one
+    assert all(len(routedTable) for routedTable in wholeTables.values())
+
+
+def test_streaming_with_an_empty_output(tmp_path, fakeResolvers):
+    # no structural formulas anywhere, cactus and pubchem get no rows from any chunk
+    rawDataframe = pandas.DataFrame({
+        'RecordID': [1, 2, 3], 'Reactant 1': ['methane', 'ethanol', 'propane'], 'Reactant 2': ['', 'benzene', ''],
+        'Reactant 3': ['', '', ''], 'Product 1': ['methanol', 'propane', 'xyzzy'], 'Product 2': ['', '', ''],
+        'Product 3': ['', '', '']})
+    wholeTables, streamStats = routeBothWays(tmp_path, rawDataframe, chunkRows=1)
+    assert streamStats['chunks'] == 3
+    assert streamStats['cactus rows'] == streamStats['pubchem rows'] == 0
+    assert list(pandas.read_csv(str(tmp_path / 'streamed cactus.csv')).columns) == list(rawDataframe.columns)
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation'))
+
+from speciesRegistry import ReactionTable, SpeciesRegistry, identitySmilesLookup
+
+reagentRows = [
+    # the same reaction with its reagents shuffled across the slots, then reversed, then with OH twice
+    ('C', '[OH]', '', '[CH3]', 'O', ''),
+    ('[OH]', '', 'C', '', 'O', '[CH3]'),
+    ('', 'C', '[OH]', 'O', '[CH3]', ''),
+    ('[CH3]', 'O', '', 'C', '[OH]', ''),
+    ('C', '[OH]', '[OH]', '[CH3]', 'O', ''),
+]
+
+
+def reactionTable(rows, registry=None):
+    dataframe = pandas.DataFrame(rows, columns=['Reactant 1', 'Reactant 2', 'Reactant 3', 'Product 1', 'Product 2', 'Product 3'])
+    dataframe.insert(0, 'RecordID', range(1, len(rows) + 1))
+    return ReactionTable.fromDataframe(dataframe, registry or SpeciesRegistry(), identitySmilesLookup)
+
+
+def test_reaction_hash_ignores_reagent_order():
+    hashes = reactionTable(reagentRows).hashes
+    assert hashes[0] == hashes[1] == hashes[2]
+    assert hashes[3] != hashes[0] # products and reactants swapped is another reaction
+    assert hashes[4] != hashes[0] # a second OH counts
+
+
+def test_reaction_hash_ignores_registry_ids():
+    # a registry that interned other species first hands out different IDs, the hashes stay the same
+    registry = SpeciesRegistry()
+    registry.internMany(['O', 'CC', '[CH3]'], identitySmilesLookup)
+    shuffledTable = reactionTable(reagentRows, registry)
+    freshTable = reactionTable(reagentRows)
+    assert (shuffledTable.reactantIDs != freshTable.reactantIDs).any()
+    assert (shuffledTable.hashes == freshTable.hashes).all()
+
+
+def test_reaction_hash_after_a_save_and_load(tmp_path):
+    registry = SpeciesRegistry()
+    firstHashes = reactionTable(reagentRows, registry).hashes
+    registry.save(str(tmp_path / 'registry.json'))
+    reloadedHashes = reactionTable(reagentRows[::-1], SpeciesRegistry.load(str(tmp_path / 'registry.json'))).hashes
+    assert (reloadedHashes[::-1] == firstHashes).all()
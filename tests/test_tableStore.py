@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pandas
+import pytest
+
+cleaningDirectory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data Cleaning & Transformation')
+sys.path.insert(0, cleaningDirectory)
+sys.path.insert(0, os.path.join(cleaningDirectory, 'Tiny Single Use Scripts'))
+from tableStore import readTable, writeTable
+from filtering import filterExtracted
+
+pytest.importorskip('pyarrow')
+
+
+def scrapedFrame() -> pandas.DataFrame:
+    # the way the scraper leaves it: every cell text, '' for fields a page didn't have, markers for failed pages
+    return pandas.DataFrame({
+        'RecordID': ['1', '2', '3', '4'],
+        'Reactant 1': ['methane', 'OH', 'O2', 'H'],
+        'Product 1': ['CH3', '', 'O', 'H2'],
+        'Pre-Exp Factor Coeff': ['1.5', '2.0', '', 'Parse Error'],
+        'Pre-Exp Factor Power': ['- 13', '-12', '', 'Parse Error'],
+        'Activation Energy': ['-1000', '', '', 'Parse Error'],
+    })
+
+
+@pytest.mark.parametrize('suffix', ['.parquet', '.arrow'])
+def test_columnar_round_trip_reads_back_like_csv(tmp_path, suffix):
+    csvPath, columnarPath = str(tmp_path / 'extracted.csv'), str(tmp_path / f'extracted{suffix}')
+    writeTable(scrapedFrame(), csvPath)
+    writeTable(scrapedFrame(), columnarPath)
+    fromCsv, fromColumnar = readTable(csvPath), readTable(columnarPath)
+
+    for columnName in fromCsv.columns:
+        assert fromCsv[columnName].isna().tolist() == fromColumnar[columnName].isna().tolist(), columnName
+    assert fromColumnar['Pre-Exp Factor Coeff'].tolist()[3] == 'Parse Error' # markers stay, never coerced to NaN
+    assert filterExtracted(fromCsv).index.tolist() == filterExtracted(fromColumnar).index.tolist() == [0, 3]